@@ -0,0 +1,147 @@
+"""
+Календарь дат, доступных для записи на обслуживание
+"""
+import datetime
+import threading
+from telegram import InlineKeyboardButton
+from config import BOOKING_WORKDAYS, BOOKING_HOLIDAYS
+from data_store import data_store
+from models import VISIT_DATE_FORMAT
+
+DAY_NAMES = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
+DAY_FULL_NAMES = ["понедельник", "вторник", "среда", "четверг", "пятница", "суббота", "воскресенье"]
+
+class BookingCalendar:
+    """
+    Окно дат для записи, вычисляемое один раз в день
+
+    Запись открыта со следующего понедельника на horizon_days дней вперед,
+    только по рабочим дням недели и кроме праздников. Список дат зависит
+    только от текущей даты, поэтому он кэшируется до полуночи.
+    """
+
+    def __init__(self, workdays=(2, 3, 4), holidays=(), horizon_days=60, max_dates=18, dates_per_row=3):
+        """
+        Инициализация календаря
+
+        Args:
+            workdays: дни недели для записи (1 - понедельник, ..., 7 - воскресенье)
+            holidays: нерабочие даты (datetime.date)
+            horizon_days: на сколько дней вперед открыта запись
+            max_dates: максимальное количество дат на клавиатуре
+            dates_per_row: количество дат в одном ряду клавиатуры
+        """
+        self.workdays = frozenset(day - 1 for day in workdays)
+        self.holidays = frozenset(holidays)
+        self.horizon_days = horizon_days
+        self.max_dates = max_dates
+        self.dates_per_row = dates_per_row
+        self._lock = threading.Lock()
+        self._cached_for = None
+        self._dates = ()
+
+    def available_dates(self, today=None):
+        """
+        Получение дат, доступных для записи
+
+        Args:
+            today: текущая дата (по умолчанию - сегодня)
+
+        Returns:
+            tuple: даты (datetime.date) в порядке возрастания
+        """
+        today = today or datetime.date.today()
+        with self._lock:
+            if self._cached_for != today:
+                self._dates = self._compute_dates(today)
+                self._cached_for = today
+            return self._dates
+
+    def _compute_dates(self, today):
+        # Находим дату начала следующей недели (понедельник)
+        days_until_next_monday = 7 - today.weekday() if today.weekday() > 0 else 7
+        next_monday = today + datetime.timedelta(days=days_until_next_monday)
+
+        dates = []
+        for i in range(self.horizon_days):
+            date = next_monday + datetime.timedelta(days=i)
+            if date.weekday() in self.workdays and date not in self.holidays:
+                dates.append(date)
+                if len(dates) == self.max_dates:
+                    break
+        return tuple(dates)
+
+    def is_bookable(self, date, today=None):
+        """
+        Проверка, что на дату можно записаться
+
+        Args:
+            date: дата (datetime.date)
+            today: текущая дата (по умолчанию - сегодня)
+        """
+        return date in self.available_dates(today)
+
+    def full_dates(self, today=None):
+        """
+        Получение дат окна записи, на которые не осталось мест
+
+        Args:
+            today: текущая дата (по умолчанию - сегодня)
+
+        Returns:
+            frozenset: даты (datetime.date)
+        """
+        availability = data_store.get_date_availability(self.available_dates(today))
+        return frozenset(
+            date for date, (booked, capacity) in availability.items()
+            if capacity and booked >= capacity
+        )
+
+    def is_full(self, date):
+        """
+        Проверка, что на дату (datetime.date) не осталось мест
+        """
+        booked, capacity = data_store.get_date_availability([date])[date]
+        return bool(capacity) and booked >= capacity
+
+    def workdays_label(self):
+        """Описание дней записи для текста сообщения, например "вторник-четверг" """
+        days = sorted(self.workdays)
+        if len(days) > 2 and days == list(range(days[0], days[-1] + 1)):
+            return f"{DAY_FULL_NAMES[days[0]]}-{DAY_FULL_NAMES[days[-1]]}"
+        return ", ".join(DAY_FULL_NAMES[day] for day in days)
+
+    def create_buttons(self):
+        """
+        Создание кнопок выбора даты для клавиатуры
+
+        Returns:
+            list: ряды кнопок
+        """
+        buttons = []
+        date_buttons = []
+        full_dates = self.full_dates()
+
+        for date in self.available_dates():
+            button_text = f"{date.strftime('%d.%m')} ({DAY_NAMES[date.weekday()]})"
+            # Занятые даты остаются на своих местах, чтобы клавиатура не "прыгала"
+            if date in full_dates:
+                button_text = f"❌ {button_text}"
+            date_buttons.append(
+                InlineKeyboardButton(button_text, callback_data=f"date_{date.strftime(VISIT_DATE_FORMAT)}")
+            )
+
+            if len(date_buttons) == self.dates_per_row:
+                buttons.append(date_buttons)
+                date_buttons = []
+
+        # Добавляем оставшиеся даты
+        if date_buttons:
+            buttons.append(date_buttons)
+
+        # Добавляем кнопку "Назад"
+        buttons.append([InlineKeyboardButton("🔙 Назад", callback_data="main_menu")])
+        return buttons
+
+# Глобальный календарь записи
+booking_calendar = BookingCalendar(workdays=BOOKING_WORKDAYS, holidays=BOOKING_HOLIDAYS)
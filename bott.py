@@ -1,30 +1,112 @@
+import hashlib
 import logging
 import threading
 from telegram.ext import Updater
-from config import TELEGRAM_TOKEN
+from config import (
+    TELEGRAM_TOKEN, BOT_WORKERS, BOT_MODE, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH,
+    WEBHOOK_URL, WEBHOOK_CERT, WEBHOOK_KEY, PERSISTENCE_FILE, PERSISTENCE_FLUSH_INTERVAL
+)
 from telegram_handlers import register_handlers
 from database import init_db
+from notifications import notifier
+from persistence import create_persistence, schedule_flush
 
 # Глобальная переменная для отслеживания экземпляра бота
 _bot_instance = None
 _bot_lock = threading.Lock()
 
-def setup_bot():
-    """Setup and return the telegram bot updater"""
+def setup_bot(bot=None, workers=None, persistence_file=None):
+    """
+    Setup and return the telegram bot updater
     
-    if not TELEGRAM_TOKEN:
+    Args:
+        bot: готовый экземпляр telegram.Bot (например, для локального стенда
+             webhook_replay.py); по умолчанию бот создается по TELEGRAM_TOKEN
+        workers: количество потоков для обработчиков с run_async (по умолчанию BOT_WORKERS)
+        persistence_file: файл состояния диалогов (по умолчанию PERSISTENCE_FILE,
+                          пустая строка - состояние не сохраняется)
+    """
+    
+    if bot is None and not TELEGRAM_TOKEN:
         logging.error("Telegram token is missing. Please set the TELEGRAM_BOT_TOKEN environment variable.")
         return None
     
-    updater = Updater(token=TELEGRAM_TOKEN, use_context=True)
+    if workers is None:
+        workers = BOT_WORKERS
+    
+    if persistence_file is None:
+        persistence_file = PERSISTENCE_FILE
+    persistence = create_persistence(persistence_file)
+    
+    if bot is not None:
+        updater = Updater(bot=bot, workers=workers, persistence=persistence, use_context=True)
+    else:
+        updater = Updater(token=TELEGRAM_TOKEN, workers=workers, persistence=persistence, use_context=True)
     dispatcher = updater.dispatcher
     
+    # Состояние пишется на диск раз в PERSISTENCE_FLUSH_INTERVAL секунд и при остановке,
+    # а не после каждого обновления
+    if persistence is not None:
+        schedule_flush(updater.job_queue, persistence, PERSISTENCE_FLUSH_INTERVAL)
+        logging.info(f"Состояние диалогов сохраняется в {persistence_file}")
+    
     # Register all handlers
     register_handlers(dispatcher)
     
-    logging.info("Bot is set up and handlers are registered")
+    logging.info(f"Bot is set up and handlers are registered ({workers} workers)")
     return updater
 
+def get_webhook_path():
+    """
+    Получение секретного пути webhook
+    
+    Если WEBHOOK_PATH не задан, путь выводится из токена бота, чтобы адрес
+    нельзя было угадать, а сам токен не попадал в журналы прокси.
+    
+    Returns:
+        str: путь без начального "/"
+    """
+    if WEBHOOK_PATH:
+        return WEBHOOK_PATH
+    return hashlib.sha256(TELEGRAM_TOKEN.encode()).hexdigest()[:32]
+
+def start_receiving_updates(updater):
+    """
+    Запуск получения обновлений в режиме, заданном BOT_MODE
+    
+    В режиме webhook поднимается встроенный HTTP-сервер и у Telegram
+    регистрируется webhook (setWebhook). В режиме polling ранее установленный
+    webhook снимается (deleteWebhook), иначе getUpdates вернет ошибку. Без
+    WEBHOOK_URL webhook зарегистрировать негде, поэтому бот работает в режиме polling.
+    
+    Args:
+        updater: экземпляр Updater
+        
+    Returns:
+        str: фактический режим работы ("polling" или "webhook")
+    """
+    if BOT_MODE == "webhook":
+        if not WEBHOOK_URL:
+            logging.error("BOT_MODE=webhook, но WEBHOOK_URL не задан. Бот будет запущен в режиме polling.")
+        else:
+            url_path = get_webhook_path()
+            updater.start_webhook(
+                listen=WEBHOOK_LISTEN,
+                port=WEBHOOK_PORT,
+                url_path=url_path,
+                cert=WEBHOOK_CERT,
+                key=WEBHOOK_KEY,
+                webhook_url=f"{WEBHOOK_URL}/{url_path}",
+                bootstrap_retries=3
+            )
+            logging.info(f"Bot started in webhook mode on {WEBHOOK_LISTEN}:{WEBHOOK_PORT} ({WEBHOOK_URL})")
+            return "webhook"
+    
+    # start_polling сам вызывает deleteWebhook перед первым запросом getUpdates
+    updater.start_polling(bootstrap_retries=3)
+    logging.info("Bot started in polling mode")
+    return "polling"
+
 def start_bot():
     """Start the Telegram bot, обеспечивая, что только один экземпляр запущен"""
     global _bot_instance
@@ -42,9 +124,11 @@ def start_bot():
             logging.error("Failed to set up bot updater")
             return None
         
-        # Запускаем бота в режиме polling
-        updater.start_polling()
-        logging.info("Bot started in polling mode")
+        # Запускаем потоки отправки уведомлений
+        notifier.start()
+        
+        # Запускаем получение обновлений (polling или webhook)
+        start_receiving_updates(updater)
         
         # Сохраняем экземпляр бота
         _bot_instance = updater
@@ -59,6 +143,11 @@ def stop_bot():
         if _bot_instance is not None:
             logging.info("Stopping bot...")
             _bot_instance.stop()
+            # Updater.stop не сохраняет состояние диалогов сам
+            if _bot_instance.persistence is not None:
+                _bot_instance.persistence.flush()
+            # Дожидаемся отправки уведомлений, поставленных обработчиками
+            notifier.stop()
             _bot_instance = None
             logging.info("Bot stopped successfully")
         else:
@@ -0,0 +1,122 @@
+"""
+Потокобезопасный LRU-кэш с ограничением времени жизни записей
+"""
+import threading
+import time
+from collections import OrderedDict
+
+class LRUCache:
+    """
+    LRU-кэш с ограничением размера и времени жизни записей
+
+    Используется несколькими потоками диспетчера одновременно, поэтому все
+    операции выполняются под блокировкой. Чтобы поток, прочитавший данные из
+    базы до их изменения, не положил в кэш устаревшее значение после
+    инвалидации, заполнение выполняется с номером поколения, полученным до
+    чтения (см. generation и set).
+    """
+
+    def __init__(self, maxsize=1024, ttl=300.0):
+        """
+        Инициализация кэша
+
+        Args:
+            maxsize: максимальное количество записей (0 - кэш выключен)
+            ttl: время жизни записи в секундах (0 или None - без ограничения)
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def generation(self):
+        """Текущий номер поколения; увеличивается при каждой инвалидации"""
+        return self._generation
+
+    def get(self, key):
+        """
+        Получение значения из кэша
+
+        Args:
+            key: ключ записи
+
+        Returns:
+            значение или None, если записи нет или она устарела
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, generation=None):
+        """
+        Сохранение значения в кэше
+
+        Args:
+            key: ключ записи
+            value: значение
+            generation: номер поколения, полученный до чтения значения из источника;
+                        если с тех пор была инвалидация, значение не сохраняется
+
+        Returns:
+            bool: True, если значение сохранено
+        """
+        if self.maxsize <= 0:
+            return False
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return False
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+            return True
+
+    def invalidate(self, key):
+        """
+        Удаление записи из кэша
+
+        Args:
+            key: ключ записи
+        """
+        with self._lock:
+            self._generation += 1
+            self._data.pop(key, None)
+
+    def clear(self):
+        """Очистка кэша"""
+        with self._lock:
+            self._generation += 1
+            self._data.clear()
+
+    def stats(self):
+        """
+        Получение счетчиков кэша
+
+        Returns:
+            dict: размер, попадания, промахи и вытеснения
+        """
+        with self._lock:
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
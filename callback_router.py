@@ -0,0 +1,79 @@
+"""
+Маршрутизация нажатий inline-кнопок по callback_data
+
+Вместо цепочки CallbackQueryHandler с регулярными выражениями, которые
+ConversationHandler проверяет по очереди, каждое состояние диалога получает
+один CallbackRouter. Обработчик находится по точному совпадению callback_data
+или по самому длинному совпавшему префиксу за несколько обращений к словарю,
+независимо от количества кнопок в состоянии.
+"""
+from collections import namedtuple
+from telegram import Update
+from telegram.ext import Handler
+
+# Обработчик маршрута и признак выполнения в пуле потоков диспетчера (run_async)
+Route = namedtuple('Route', ['callback', 'run_async'])
+
+class CallbackRouter(Handler):
+    """
+    Обработчик callback-запросов с таблицей маршрутов
+
+    Ключ маршрута "main_menu" совпадает только с callback_data "main_menu",
+    ключ "approve_*" - с любыми данными, начинающимися с "approve_". Точное
+    совпадение проверяется первым, из префиксов выбирается самый длинный.
+    """
+    __slots__ = ('_exact', '_prefixes', '_prefix_lengths')
+
+    def __init__(self, routes):
+        """
+        Инициализация
+
+        Args:
+            routes: словарь {ключ: обработчик}, где обработчик - функция
+                    (update, context) или Route для выполнения в пуле потоков
+        """
+        super().__init__(self._unrouted)
+        self._exact = {}
+        self._prefixes = {}
+        for key, route in routes.items():
+            if not isinstance(route, Route):
+                route = Route(route, False)
+            if key.endswith('*'):
+                self._prefixes[key[:-1]] = route
+            else:
+                self._exact[key] = route
+        # Длины префиксов по убыванию, чтобы более длинный префикс имел приоритет
+        self._prefix_lengths = sorted({len(prefix) for prefix in self._prefixes}, reverse=True)
+
+    @staticmethod
+    def _unrouted(update, context):
+        """Не вызывается: check_update пропускает обновления без маршрута"""
+
+    def match(self, data):
+        """
+        Поиск маршрута для callback_data
+
+        Returns:
+            Route или None
+        """
+        route = self._exact.get(data)
+        if route is not None:
+            return route
+        for length in self._prefix_lengths:
+            route = self._prefixes.get(data[:length])
+            if route is not None:
+                return route
+        return None
+
+    def check_update(self, update):
+        if isinstance(update, Update) and update.callback_query:
+            data = update.callback_query.data
+            if data:
+                return self.match(data)
+        return None
+
+    def handle_update(self, update, dispatcher, check_result, context=None):
+        callback, run_async = check_result
+        if run_async:
+            return dispatcher.run_async(callback, update, context, update=update)
+        return callback(update, context)
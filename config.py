@@ -1,5 +1,6 @@
 import os
 import logging
+import datetime
 from dotenv import load_dotenv
 
 # Load environment variables from .env file if it exists
@@ -33,3 +34,177 @@ if mileage_admin_id_str:
         MILEAGE_ADMIN_ID = int(mileage_admin_id_str)
     except ValueError:
         logging.error("Invalid MILEAGE_ADMIN_ID format. Expected integer.")
+
+# Количество заявок на одной странице списков в админ-панели
+# (Telegram ограничивает размер inline-клавиатуры, поэтому длинные списки разбиваются на страницы)
+ADMIN_PAGE_SIZE = 20
+admin_page_size_str = os.environ.get("ADMIN_PAGE_SIZE", "")
+if admin_page_size_str:
+    try:
+        ADMIN_PAGE_SIZE = max(1, int(admin_page_size_str))
+    except ValueError:
+        logging.error("Invalid ADMIN_PAGE_SIZE format. Expected integer.")
+
+# Кэш пользователей в памяти: максимальное количество записей и время жизни в секундах
+USER_CACHE_SIZE = 10000
+USER_CACHE_TTL = 300.0
+try:
+    USER_CACHE_SIZE = int(os.environ.get("USER_CACHE_SIZE", USER_CACHE_SIZE))
+    USER_CACHE_TTL = float(os.environ.get("USER_CACHE_TTL", USER_CACHE_TTL))
+except ValueError:
+    logging.error("Invalid USER_CACHE_SIZE or USER_CACHE_TTL format. Expected numbers.")
+
+# Очередь уведомлений: количество потоков отправки, общий лимит сообщений в секунду
+# и минимальный интервал между сообщениями в один чат (ограничения Telegram)
+NOTIFY_WORKERS = 2
+NOTIFY_GLOBAL_RATE = 30.0
+NOTIFY_CHAT_INTERVAL = 1.0
+try:
+    NOTIFY_WORKERS = max(1, int(os.environ.get("NOTIFY_WORKERS", NOTIFY_WORKERS)))
+    NOTIFY_GLOBAL_RATE = float(os.environ.get("NOTIFY_GLOBAL_RATE", NOTIFY_GLOBAL_RATE))
+    NOTIFY_CHAT_INTERVAL = float(os.environ.get("NOTIFY_CHAT_INTERVAL", NOTIFY_CHAT_INTERVAL))
+except ValueError:
+    logging.error("Invalid NOTIFY_* format. Expected numbers.")
+
+# Режим получения обновлений: polling (по умолчанию) или webhook
+BOT_MODE = os.environ.get("BOT_MODE", "polling").strip().lower()
+if BOT_MODE not in ("polling", "webhook"):
+    logging.error(f"Invalid BOT_MODE '{BOT_MODE}'. Expected 'polling' or 'webhook', using polling.")
+    BOT_MODE = "polling"
+
+# Настройки webhook: адрес и порт встроенного HTTP-сервера, секретный путь,
+# внешний адрес, по которому Telegram отправляет обновления, и TLS-сертификат
+# (нужен только если сервер принимает HTTPS сам, без обратного прокси)
+WEBHOOK_LISTEN = os.environ.get("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = 8443
+try:
+    WEBHOOK_PORT = int(os.environ.get("WEBHOOK_PORT", WEBHOOK_PORT))
+except ValueError:
+    logging.error("Invalid WEBHOOK_PORT format. Expected a number.")
+WEBHOOK_PATH = os.environ.get("WEBHOOK_PATH", "").strip("/")
+WEBHOOK_URL = os.environ.get("WEBHOOK_URL", "").rstrip("/")
+WEBHOOK_CERT = os.environ.get("WEBHOOK_CERT") or None
+WEBHOOK_KEY = os.environ.get("WEBHOOK_KEY") or None
+
+# Количество потоков диспетчера для обработчиков с run_async и включение
+# асинхронного выполнения тяжелых обработчиков (подтверждение заявки, списки
+# заявок администратора, сохранение комментария)
+BOT_WORKERS = 4
+try:
+    BOT_WORKERS = max(1, int(os.environ.get("BOT_WORKERS", BOT_WORKERS)))
+except ValueError:
+    logging.error("Invalid BOT_WORKERS format. Expected a number.")
+RUN_ASYNC_HANDLERS = os.environ.get("RUN_ASYNC_HANDLERS", "1").strip().lower() not in ("0", "false", "no", "off")
+
+# Календарь записи: дни недели для визитов (1 - понедельник, ..., 7 - воскресенье)
+# и нерабочие даты в формате ДД.ММ.ГГГГ через запятую
+BOOKING_WORKDAYS = [2, 3, 4]
+booking_workdays_str = os.environ.get("BOOKING_WORKDAYS", "")
+if booking_workdays_str:
+    try:
+        workdays = sorted({int(day) for day in booking_workdays_str.split(",") if day.strip()})
+        if not workdays or not all(1 <= day <= 7 for day in workdays):
+            raise ValueError(booking_workdays_str)
+        BOOKING_WORKDAYS = workdays
+    except ValueError:
+        logging.error("Invalid BOOKING_WORKDAYS format. Expected comma-separated numbers from 1 to 7.")
+
+BOOKING_HOLIDAYS = set()
+for holiday_str in os.environ.get("BOOKING_HOLIDAYS", "").split(","):
+    if holiday_str.strip():
+        try:
+            BOOKING_HOLIDAYS.add(datetime.datetime.strptime(holiday_str.strip(), "%d.%m.%Y").date())
+        except ValueError:
+            logging.error(f"Invalid BOOKING_HOLIDAYS date '{holiday_str.strip()}'. Expected DD.MM.YYYY.")
+
+# Количество мест для записи на один день по умолчанию (0 - без ограничения);
+# для отдельных дат администратор может изменить его командой /capacity
+BOOKING_DAY_CAPACITY = 0
+try:
+    BOOKING_DAY_CAPACITY = max(0, int(os.environ.get("BOOKING_DAY_CAPACITY", BOOKING_DAY_CAPACITY)))
+except ValueError:
+    logging.error("Invalid BOOKING_DAY_CAPACITY format. Expected a number.")
+
+# Сохранение состояния диалогов и user_data между перезапусками: файл состояния
+# (пустая строка - не сохранять) и интервал записи в секундах
+PERSISTENCE_FILE = os.environ.get("PERSISTENCE_FILE", "bot_state.pickle")
+PERSISTENCE_FLUSH_INTERVAL = 30.0
+try:
+    PERSISTENCE_FLUSH_INTERVAL = max(1.0, float(os.environ.get("PERSISTENCE_FLUSH_INTERVAL", PERSISTENCE_FLUSH_INTERVAL)))
+except ValueError:
+    logging.error("Invalid PERSISTENCE_FLUSH_INTERVAL format. Expected a number.")
+
+# Брошенные диалоги: через сколько секунд бездействия диалог завершается и данные
+# формы удаляются, через сколько секунд удаляется весь user_data пользователя
+# (0 - никогда) и как часто выполняется очистка
+CONVERSATION_TIMEOUT = 3600.0
+USER_DATA_TTL = 86400.0
+HOUSEKEEPING_INTERVAL = 60.0
+try:
+    CONVERSATION_TIMEOUT = max(0.0, float(os.environ.get("CONVERSATION_TIMEOUT", CONVERSATION_TIMEOUT)))
+    USER_DATA_TTL = max(0.0, float(os.environ.get("USER_DATA_TTL", USER_DATA_TTL)))
+    HOUSEKEEPING_INTERVAL = max(1.0, float(os.environ.get("HOUSEKEEPING_INTERVAL", HOUSEKEEPING_INTERVAL)))
+except ValueError:
+    logging.error("Invalid CONVERSATION_TIMEOUT, USER_DATA_TTL or HOUSEKEEPING_INTERVAL format. Expected numbers.")
+
+# Защита от флуда: режим при превышении частоты (notify - попросить подождать,
+# drop - молча отбросить, off - не ограничивать), скорость пополнения корзины
+# (обновлений в секунду) и емкость корзины для пользователя и для чата
+RATE_LIMIT_MODE = os.environ.get("RATE_LIMIT_MODE", "notify").strip().lower()
+if RATE_LIMIT_MODE not in ("notify", "drop", "off"):
+    logging.error(f"Invalid RATE_LIMIT_MODE '{RATE_LIMIT_MODE}'. Expected 'notify', 'drop' or 'off', using notify.")
+    RATE_LIMIT_MODE = "notify"
+RATE_LIMIT_USER_RATE = 1.0
+RATE_LIMIT_USER_BURST = 5.0
+RATE_LIMIT_CHAT_RATE = 3.0
+RATE_LIMIT_CHAT_BURST = 15.0
+try:
+    RATE_LIMIT_USER_RATE = max(0.01, float(os.environ.get("RATE_LIMIT_USER_RATE", RATE_LIMIT_USER_RATE)))
+    RATE_LIMIT_USER_BURST = max(1.0, float(os.environ.get("RATE_LIMIT_USER_BURST", RATE_LIMIT_USER_BURST)))
+    RATE_LIMIT_CHAT_RATE = max(0.01, float(os.environ.get("RATE_LIMIT_CHAT_RATE", RATE_LIMIT_CHAT_RATE)))
+    RATE_LIMIT_CHAT_BURST = max(1.0, float(os.environ.get("RATE_LIMIT_CHAT_BURST", RATE_LIMIT_CHAT_BURST)))
+except ValueError:
+    logging.error("Invalid RATE_LIMIT_* format. Expected numbers.")
+
+# Настройки SQLite для одновременной работы нескольких потоков диспетчера.
+# WAL позволяет читать во время записи, а busy_timeout заставляет писателей
+# ждать освобождения блокировки (в миллисекундах) вместо ошибки "database is locked".
+# Отрицательное значение cache_size задается в КиБ (по умолчанию 16 МиБ на соединение).
+SQLITE_JOURNAL_MODE = os.environ.get("SQLITE_JOURNAL_MODE", "WAL").strip().upper()
+if SQLITE_JOURNAL_MODE not in ("WAL", "DELETE", "TRUNCATE", "PERSIST", "MEMORY", "OFF"):
+    logging.error(f"Invalid SQLITE_JOURNAL_MODE '{SQLITE_JOURNAL_MODE}', using WAL.")
+    SQLITE_JOURNAL_MODE = "WAL"
+SQLITE_SYNCHRONOUS = os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL").strip().upper()
+if SQLITE_SYNCHRONOUS not in ("OFF", "NORMAL", "FULL", "EXTRA"):
+    logging.error(f"Invalid SQLITE_SYNCHRONOUS '{SQLITE_SYNCHRONOUS}', using NORMAL.")
+    SQLITE_SYNCHRONOUS = "NORMAL"
+SQLITE_BUSY_TIMEOUT_MS = 10000
+SQLITE_CACHE_SIZE = -16384
+SQLITE_MMAP_SIZE = 64 * 1024 * 1024
+try:
+    SQLITE_BUSY_TIMEOUT_MS = max(0, int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", SQLITE_BUSY_TIMEOUT_MS)))
+    SQLITE_CACHE_SIZE = int(os.environ.get("SQLITE_CACHE_SIZE", SQLITE_CACHE_SIZE))
+    SQLITE_MMAP_SIZE = max(0, int(os.environ.get("SQLITE_MMAP_SIZE", SQLITE_MMAP_SIZE)))
+except ValueError:
+    logging.error("Invalid SQLITE_BUSY_TIMEOUT_MS, SQLITE_CACHE_SIZE or SQLITE_MMAP_SIZE format. Expected integers.")
+
+# Пул соединений с базой данных: не меньше числа потоков диспетчера плюс основной поток
+DB_POOL_SIZE = 8
+DB_MAX_OVERFLOW = 4
+DB_POOL_TIMEOUT = 30.0
+try:
+    DB_POOL_SIZE = max(1, int(os.environ.get("DB_POOL_SIZE", DB_POOL_SIZE)))
+    DB_MAX_OVERFLOW = max(0, int(os.environ.get("DB_MAX_OVERFLOW", DB_MAX_OVERFLOW)))
+    DB_POOL_TIMEOUT = max(0.0, float(os.environ.get("DB_POOL_TIMEOUT", DB_POOL_TIMEOUT)))
+except ValueError:
+    logging.error("Invalid DB_POOL_SIZE, DB_MAX_OVERFLOW or DB_POOL_TIMEOUT format. Expected numbers.")
+
+# Статистика SQL-запросов: порог медленного запроса в миллисекундах и доля
+# запросов, время которых замеряется (0..1)
+SQL_SLOW_QUERY_MS = 200.0
+SQL_METRICS_SAMPLE_RATE = 1.0
+try:
+    SQL_SLOW_QUERY_MS = max(0.0, float(os.environ.get("SQL_SLOW_QUERY_MS", SQL_SLOW_QUERY_MS)))
+    SQL_METRICS_SAMPLE_RATE = min(1.0, max(0.0, float(os.environ.get("SQL_METRICS_SAMPLE_RATE", SQL_METRICS_SAMPLE_RATE))))
+except ValueError:
+    logging.error("Invalid SQL_SLOW_QUERY_MS or SQL_METRICS_SAMPLE_RATE format. Expected numbers.")
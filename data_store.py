@@ -2,9 +2,99 @@ import json
 import logging
 import os
 from datetime import datetime
-import copy
-from models import User, ServiceRequest, RequestStatus
+from sqlalchemy import and_, or_, exists, func, insert, inspect, literal, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+from models import User, ServiceRequest, RequestStatus, DayCapacity, new_request_code
 from database import get_session, close_session, Session
+from cache import LRUCache
+from read_models import RequestSummary, UserSummary, REQUEST_SUMMARY_COLUMNS, USER_SUMMARY_COLUMNS
+from config import USER_CACHE_SIZE, USER_CACHE_TTL, BOOKING_DAY_CAPACITY
+
+# Статусы заявок, которые занимают место в расписании
+ACTIVE_BOOKING_STATUSES = (RequestStatus.PENDING.value, RequestStatus.APPROVED.value)
+
+# Поля, которые изменяются методами update_user и update_request
+USER_UPDATE_FIELDS = ('username', 'first_name', 'last_name', 'phone')
+REQUEST_UPDATE_FIELDS = (
+    'car_model', 'license_plate', 'mileage', 'requested_work', 'preferred_date', 'preferred_time',
+    'visit_date', 'visit_time', 'phone', 'real_name', 'real_surname', 'status', 'admin_notes'
+)
+
+class DayFullError(Exception):
+    """На выбранную дату не осталось свободных мест"""
+
+def _insert_ignoring_duplicates(session, table):
+    """
+    INSERT, который пропускает строку с уже существующим первичным ключом
+    (INSERT ... ON CONFLICT DO NOTHING) вместо проверки отдельным SELECT
+    
+    Для СУБД без ON CONFLICT возвращается обычный INSERT: повторная вставка
+    завершится ошибкой целостности.
+    """
+    dialect = session.get_bind().dialect.name
+    if dialect == 'sqlite':
+        return sqlite.insert(table).on_conflict_do_nothing()
+    if dialect == 'postgresql':
+        return postgresql.insert(table).on_conflict_do_nothing()
+    return insert(table)
+
+def _changed_values(obj, fields):
+    """
+    Значения полей объекта, измененных с момента загрузки из базы данных
+    
+    Для объекта, созданного в коде (не загруженного из базы), изменившимися
+    считаются все поля.
+    
+    Returns:
+        dict: {поле: новое значение}
+    """
+    state = inspect(obj)
+    if state.transient or state.pending:
+        return {field: getattr(obj, field) for field in fields}
+    return {field: getattr(obj, field) for field in fields if state.attrs[field].history.has_changes()}
+
+def _update_returning(session, table, key_column, key, values):
+    """
+    UPDATE одной строки по первичному ключу одним оператором
+    
+    Returns:
+        bool: True, если строка существует и была обновлена
+    """
+    statement = update(table).where(key_column == key).values(**values)
+    if session.get_bind().dialect.update_returning:
+        return session.execute(statement.returning(key_column)).first() is not None
+    return session.execute(statement).rowcount == 1
+
+def _find_request(session, request_id):
+    """
+    Поиск заявки по числовому ID, коду или UUID заявки, созданной до
+    перехода на числовые ключи (он остается в кнопках старых сообщений)
+    
+    Returns:
+        ServiceRequest или None
+    """
+    if isinstance(request_id, int):
+        return session.get(ServiceRequest, request_id)
+    # Коды не короче 8 символов. Код старой заявки - первые 8 символов ее UUID
+    # (или весь UUID, если начало совпало с другой) и может состоять из одних
+    # цифр, поэтому код проверяется раньше числового ID
+    if len(request_id) >= 8 or not request_id.isdigit():
+        candidates = session.scalars(
+            select(ServiceRequest).where(ServiceRequest.code.in_({request_id, request_id[:8]}))
+        ).all()
+        for request in candidates:
+            if request.code == request_id or request.legacy_id == request_id:
+                return request
+    if request_id.isdigit():
+        return session.get(ServiceRequest, int(request_id))
+    return None
+
+def _mark_saved(obj, values):
+    """Отметка сохраненных значений, чтобы объект не считал их измененными"""
+    for field, value in values.items():
+        set_committed_value(obj, field, value)
 
 class DataStore:
     """
@@ -17,20 +107,51 @@ class DataStore:
         
         # Флаг миграции (будет использоваться при первом запуске)
         self.migrated = False
+        
+        # Кэш снимков пользователей: get_user вызывается почти на каждом шаге диалога
+        self.user_cache = LRUCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+    
+    def _snapshot_user(self, user):
+        """
+        Создание неизменяемого снимка пользователя для кэша
+        
+        Args:
+            user: объект пользователя User, загруженный из базы данных
+            
+        Returns:
+            UserSummary: снимок, не связанный с сессией
+        """
+        return UserSummary._make(getattr(user, field) for field in UserSummary._fields)
     
     def get_user(self, telegram_id):
         """
         Получение пользователя по его Telegram ID
         
+        Результат кэшируется. Все вызывающие получают один и тот же снимок,
+        поэтому он неизменяемый (именованный кортеж); изменения нужно
+        сохранять через update_user.
+        
         Args:
             telegram_id: ID пользователя в Telegram
             
         Returns:
-            User: объект пользователя или None, если не найден
+            UserSummary: снимок пользователя или None, если не найден
         """
+        cached_user = self.user_cache.get(telegram_id)
+        if cached_user is not None:
+            return cached_user
+        
+        # Поколение запоминается до чтения, чтобы не закэшировать данные,
+        # устаревшие из-за параллельного add_user/update_user
+        generation = self.user_cache.generation
         session = get_session()
         try:
-            return session.query(User).filter_by(telegram_id=telegram_id).first()
+            user = session.get(User, telegram_id)
+            if user is None:
+                return None
+            snapshot = self._snapshot_user(user)
+            self.user_cache.set(telegram_id, snapshot, generation=generation)
+            return snapshot
         except Exception as e:
             logging.error(f"Ошибка при получении пользователя {telegram_id}: {e}")
             return None
@@ -45,20 +166,27 @@ class DataStore:
             user: объект пользователя User
             
         Returns:
-            User: добавленный пользователь
+            UserSummary: снимок добавленного пользователя или уже существующего
+                         пользователя с тем же telegram_id; None при ошибке
         """
         session = get_session()
         try:
-            # Проверяем, существует ли пользователь
-            existing_user = session.query(User).filter_by(telegram_id=user.telegram_id).first()
-            if existing_user:
-                return existing_user
-                
-            # Добавляем нового пользователя
-            session.add(user)
+            # Проверка существования и вставка - один оператор, поэтому два
+            # одновременных /start не приводят к ошибке повторной вставки
+            table = User.__table__
+            result = session.execute(
+                _insert_ignoring_duplicates(session, table).values(
+                    **{column.key: getattr(user, column.key) for column in table.columns}
+                )
+            )
             session.commit()
+            if result.rowcount != 1:
+                return self.get_user(user.telegram_id)
+            
+            make_transient_to_detached(user)
+            self.user_cache.invalidate(user.telegram_id)
             logging.info(f"Добавлен новый пользователь {user.telegram_id}")
-            return user
+            return self._snapshot_user(user)
         except Exception as e:
             session.rollback()
             logging.error(f"Ошибка при добавлении пользователя: {e}")
@@ -70,25 +198,28 @@ class DataStore:
         """
         Обновление существующего пользователя
         
+        Записываются только измененные поля, одним оператором UPDATE.
+        
         Args:
             user: объект пользователя User с обновленными данными
             
         Returns:
             bool: True, если обновление прошло успешно
         """
+        changes = _changed_values(user, USER_UPDATE_FIELDS)
+        if not changes:
+            return True
+        
         session = get_session()
         try:
-            existing_user = session.query(User).filter_by(telegram_id=user.telegram_id).first()
-            if not existing_user:
+            if not _update_returning(session, User.__table__, User.__table__.c.telegram_id, user.telegram_id, changes):
+                session.rollback()
                 return False
-                
-            # Обновляем данные пользователя
-            existing_user.username = user.username
-            existing_user.first_name = user.first_name
-            existing_user.last_name = user.last_name
-            existing_user.phone = user.phone
             
+            # До commit, иначе сессия, в которой загружен объект, еще раз запишет его изменения
+            _mark_saved(user, changes)
             session.commit()
+            self.user_cache.invalidate(user.telegram_id)
             logging.info(f"Обновлен пользователь {user.telegram_id}")
             return True
         except Exception as e:
@@ -103,72 +234,234 @@ class DataStore:
         Получение всех зарегистрированных пользователей
         
         Returns:
-            list: список всех пользователей
+            list: список UserSummary, не связанных с сессией
         """
         session = get_session()
         try:
-            users = session.query(User).all()
-            # Создаем копии объектов, чтобы избежать проблем с закрытой сессией
-            return [copy.copy(user) for user in users]
+            return [UserSummary._make(row) for row in session.query(*USER_SUMMARY_COLUMNS)]
         except Exception as e:
             logging.error(f"Ошибка при получении списка пользователей: {e}")
             return []
         finally:
             close_session(session)
     
-    def add_request(self, request):
+    def add_request(self, request, check_capacity=False):
         """
         Добавление новой заявки
         
         Args:
             request: объект заявки ServiceRequest
+            check_capacity: проверить, что на дату визита (visit_date) остались места;
+                            заявки без даты (свободный текст) добавляются без проверки
             
         Returns:
             ServiceRequest: добавленная заявка
+            
+        Raises:
+            DayFullError: если check_capacity=True и все места на дату заняты
         """
         session = get_session()
         try:
-            # Проверяем, существует ли заявка
-            existing_request = session.query(ServiceRequest).filter_by(id=request.id).first()
-            if existing_request:
-                return existing_request
+            check_capacity = check_capacity and request.visit_date is not None
+            # Несколько попыток - на случай совпадения случайного кода с уже выданным
+            for _ in range(3):
+                request_id = self._insert_request(session, request, check_capacity)
+                if request_id is not None:
+                    session.commit()
+                    request.id = request_id
+                    make_transient_to_detached(request)
+                    logging.info(f"Добавлена новая заявка {request.id} (#{request.code})")
+                    return request
+                session.rollback()
                 
-            # Проверяем, существует ли пользователь
-            user = session.query(User).filter_by(telegram_id=request.user_id).first()
-            if not user:
+                # Заявка не вставлена - выясняем причину (редкий случай)
+                if request.id is not None:
+                    existing_request = session.get(ServiceRequest, request.id)
+                    if existing_request:
+                        return existing_request
+                if session.scalar(select(ServiceRequest.id).where(ServiceRequest.code == request.code)) is None:
+                    break
+                request.code = new_request_code()
+            
+            if session.get(User, request.user_id) is None:
                 logging.error(f"Не найден пользователь {request.user_id} для добавления заявки")
                 return None
-                
-            # Добавляем новую заявку
-            session.add(request)
-            
-            # Добавляем связь с пользователем
-            if request not in user.requests:
-                user.requests.append(request)
-                
-            session.commit()
-            logging.info(f"Добавлена новая заявка {request.id}")
-            return request
         except Exception as e:
             session.rollback()
             logging.error(f"Ошибка при добавлении заявки: {e}")
             return None
         finally:
             close_session(session)
+        
+        logging.info(f"Нет свободных мест на {request.visit_date}, заявка не добавлена")
+        raise DayFullError(request.visit_date)
+    
+    def _day_capacity_expression(self, date):
+        """SQL-выражение количества мест на дату (0 - без ограничения)"""
+        override = select(DayCapacity.capacity).where(DayCapacity.date == date).scalar_subquery()
+        return func.coalesce(override, BOOKING_DAY_CAPACITY)
+    
+    def _insert_request(self, session, request, check_capacity):
+        """
+        Вставка заявки одним оператором INSERT ... SELECT ... WHERE ... ON CONFLICT DO NOTHING
+        
+        Условие проверяет, что пользователь существует, а при check_capacity -
+        что на дату визита остались места; заявка с уже занятым ID или кодом
+        пропускается. Проверки и вставка выполняются одним оператором, поэтому
+        два одновременных подтверждения не могут занять последнее место вдвоем:
+        SQLite берет блокировку записи до вычисления условия.
+        
+        Returns:
+            int: ID добавленной заявки или None, если заявка не добавлена
+        """
+        table = ServiceRequest.__table__
+        # ID новой заявки назначает база данных
+        columns = [column for column in table.columns if column.key != 'id' or request.id is not None]
+        conditions = [exists().where(User.telegram_id == request.user_id)]
+        if check_capacity:
+            booked = (
+                select(func.count())
+                .select_from(table)
+                .where(
+                    table.c.visit_date == request.visit_date,
+                    table.c.status.in_(ACTIVE_BOOKING_STATUSES)
+                )
+                .scalar_subquery()
+            )
+            capacity = self._day_capacity_expression(request.visit_date)
+            conditions.append(or_(capacity <= 0, booked < capacity))
+        
+        values = select(*[
+            literal(getattr(request, column.key), type_=column.type).label(column.key)
+            for column in columns
+        ]).where(*conditions)
+        
+        statement = _insert_ignoring_duplicates(session, table).from_select(
+            [column.key for column in columns], values
+        )
+        if session.get_bind().dialect.insert_returning:
+            return session.execute(statement.returning(table.c.id)).scalar()
+        result = session.execute(statement)
+        return result.lastrowid if result.rowcount == 1 else None
+    
+    def get_date_availability(self, dates):
+        """
+        Получение занятости дат записи одним агрегирующим запросом
+        
+        Args:
+            dates: список дат (datetime.date)
+            
+        Returns:
+            dict: дата -> (количество занятых мест, количество мест или 0 без ограничения)
+        """
+        dates = list(dates)
+        if not dates:
+            return {}
+        session = get_session()
+        try:
+            booked = dict(
+                session.query(ServiceRequest.visit_date, func.count())
+                .filter(
+                    ServiceRequest.visit_date.in_(dates),
+                    ServiceRequest.status.in_(ACTIVE_BOOKING_STATUSES)
+                )
+                .group_by(ServiceRequest.visit_date)
+                .all()
+            )
+            capacities = dict(
+                session.query(DayCapacity.date, DayCapacity.capacity)
+                .filter(DayCapacity.date.in_(dates))
+                .all()
+            )
+            return {
+                date: (booked.get(date, 0), capacities.get(date, BOOKING_DAY_CAPACITY))
+                for date in dates
+            }
+        except Exception as e:
+            logging.error(f"Ошибка при получении занятости дат: {e}")
+            return {date: (0, 0) for date in dates}
+        finally:
+            close_session(session)
+    
+    def get_requests_between(self, start_date, end_date, statuses=ACTIVE_BOOKING_STATUSES):
+        """
+        Получение заявок с датой визита в диапазоне вместе с данными владельцев
+        
+        Args:
+            start_date: первая дата диапазона (datetime.date), включительно
+            end_date: последняя дата диапазона (datetime.date), включительно
+            statuses: статусы заявок (по умолчанию - занимающие место в расписании)
+                      или None для всех статусов
+            
+        Returns:
+            list: RequestSummary в порядке даты и времени визита
+        """
+        session = get_session()
+        try:
+            query = self._requests_with_users_query(session).filter(
+                ServiceRequest.visit_date >= start_date,
+                ServiceRequest.visit_date <= end_date
+            )
+            if statuses is not None:
+                query = query.filter(ServiceRequest.status.in_(statuses))
+            query = query.order_by(
+                ServiceRequest.visit_date,
+                ServiceRequest.visit_time,
+                ServiceRequest.created_at
+            )
+            return [RequestSummary._make(row) for row in query]
+        except Exception as e:
+            logging.error(f"Ошибка при получении заявок за период {start_date} - {end_date}: {e}")
+            return []
+        finally:
+            close_session(session)
+    
+    def set_day_capacity(self, date, capacity):
+        """
+        Изменение количества мест на дату
+        
+        Args:
+            date: дата (datetime.date)
+            capacity: количество мест (0 - без ограничения) или None,
+                      чтобы вернуть значение по умолчанию
+            
+        Returns:
+            bool: True, если изменение сохранено
+        """
+        session = get_session()
+        try:
+            day = session.get(DayCapacity, date)
+            if capacity is None:
+                if day:
+                    session.delete(day)
+            elif day:
+                day.capacity = capacity
+            else:
+                session.add(DayCapacity(date, capacity))
+            session.commit()
+            logging.info(f"Количество мест на {date}: {capacity if capacity is not None else 'по умолчанию'}")
+            return True
+        except Exception as e:
+            session.rollback()
+            logging.error(f"Ошибка при изменении количества мест на {date}: {e}")
+            return False
+        finally:
+            close_session(session)
     
     def get_request(self, request_id):
         """
         Получение заявки по её ID
         
         Args:
-            request_id: ID заявки
+            request_id: ID заявки (число или строка из callback_data), код заявки
+                        или UUID заявки, созданной до перехода на числовые ID
             
         Returns:
             ServiceRequest: объект заявки или None, если не найдена
         """
         session = get_session()
         try:
-            return session.query(ServiceRequest).filter_by(id=request_id).first()
+            return _find_request(session, request_id)
         except Exception as e:
             logging.error(f"Ошибка при получении заявки {request_id}: {e}")
             return None
@@ -179,32 +472,29 @@ class DataStore:
         """
         Обновление существующей заявки
         
+        Записываются только поля, измененные с момента загрузки заявки, и
+        updated_at, одним оператором UPDATE ... RETURNING. Поэтому два
+        администратора, одновременно меняющие разные поля одной заявки, не
+        затирают изменения друг друга.
+        
         Args:
             request: объект заявки ServiceRequest с обновленными данными
             
         Returns:
             bool: True, если обновление прошло успешно
         """
+        changes = _changed_values(request, REQUEST_UPDATE_FIELDS)
+        changes['updated_at'] = datetime.now()
+        
         session = get_session()
         try:
-            existing_request = session.query(ServiceRequest).filter_by(id=request.id).first()
-            if not existing_request:
+            table = ServiceRequest.__table__
+            if not _update_returning(session, table, table.c.id, request.id, changes):
+                session.rollback()
                 return False
-                
-            # Обновляем данные заявки
-            existing_request.car_model = request.car_model
-            existing_request.license_plate = request.license_plate
-            existing_request.mileage = request.mileage
-            existing_request.requested_work = request.requested_work
-            existing_request.preferred_date = request.preferred_date
-            existing_request.preferred_time = request.preferred_time
-            existing_request.phone = request.phone
-            existing_request.real_name = request.real_name
-            existing_request.real_surname = request.real_surname
-            existing_request.status = request.status
-            existing_request.admin_notes = request.admin_notes
-            existing_request.updated_at = datetime.now()
             
+            # До commit, иначе сессия, в которой загружен объект, еще раз запишет его изменения
+            _mark_saved(request, changes)
             session.commit()
             logging.info(f"Обновлена заявка {request.id}")
             return True
@@ -220,14 +510,14 @@ class DataStore:
         Полное удаление заявки
         
         Args:
-            request_id: ID заявки для удаления
+            request_id: ID заявки для удаления (как в get_request)
             
         Returns:
             bool: True, если удаление прошло успешно
         """
         session = get_session()
         try:
-            request = session.query(ServiceRequest).filter_by(id=request_id).first()
+            request = _find_request(session, request_id)
             if not request:
                 return False
                 
@@ -251,11 +541,12 @@ class DataStore:
             telegram_id: ID пользователя в Telegram
             
         Returns:
-            list: список заявок пользователя
+            list: список RequestSummary заявок пользователя
         """
         session = get_session()
         try:
-            return session.query(ServiceRequest).filter_by(user_id=telegram_id).all()
+            query = self._requests_with_users_query(session).filter(ServiceRequest.user_id == telegram_id)
+            return [RequestSummary._make(row) for row in query]
         except Exception as e:
             logging.error(f"Ошибка при получении заявок пользователя {telegram_id}: {e}")
             return []
@@ -267,35 +558,85 @@ class DataStore:
         Получение всех заявок
         
         Returns:
-            list: список всех заявок
+            list: список RequestSummary, не связанных с сессией
         """
         session = get_session()
         try:
-            requests = session.query(ServiceRequest).all()
-            # Создаем копии объектов, чтобы избежать проблем с закрытой сессией
-            return [copy.copy(req) for req in requests]
+            return [RequestSummary._make(row) for row in self._requests_with_users_query(session)]
         except Exception as e:
             logging.error(f"Ошибка при получении списка всех заявок: {e}")
             return []
         finally:
             close_session(session)
     
-    def get_requests_by_status(self, status):
+    def _requests_with_users_query(self, session, status=None, requested_work=None, exclude_work=None):
         """
-        Получение всех заявок с определенным статусом
-        
+        Построение запроса заявок, объединенных с именами владельцев
+
         Args:
-            status: статус заявки (RequestStatus)
-            
+            session: сессия базы данных
+            status: статус заявки (RequestStatus) или None для всех статусов
+            requested_work: оставить только заявки с этим типом работ
+            exclude_work: исключить заявки с этим типом работ
+
         Returns:
-            list: список заявок с указанным статусом
+            Query: запрос только столбцов REQUEST_SUMMARY_COLUMNS (строки для RequestSummary)
+        """
+        query = (
+            session.query(*REQUEST_SUMMARY_COLUMNS)
+            .outerjoin(User, User.telegram_id == ServiceRequest.user_id)
+        )
+        if status is not None:
+            query = query.filter(ServiceRequest.status == status)
+        if requested_work is not None:
+            query = query.filter(ServiceRequest.requested_work == requested_work)
+        if exclude_work is not None:
+            query = query.filter(ServiceRequest.requested_work != exclude_work)
+        return query
+
+    def get_requests_page(self, status=None, requested_work=None, exclude_work=None,
+                          cursor=None, limit=20):
+        """
+        Постраничное получение заявок с именами владельцев (новейшие сначала)
+
+        Использует keyset-пагинацию по (created_at, id): следующая страница
+        начинается сразу после последней строки предыдущей, поэтому стоимость
+        запроса не зависит от номера страницы и размера таблицы.
+
+        Args:
+            status: статус заявки (RequestStatus) или None для всех статусов
+            requested_work: оставить только заявки с этим типом работ
+            exclude_work: исключить заявки с этим типом работ
+            cursor: кортеж (created_at, id) последней заявки предыдущей страницы
+                    или None для первой страницы
+            limit: количество заявок на странице
+
+        Returns:
+            tuple: (список RequestSummary, курсор следующей страницы или None,
+                    если страница последняя)
         """
         session = get_session()
         try:
-            return session.query(ServiceRequest).filter_by(status=status).all()
+            query = self._requests_with_users_query(session, status, requested_work, exclude_work)
+            if cursor is not None:
+                created_at, request_id = cursor
+                query = query.filter(or_(
+                    ServiceRequest.created_at < created_at,
+                    and_(ServiceRequest.created_at == created_at, ServiceRequest.id < request_id)
+                ))
+            rows = [
+                RequestSummary._make(row) for row in
+                query.order_by(ServiceRequest.created_at.desc(), ServiceRequest.id.desc()).limit(limit + 1)
+            ]
+            next_cursor = None
+            if len(rows) > limit:
+                rows = rows[:limit]
+                last_request = rows[-1]
+                next_cursor = (last_request.created_at, last_request.id)
+            return rows, next_cursor
         except Exception as e:
-            logging.error(f"Ошибка при получении заявок со статусом {status}: {e}")
-            return []
+            logging.error(f"Ошибка при постраничном получении заявок: {e}")
+            return [], None
         finally:
             close_session(session)
 
@@ -1,96 +1,384 @@
-"""
-Модуль для конфигурации базы данных и управления сессиями SQLAlchemy
-"""
-import os
-import logging
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, scoped_session
-from sqlalchemy.ext.declarative import declarative_base
-
-# Определим путь к базе данных SQLite
-DATABASE_URL = os.environ.get('DATABASE_URL', 'sqlite:///autoservice.db')
-
-# Создаем движок базы данных
-engine = create_engine(DATABASE_URL, echo=True)
-
-# Создаем фабрику сессий
-session_factory = sessionmaker(bind=engine)
-Session = scoped_session(session_factory)
-
-def init_db():
-    """
-    Инициализация базы данных: создание всех таблиц
-    """
-    from models import Base  # Импортируем здесь, чтобы избежать циклических импортов
-    
-    logging.info(f"Инициализация базы данных по адресу: {DATABASE_URL}")
-    Base.metadata.create_all(engine)
-    logging.info("База данных инициализирована успешно")
-
-def get_session():
-    """
-    Получение сессии базы данных
-    """
-    return Session()
-
-def close_session(session):
-    """
-    Закрытие сессии базы данных
-    """
-    session.close()
-
-# Функция для миграции данных из JSON файлов в SQL базу данных
-def migrate_from_json(json_data_store):
-    """
-    Миграция данных из JSON в базу данных SQL
-    
-    Args:
-        json_data_store: Экземпляр класса DataStore с данными из JSON файлов
-    """
-    from models import User, ServiceRequest  # Импортируем здесь, чтобы избежать циклических импортов
-    
-    logging.info("Начинаем миграцию данных из JSON в базу данных SQL")
-    
-    session = get_session()
-    try:
-        # Получаем всех пользователей из JSON
-        users = json_data_store.get_all_users()
-        logging.info(f"Найдено {len(users)} пользователей для миграции")
-        
-        # Добавляем пользователей в базу данных
-        for user in users:
-            # Проверяем, существует ли пользователь в базе данных
-            db_user = session.query(User).filter_by(telegram_id=user.telegram_id).first()
-            if not db_user:
-                # Если пользователя нет, добавляем его
-                session.add(user)
-                logging.info(f"Добавлен пользователь {user.telegram_id}")
-        
-        # Получаем все заявки из JSON
-        requests = json_data_store.get_all_requests()
-        logging.info(f"Найдено {len(requests)} заявок для миграции")
-        
-        # Добавляем заявки в базу данных
-        for req in requests:
-            # Проверяем, существует ли заявка в базе данных
-            db_request = session.query(ServiceRequest).filter_by(id=req.id).first()
-            if not db_request:
-                # Если заявки нет, добавляем её
-                session.add(req)
-                
-                # Добавляем связь с пользователем
-                user = session.query(User).filter_by(telegram_id=req.user_id).first()
-                if user:
-                    if req not in user.requests:
-                        user.requests.append(req)
-                
-                logging.info(f"Добавлена заявка {req.id}")
-        
-        # Сохраняем изменения
-        session.commit()
-        logging.info("Миграция данных завершена успешно")
-    except Exception as e:
-        session.rollback()
-        logging.error(f"Ошибка при миграции данных: {e}")
-    finally:
+"""
+Модуль для конфигурации базы данных и управления сессиями SQLAlchemy
+"""
+import os
+import logging
+import threading
+from contextlib import contextmanager
+from sqlalchemy import create_engine, event, inspect, select, text, bindparam
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import sessionmaker, scoped_session
+from sqlalchemy.ext.declarative import declarative_base
+from db_metrics import sql_metrics
+from config import (
+    SQLITE_JOURNAL_MODE, SQLITE_SYNCHRONOUS, SQLITE_BUSY_TIMEOUT_MS, SQLITE_CACHE_SIZE, SQLITE_MMAP_SIZE,
+    DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, SQL_SLOW_QUERY_MS, SQL_METRICS_SAMPLE_RATE
+)
+
+# Определим путь к базе данных SQLite
+DATABASE_URL = os.environ.get('DATABASE_URL', 'sqlite:///autoservice.db')
+
+# Журналирование всех SQL-запросов (только для отладки: сильно нагружает логи)
+SQL_ECHO = os.environ.get('SQL_ECHO', '').lower() in ('1', 'true', 'yes')
+
+_database_url = make_url(DATABASE_URL)
+_is_sqlite = _database_url.get_backend_name() == 'sqlite'
+_is_sqlite_file = _is_sqlite and _database_url.database not in (None, '', ':memory:')
+
+engine_options = {'echo': SQL_ECHO}
+if _is_sqlite_file:
+    engine_options.update(
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        connect_args={
+            'timeout': SQLITE_BUSY_TIMEOUT_MS / 1000,
+            'check_same_thread': False,
+        },
+    )
+
+# Создаем движок базы данных
+engine = create_engine(DATABASE_URL, **engine_options)
+
+if _is_sqlite:
+    @event.listens_for(engine, "connect")
+    def configure_sqlite_connection(dbapi_connection, connection_record):
+        """
+        Применение PRAGMA-настроек SQLite к каждому новому соединению пула
+        """
+        cursor = dbapi_connection.cursor()
+        try:
+            if _is_sqlite_file:
+                cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+                cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+            cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+            cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+            cursor.execute(f"PRAGMA cache_size={SQLITE_CACHE_SIZE}")
+        finally:
+            cursor.close()
+
+# Статистика SQL-запросов включается явно через переменные окружения
+sql_metrics.slow_query_ms = SQL_SLOW_QUERY_MS
+sql_metrics.sample_rate = SQL_METRICS_SAMPLE_RATE
+if os.environ.get('SQL_METRICS', '').lower() in ('1', 'true', 'yes'):
+    sql_metrics.enable(engine)
+
+# Файл, в который администратор может выгрузить статистику SQL командой /sqlstats dump
+SQL_METRICS_DUMP_PATH = os.environ.get('SQL_METRICS_DUMP_PATH', 'sql_metrics.json')
+
+# Создаем фабрику сессий. Объекты не сбрасываются после commit, чтобы в пределах
+# единицы работы (см. unit_of_work) повторное обращение к уже загруженной
+# строке не выполняло SELECT заново
+session_factory = sessionmaker(bind=engine, expire_on_commit=False)
+Session = scoped_session(session_factory)
+
+# Признак того, что текущий поток выполняет единицу работы
+_unit_of_work = threading.local()
+
+def init_db():
+    """
+    Инициализация базы данных: создание всех таблиц
+    """
+    from models import Base  # Импортируем здесь, чтобы избежать циклических импортов
+    
+    logging.info(f"Инициализация базы данных по адресу: {DATABASE_URL}")
+    Base.metadata.create_all(engine)
+    upgrade_schema()
+    logging.info("База данных инициализирована успешно")
+
+def upgrade_schema():
+    """
+    Обновление схемы существующей базы данных до текущей версии моделей
+    
+    create_all() создает только отсутствующие таблицы, поэтому столбцы и
+    индексы, добавленные в модели позже, создаются здесь, а данные новых
+    столбцов заполняются из старых. Операция идемпотентна и безопасна для
+    повторного запуска.
+    """
+    from models import Base  # Импортируем здесь, чтобы избежать циклических импортов
+    
+    _add_missing_columns(Base.metadata)
+    
+    with engine.begin() as connection:
+        # Индекс заменен на ix_service_requests_status_visit_date
+        connection.execute(text("DROP INDEX IF EXISTS ix_service_requests_preferred_date_status"))
+        _backfill_visit_dates(connection)
+        _drop_user_requests_table(connection)
+        _rebuild_service_requests_with_integer_ids(connection)
+    
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+def _add_missing_columns(metadata):
+    """
+    Добавление в существующие таблицы столбцов, которых в них еще нет
+    
+    Добавляются только столбцы, допускающие NULL: их можно добавить через
+    ALTER TABLE ADD COLUMN без перестройки таблицы.
+    """
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    
+    with engine.begin() as connection:
+        for table in metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing_columns or not column.nullable:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+                logging.info(f"В таблицу {table.name} добавлен столбец {column.name}")
+
+def _backfill_visit_dates(connection):
+    """
+    Заполнение visit_date и visit_time у заявок, созданных до появления этих
+    столбцов, и перевод дат в day_capacity из строк ДД.ММ.ГГГГ в даты
+    """
+    from models import ServiceRequest, DayCapacity, parse_visit_date, parse_visit_time
+    
+    # Под шаблон ДД.ММ.ГГГГ не попадает свободный текст вроде "В ближайшее время"
+    rows = connection.execute(text(
+        "SELECT id, preferred_date, preferred_time FROM service_requests "
+        "WHERE visit_date IS NULL AND preferred_date LIKE '__.__.____'"
+    )).fetchall()
+    updates = [
+        {'b_id': request_id, 'b_date': parse_visit_date(date_str), 'b_time': parse_visit_time(time_str)}
+        for request_id, date_str, time_str in rows
+        if parse_visit_date(date_str) is not None
+    ]
+    if updates:
+        table = ServiceRequest.__table__
+        connection.execute(
+            table.update()
+            .where(table.c.id == bindparam('b_id'))
+            .values(visit_date=bindparam('b_date'), visit_time=bindparam('b_time')),
+            updates
+        )
+        logging.info(f"Заполнены даты визита у {len(updates)} заявок")
+    
+    rows = connection.execute(text(
+        "SELECT date, capacity FROM day_capacity WHERE date LIKE '__.__.____'"
+    )).fetchall()
+    for date_str, capacity in rows:
+        connection.execute(text("DELETE FROM day_capacity WHERE date = :date"), {'date': date_str})
+        visit_date = parse_visit_date(date_str)
+        if visit_date is not None:
+            connection.execute(
+                DayCapacity.__table__.insert().values(date=visit_date, capacity=capacity)
+            )
+
+def _drop_user_requests_table(connection):
+    """
+    Удаление таблицы связи user_requests
+    
+    Владелец заявки хранится в service_requests.user_id; таблица связи его
+    дублировала. Перед удалением владелец переносится из нее в заявки, у
+    которых user_id не заполнен.
+    """
+    if 'user_requests' not in inspect(connection).get_table_names():
+        return
+    
+    filled = connection.execute(text(
+        "UPDATE service_requests SET user_id = ("
+        "    SELECT MIN(user_requests.user_id) FROM user_requests"
+        "    WHERE user_requests.request_id = service_requests.id"
+        ") WHERE user_id IS NULL AND EXISTS ("
+        "    SELECT 1 FROM user_requests WHERE user_requests.request_id = service_requests.id"
+        "    AND user_requests.user_id IS NOT NULL"
+        ")"
+    )).rowcount
+    conflicts = connection.execute(text(
+        "SELECT COUNT(*) FROM user_requests JOIN service_requests "
+        "ON service_requests.id = user_requests.request_id "
+        "WHERE service_requests.user_id != user_requests.user_id"
+    )).scalar()
+    if conflicts:
+        logging.warning(
+            f"В user_requests найдено {conflicts} связей, не совпадающих с service_requests.user_id; "
+            f"владельцем остается user_id заявки"
+        )
+    connection.execute(text("DROP TABLE user_requests"))
+    logging.info(f"Таблица user_requests удалена, владелец заполнен у {filled} заявок")
+
+def _rebuild_service_requests_with_integer_ids(connection):
+    """
+    Перевод service_requests с UUID-ключа на числовой ID и короткий код
+    
+    Тип первичного ключа нельзя изменить через ALTER TABLE, поэтому таблица
+    пересоздается: заявки копируются в порядке создания и получают числовые
+    ID, UUID сохраняется в legacy_id, а код - первые 8 символов UUID, которые
+    администраторы видели как номер заявки (весь UUID, если начало совпало с
+    другой заявкой).
+    """
+    from models import ServiceRequest  # Импортируем здесь, чтобы избежать циклических импортов
+    
+    inspector = inspect(connection)
+    if 'service_requests' not in inspector.get_table_names():
+        return
+    old_columns = {column['name'] for column in inspector.get_columns('service_requests')}
+    if 'code' in old_columns:
+        return
+    
+    # Имена индексов общие для всей базы - индексы старой таблицы удаляем до создания новой
+    for index in inspector.get_indexes('service_requests'):
+        connection.execute(text(f"DROP INDEX IF EXISTS {index['name']}"))
+    connection.execute(text("ALTER TABLE service_requests RENAME TO service_requests_legacy"))
+    ServiceRequest.__table__.create(connection)
+    
+    copied = [
+        column.name for column in ServiceRequest.__table__.columns
+        if column.name not in ('id', 'code', 'legacy_id') and column.name in old_columns
+    ]
+    column_list = ", ".join(copied)
+    source_list = ", ".join(f"old.{name}" for name in copied)
+    count = connection.execute(text(
+        f"INSERT INTO service_requests (code, legacy_id, {column_list}) "
+        f"SELECT CASE WHEN duplicate.prefix IS NULL THEN substr(old.id, 1, 8) ELSE old.id END, "
+        f"old.id, {source_list} "
+        f"FROM service_requests_legacy AS old "
+        f"LEFT JOIN ("
+        f"    SELECT substr(id, 1, 8) AS prefix FROM service_requests_legacy "
+        f"    GROUP BY substr(id, 1, 8) HAVING COUNT(*) > 1"
+        f") AS duplicate ON duplicate.prefix = substr(old.id, 1, 8) "
+        f"ORDER BY old.created_at, old.id"
+    )).rowcount
+    connection.execute(text("DROP TABLE service_requests_legacy"))
+    logging.info(f"Таблица service_requests переведена на числовые ID, перенесено заявок: {count}")
+
+def get_session():
+    """
+    Получение сессии базы данных
+    
+    Сессия привязана к потоку (scoped_session), поэтому внутри единицы работы
+    все методы DataStore получают одну и ту же сессию.
+    """
+    return Session()
+
+def close_session(session):
+    """
+    Закрытие сессии базы данных
+    
+    Внутри единицы работы сессия остается открытой до ее завершения, чтобы
+    следующие вызовы DataStore использовали уже загруженные объекты.
+    """
+    if in_unit_of_work():
+        return
+    session.close()
+
+def in_unit_of_work():
+    """Проверка, выполняет ли текущий поток единицу работы"""
+    return getattr(_unit_of_work, 'active', False)
+
+def begin_unit_of_work():
+    """
+    Начало единицы работы в текущем потоке
+    
+    Все вызовы DataStore до end_unit_of_work используют одну сессию и одно
+    соединение. Незавершенная единица работы (например, после исключения в
+    обработчике) откатывается.
+    """
+    if in_unit_of_work():
+        end_unit_of_work(commit=False)
+    _unit_of_work.active = True
+
+def end_unit_of_work(commit=True):
+    """
+    Завершение единицы работы: фиксация оставшихся изменений и освобождение сессии
+    
+    Args:
+        commit: зафиксировать изменения (False - откатить)
+    """
+    if not in_unit_of_work():
+        return
+    _unit_of_work.active = False
+    session = Session()
+    try:
+        if commit:
+            session.commit()
+        else:
+            session.rollback()
+    except Exception as e:
+        session.rollback()
+        logging.error(f"Ошибка при завершении единицы работы: {e}")
+    finally:
+        # Удаляем сессию из реестра потока, чтобы ее объекты не копились между обновлениями
+        Session.remove()
+
+@contextmanager
+def unit_of_work():
+    """
+    Единица работы для блока кода (например, обработчика в пуле потоков)
+    
+    Вложенный вызов использует внешнюю единицу работы.
+    """
+    if in_unit_of_work():
+        yield
+        return
+    begin_unit_of_work()
+    try:
+        yield
+    except BaseException:
+        end_unit_of_work(commit=False)
+        raise
+    end_unit_of_work()
+
+# Функция для миграции данных из JSON файлов в SQL базу данных
+def migrate_from_json(json_data_store):
+    """
+    Миграция данных из JSON в базу данных SQL
+    
+    Args:
+        json_data_store: Экземпляр класса DataStore с данными из JSON файлов
+    """
+    from models import User, ServiceRequest, legacy_request_code  # Импортируем здесь, чтобы избежать циклических импортов
+    
+    logging.info("Начинаем миграцию данных из JSON в базу данных SQL")
+    
+    session = get_session()
+    try:
+        # Получаем всех пользователей из JSON
+        users = json_data_store.get_all_users()
+        logging.info(f"Найдено {len(users)} пользователей для миграции")
+        
+        # Добавляем пользователей в базу данных
+        for user in users:
+            # Проверяем, существует ли пользователь в базе данных
+            db_user = session.query(User).filter_by(telegram_id=user.telegram_id).first()
+            if not db_user:
+                # Если пользователя нет, добавляем его
+                session.add(user)
+                logging.info(f"Добавлен пользователь {user.telegram_id}")
+        
+        # Получаем все заявки из JSON
+        requests = json_data_store.get_all_requests()
+        logging.info(f"Найдено {len(requests)} заявок для миграции")
+        
+        # Коды, уже занятые заявками в базе данных
+        codes = set(session.scalars(select(ServiceRequest.code)))
+        
+        # Добавляем заявки в базу данных
+        for req in requests:
+            # UUID из JSON сохраняется в legacy_id, числовой ID назначит база данных
+            if isinstance(req.id, str):
+                req.legacy_id, req.id = req.id, None
+                # Проверяем, существует ли заявка в базе данных
+                if session.query(ServiceRequest.id).filter_by(legacy_id=req.legacy_id).first():
+                    continue
+                req.code = legacy_request_code(req.legacy_id, codes)
+            
+            # Если заявки нет, добавляем её (владелец задается полем user_id)
+            codes.add(req.code)
+            session.add(req)
+            logging.info(f"Добавлена заявка {req.code}")
+        
+        # Сохраняем изменения
+        session.commit()
+        logging.info("Миграция данных завершена успешно")
+    except Exception as e:
+        session.rollback()
+        logging.error(f"Ошибка при миграции данных: {e}")
+    finally:
         close_session(session) 
\ No newline at end of file
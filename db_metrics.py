@@ -0,0 +1,273 @@
+"""
+Модуль инструментирования SQL-запросов на основе событий движка SQLAlchemy
+
+Собирает гистограммы времени выполнения по типам запросов, журналирует
+медленные запросы и считает на каждый обработчик Telegram количество
+запросов, SELECT и выдач соединений из пула в расчете на одно обновление.
+Сбор включается явно (переменная окружения SQL_METRICS или команда
+администратора /sqlstats on) и не влияет на работу, пока выключен.
+"""
+import bisect
+import json
+import logging
+import random
+import threading
+import time
+from datetime import datetime
+from sqlalchemy import event
+
+# Границы корзин гистограммы времени выполнения, в миллисекундах
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+slow_query_logger = logging.getLogger("sql.slow")
+
+class SQLMetrics:
+    """
+    Сборщик статистики SQL-запросов
+    """
+
+    def __init__(self, slow_query_ms=200.0, sample_rate=1.0):
+        """
+        Инициализация сборщика
+
+        Args:
+            slow_query_ms: порог в миллисекундах, выше которого запрос журналируется как медленный
+            sample_rate: доля запросов (0..1), для которых измеряется время выполнения
+        """
+        self.slow_query_ms = slow_query_ms
+        self.sample_rate = sample_rate
+        self.engine = None
+        self.started_at = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._histograms = {}
+        self._handler_counts = {}
+        # Счетчики по обработчикам: обновления, SELECT, выдачи соединений из пула
+        self._handler_details = {}
+
+    @property
+    def enabled(self):
+        return self.engine is not None
+
+    def enable(self, engine):
+        """
+        Подключение слушателей событий к движку
+
+        Args:
+            engine: движок SQLAlchemy
+        """
+        with self._lock:
+            if self.engine is not None:
+                return
+            event.listen(engine, "before_cursor_execute", self._before_cursor_execute)
+            event.listen(engine, "after_cursor_execute", self._after_cursor_execute)
+            event.listen(engine, "checkout", self._checkout)
+            self.engine = engine
+            self.started_at = datetime.now()
+        logging.info(
+            f"Сбор статистики SQL включен (порог медленных запросов {self.slow_query_ms} мс, "
+            f"доля выборки {self.sample_rate})"
+        )
+
+    def disable(self):
+        """Отключение слушателей событий от движка"""
+        with self._lock:
+            if self.engine is None:
+                return
+            event.remove(self.engine, "before_cursor_execute", self._before_cursor_execute)
+            event.remove(self.engine, "after_cursor_execute", self._after_cursor_execute)
+            event.remove(self.engine, "checkout", self._checkout)
+            self.engine = None
+        logging.info("Сбор статистики SQL выключен")
+
+    def reset(self):
+        """Сброс накопленной статистики"""
+        with self._lock:
+            self._histograms = {}
+            self._handler_counts = {}
+            self._handler_details = {}
+            self.started_at = datetime.now()
+
+    def set_handler(self, label):
+        """
+        Указание обработчика, которому засчитываются запросы текущего потока
+
+        Args:
+            label: имя обработчика (например, "callback:admin_view_*")
+        """
+        self._local.handler = label
+
+    def begin_update(self, label):
+        """
+        Начало обработки обновления: указание обработчика и учет обновления
+
+        Args:
+            label: имя обработчика (см. set_handler)
+        """
+        self._local.handler = label
+        with self._lock:
+            self._details(label)["updates"] += 1
+
+    def _details(self, handler):
+        """Счетчики обработчика (вызывается под блокировкой)"""
+        details = self._handler_details.get(handler)
+        if details is None:
+            details = {"updates": 0, "selects": 0, "checkouts": 0}
+            self._handler_details[handler] = details
+        return details
+
+    def _checkout(self, dbapi_connection, connection_record, connection_proxy):
+        handler = getattr(self._local, "handler", None) or "unknown"
+        with self._lock:
+            self._details(handler)["checkouts"] += 1
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        handler = getattr(self._local, "handler", None) or "unknown"
+        is_select = statement.lstrip()[:6].upper() == "SELECT"
+        with self._lock:
+            self._handler_counts[handler] = self._handler_counts.get(handler, 0) + 1
+            if is_select:
+                self._details(handler)["selects"] += 1
+
+        # Время измеряется только для выбранной доли запросов
+        if self.sample_rate >= 1.0 or random.random() < self.sample_rate:
+            conn.info.setdefault("sql_metrics_start", []).append(time.perf_counter())
+        else:
+            conn.info.setdefault("sql_metrics_start", []).append(None)
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get("sql_metrics_start")
+        if not starts:
+            return
+        started = starts.pop()
+        if started is None:
+            return
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        kind = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+
+        with self._lock:
+            histogram = self._histograms.get(kind)
+            if histogram is None:
+                histogram = {
+                    "count": 0,
+                    "total_ms": 0.0,
+                    "max_ms": 0.0,
+                    "buckets": [0] * (len(LATENCY_BUCKETS_MS) + 1),
+                }
+                self._histograms[kind] = histogram
+            histogram["count"] += 1
+            histogram["total_ms"] += elapsed_ms
+            histogram["max_ms"] = max(histogram["max_ms"], elapsed_ms)
+            histogram["buckets"][bisect.bisect_left(LATENCY_BUCKETS_MS, elapsed_ms)] += 1
+
+        if elapsed_ms >= self.slow_query_ms:
+            handler = getattr(self._local, "handler", None) or "unknown"
+            slow_query_logger.warning(
+                f"Медленный запрос {elapsed_ms:.1f} мс (обработчик {handler}): "
+                f"{' '.join(statement.split())[:500]}"
+            )
+
+    def snapshot(self):
+        """
+        Получение копии накопленной статистики
+
+        Returns:
+            dict: статистика по типам запросов и по обработчикам
+        """
+        with self._lock:
+            histograms = {
+                kind: {
+                    "count": data["count"],
+                    "avg_ms": round(data["total_ms"] / data["count"], 3) if data["count"] else 0.0,
+                    "max_ms": round(data["max_ms"], 3),
+                    "buckets": {
+                        (f"<={bound}ms" if i < len(LATENCY_BUCKETS_MS) else f">{LATENCY_BUCKETS_MS[-1]}ms"): value
+                        for i, (bound, value) in enumerate(
+                            zip(LATENCY_BUCKETS_MS + (None,), data["buckets"])
+                        )
+                    },
+                }
+                for kind, data in self._histograms.items()
+            }
+            per_update = {
+                handler: {
+                    "updates": details["updates"],
+                    "statements": round(self._handler_counts.get(handler, 0) / details["updates"], 2),
+                    "selects": round(details["selects"] / details["updates"], 2),
+                    "checkouts": round(details["checkouts"] / details["updates"], 2),
+                }
+                for handler, details in self._handler_details.items()
+                if details["updates"]
+            }
+            return {
+                "enabled": self.enabled,
+                "started_at": self.started_at.isoformat() if self.started_at else None,
+                "slow_query_ms": self.slow_query_ms,
+                "sample_rate": self.sample_rate,
+                "statements": histograms,
+                "handlers": dict(self._handler_counts),
+                "checkouts": sum(details["checkouts"] for details in self._handler_details.values()),
+                "per_update": per_update,
+            }
+
+    def format_report(self, top_handlers=10):
+        """
+        Краткий текстовый отчет для администратора
+
+        Args:
+            top_handlers: сколько обработчиков с наибольшим числом запросов показать
+
+        Returns:
+            str: текст отчета
+        """
+        data = self.snapshot()
+        if not data["enabled"] and not data["statements"] and not data["handlers"]:
+            return "Сбор статистики SQL выключен. Включите его командой /sqlstats on."
+
+        lines = [
+            f"📈 Статистика SQL ({'включена' if data['enabled'] else 'выключена'})",
+            f"С момента: {data['started_at']}",
+            f"Доля выборки: {data['sample_rate']}, порог медленных: {data['slow_query_ms']} мс",
+            "",
+        ]
+        for kind, stats in sorted(data["statements"].items()):
+            lines.append(f"{kind}: {stats['count']} шт., среднее {stats['avg_ms']} мс, макс. {stats['max_ms']} мс")
+
+        handlers = sorted(data["handlers"].items(), key=lambda item: item[1], reverse=True)[:top_handlers]
+        if handlers:
+            lines.append("")
+            lines.append("Запросов по обработчикам:")
+            for handler, count in handlers:
+                lines.append(f"{handler}: {count}")
+
+        per_update = sorted(
+            data["per_update"].items(), key=lambda item: item[1]["statements"], reverse=True
+        )[:top_handlers]
+        if per_update:
+            lines.append("")
+            lines.append("На одно обновление (запросов / SELECT / соединений):")
+            for handler, stats in per_update:
+                lines.append(
+                    f"{handler}: {stats['statements']} / {stats['selects']} / {stats['checkouts']} "
+                    f"({stats['updates']} обн.)"
+                )
+        return "\n".join(lines)
+
+    def dump_to_file(self, path):
+        """
+        Сохранение статистики в JSON-файл
+
+        Args:
+            path: путь к файлу
+
+        Returns:
+            str: путь к сохраненному файлу
+        """
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f, ensure_ascii=False, indent=2)
+        logging.info(f"Статистика SQL сохранена в {path}")
+        return path
+
+# Глобальный экземпляр сборщика статистики
+sql_metrics = SQLMetrics()
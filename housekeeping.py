@@ -0,0 +1,229 @@
+"""
+Завершение брошенных диалогов и очистка user_data
+
+Пользователи часто бросают заполнение заявки на середине, и их состояние
+диалога и context.user_data остаются в памяти (и в файле состояния) навсегда.
+Middleware отмечает время последнего обновления каждого пользователя, а
+периодическая задача JobQueue завершает диалоги, простаивающие дольше
+таймаута, и удаляет давно не используемые user_data.
+"""
+import logging
+import sys
+import threading
+import time
+from telegram.ext import ConversationHandler
+from telegram.ext.utils.promise import Promise
+from config import CONVERSATION_TIMEOUT, USER_DATA_TTL
+
+# Пустые user_data удаляются не сразу, чтобы не удалить словарь, в который
+# прямо сейчас пишет обработчик только что пришедшего обновления
+EMPTY_USER_DATA_GRACE = 60.0
+
+def _deep_sizeof(obj, seen=None):
+    """Приблизительный объем памяти объекта вместе с вложенными контейнерами, в байтах"""
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(_deep_sizeof(key, seen) + _deep_sizeof(value, seen) for key, value in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(_deep_sizeof(item, seen) for item in obj)
+    return size
+
+def end_conversation(conversation_handler, key):
+    """
+    Удаление состояния диалога вместе с записью в persistence
+
+    Публичного способа завершить диалог извне обработчика в PTB 13 нет, поэтому
+    используется ConversationHandler._update_state (версия PTB закреплена в
+    requirements.txt). Если метода нет, то же самое делается через публичные
+    conversations и persistence.update_conversation.
+
+    Args:
+        conversation_handler: ConversationHandler
+        key: ключ диалога
+    """
+    update_state = getattr(conversation_handler, '_update_state', None)
+    if update_state is not None:
+        # Удаляет состояние под блокировкой обработчика и обновляет persistence
+        update_state(ConversationHandler.END, key)
+        return
+    if conversation_handler.conversations.pop(key, None) is None:
+        return
+    persistence = conversation_handler.persistence
+    if conversation_handler.persistent and persistence is not None and conversation_handler.name:
+        persistence.update_conversation(conversation_handler.name, key, None)
+
+class ConversationHousekeeper:
+    """
+    Очистка состояния простаивающих пользователей
+    """
+
+    def __init__(self, conversation_timeout=3600.0, user_data_ttl=86400.0):
+        """
+        Инициализация
+
+        Args:
+            conversation_timeout: через сколько секунд бездействия диалог
+                                  завершается, а данные формы удаляются (0 - никогда)
+            user_data_ttl: через сколько секунд бездействия user_data
+                           удаляется целиком (0 - никогда)
+        """
+        self.conversation_timeout = conversation_timeout
+        self.user_data_ttl = user_data_ttl
+        self.dispatcher = None
+        self.conversation_handler = None
+        self._lock = threading.Lock()
+        # Время последнего обновления от пользователя (time.monotonic)
+        self._last_seen = {}
+        # Для диалогов, восстановленных после перезапуска, отсчет идет от запуска
+        self._started_at = time.monotonic()
+        self._stats = {'runs': 0, 'expired_conversations': 0, 'evicted_user_data': 0}
+
+    def touch(self, user_id):
+        """Отметка активности пользователя (вызывается для каждого обновления)"""
+        self._last_seen[user_id] = time.monotonic()
+
+    def attach(self, dispatcher, conversation_handler, interval=60.0):
+        """
+        Подключение к диспетчеру и запуск периодической очистки
+
+        Args:
+            dispatcher: диспетчер бота
+            conversation_handler: основной ConversationHandler
+            interval: интервал очистки, в секундах
+        """
+        self.dispatcher = dispatcher
+        self.conversation_handler = conversation_handler
+        if dispatcher.job_queue is None:
+            logging.warning("У диспетчера нет JobQueue, очистка диалогов не запущена")
+            return
+        dispatcher.job_queue.run_repeating(
+            lambda context: self.cleanup(), interval=interval, first=interval, name="conversation_housekeeping"
+        )
+
+    def _idle_seconds(self, user_id, now):
+        return now - self._last_seen.get(user_id, self._started_at)
+
+    def _end_conversation(self, key):
+        """
+        Завершение диалога
+
+        Returns:
+            bool: True, если диалог был завершен
+        """
+        state = self.conversation_handler.conversations.get(key)
+        if state is None:
+            return False
+        # Обработчик пользователя еще выполняется - не трогаем
+        if isinstance(state, tuple) and len(state) == 2 and isinstance(state[1], Promise) \
+                and not state[1].done.is_set():
+            return False
+        end_conversation(self.conversation_handler, key)
+        return True
+
+    def _drop_user_data(self, user_id):
+        self.dispatcher.user_data.pop(user_id, None)
+        persistence = self.dispatcher.persistence
+        if persistence is not None and persistence.user_data is not None:
+            persistence.user_data.pop(user_id, None)
+
+    def cleanup(self):
+        """
+        Завершение простаивающих диалогов и удаление устаревших user_data
+
+        Returns:
+            tuple: (завершено диалогов, удалено user_data)
+        """
+        if self.dispatcher is None:
+            return 0, 0
+
+        now = time.monotonic()
+        expired = 0
+        evicted = 0
+        with self._lock:
+            conversation_keys = list(self.conversation_handler.conversations)
+            user_ids = set(self.dispatcher.user_data) | set(self._last_seen)
+            user_ids.update(key[0] for key in conversation_keys)
+
+            for user_id in user_ids:
+                idle = self._idle_seconds(user_id, now)
+                key = (user_id,)
+                user_data = self.dispatcher.user_data.get(user_id)
+
+                if self.user_data_ttl and idle > self.user_data_ttl:
+                    if self._end_conversation(key):
+                        expired += 1
+                    if user_data:
+                        evicted += 1
+                    self._drop_user_data(user_id)
+                    self._last_seen.pop(user_id, None)
+                    continue
+
+                if self.conversation_timeout and idle > self.conversation_timeout:
+                    if self._end_conversation(key):
+                        expired += 1
+                        # Данные брошенной формы больше не нужны, как и после отмены заявки
+                        if user_data:
+                            user_data.clear()
+
+                # Пустые user_data создаются диспетчером для каждого пользователя - не копим их
+                if idle > EMPTY_USER_DATA_GRACE and user_id in self.dispatcher.user_data \
+                        and not self.dispatcher.user_data[user_id] \
+                        and key not in self.conversation_handler.conversations:
+                    self._drop_user_data(user_id)
+
+            self._stats['runs'] += 1
+            self._stats['expired_conversations'] += expired
+            self._stats['evicted_user_data'] += evicted
+
+        if expired or evicted:
+            logging.info(f"Очистка диалогов: завершено {expired}, удалено user_data {evicted}")
+        return expired, evicted
+
+    def memory_report(self, state_names=None):
+        """
+        Объем памяти, занятый user_data пользователей, по состояниям диалога
+
+        Args:
+            state_names: словарь {состояние: название} для отчета
+
+        Returns:
+            dict: total - общие показатели, states - список
+                  (название состояния, диалогов, байт user_data) по убыванию объема
+        """
+        state_names = state_names or {}
+        conversations = dict(self.conversation_handler.conversations) if self.conversation_handler else {}
+        user_data = dict(self.dispatcher.user_data) if self.dispatcher else {}
+
+        by_state = {}
+        for (user_id, *_), state in conversations.items():
+            if isinstance(state, tuple) and len(state) == 2 and isinstance(state[1], Promise):
+                state = state[0]
+            name = state_names.get(state, str(state))
+            count, size = by_state.get(name, (0, 0))
+            by_state[name] = (count + 1, size + _deep_sizeof(user_data.get(user_id, {})))
+
+        with self._lock:
+            stats = dict(self._stats)
+        stats.update({
+            'conversations': len(conversations),
+            'user_data_entries': len(user_data),
+            'user_data_nonempty': sum(1 for data in user_data.values() if data),
+            'user_data_bytes': sum(_deep_sizeof(data) for data in user_data.values()),
+            'tracked_users': len(self._last_seen),
+        })
+        states = sorted(
+            ((name, count, size) for name, (count, size) in by_state.items()),
+            key=lambda item: item[2], reverse=True
+        )
+        return {'total': stats, 'states': states}
+
+# Глобальный экземпляр очистки диалогов
+housekeeper = ConversationHousekeeper(
+    conversation_timeout=CONVERSATION_TIMEOUT,
+    user_data_ttl=USER_DATA_TTL
+)
@@ -0,0 +1,114 @@
+"""
+Потоковое чтение JSON-массивов без загрузки всего файла в память
+"""
+import codecs
+import json
+import re
+
+# Пробельные символы, допустимые между элементами JSON
+_WHITESPACE_RE = re.compile(r'[ \t\n\r]*')
+
+# Символы, которые могут следовать за элементом массива
+_DELIMITERS = ' \t\n\r,]'
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+def _utf8_length(text):
+    """Длина строки в байтах UTF-8"""
+    return len(text) if text.isascii() else len(text.encode('utf-8'))
+
+def iter_json_array(path, chunk_size=DEFAULT_CHUNK_SIZE, offset=0):
+    """
+    Последовательное чтение элементов JSON-массива верхнего уровня
+
+    Файл читается блоками по chunk_size байт, в памяти одновременно находится
+    не больше одного блока и одного элемента, поэтому потребление памяти не
+    зависит от размера файла.
+
+    Args:
+        path: путь к файлу, содержащему JSON-массив
+        chunk_size: размер читаемого блока в байтах
+        offset: байтовое смещение, с которого продолжить чтение; должно быть
+                значением end_offset, полученным ранее от этой функции
+                (0 - чтение с начала файла)
+
+    Yields:
+        tuple: (элемент массива, байтовое смещение сразу после элемента)
+
+    Raises:
+        ValueError: если файл не является корректным JSON-массивом
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8')()
+
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        buf = ''
+        pos = 0
+        # Байтовое смещение символа buf[pos] в файле
+        byte_pos = offset
+        eof = False
+        # start - ждем "[", first - первый элемент или "]", value - элемент, separator - "," или "]"
+        state = 'start' if offset == 0 else 'separator'
+
+        def read_more():
+            nonlocal buf, pos, eof
+            chunk = f.read(chunk_size)
+            if not chunk:
+                eof = True
+                buf = buf[pos:] + text_decoder.decode(b'', final=True)
+            else:
+                buf = buf[pos:] + text_decoder.decode(chunk)
+            pos = 0
+
+        def advance(new_pos):
+            nonlocal pos, byte_pos
+            byte_pos += _utf8_length(buf[pos:new_pos])
+            pos = new_pos
+
+        while True:
+            advance(_WHITESPACE_RE.match(buf, pos).end())
+            if pos >= len(buf):
+                if eof:
+                    if state == 'done':
+                        return
+                    raise ValueError(f"Неожиданный конец файла {path} (смещение {byte_pos})")
+                read_more()
+                continue
+
+            char = buf[pos]
+            if state == 'done':
+                raise ValueError(f"Лишние данные после JSON-массива в {path} (смещение {byte_pos})")
+            if state == 'start':
+                if char != '[':
+                    raise ValueError(f"Файл {path} не содержит JSON-массив")
+                advance(pos + 1)
+                state = 'first'
+                continue
+            if state in ('first', 'separator') and char == ']':
+                advance(pos + 1)
+                state = 'done'
+                continue
+            if state == 'separator':
+                if char != ',':
+                    raise ValueError(f"Ожидалась ',' или ']' в {path} (смещение {byte_pos})")
+                advance(pos + 1)
+                state = 'value'
+                continue
+
+            # state in ('first', 'value'): разбираем очередной элемент
+            try:
+                item, end = decoder.raw_decode(buf, pos)
+            except ValueError:
+                if eof:
+                    raise ValueError(f"Некорректный элемент JSON в {path} (смещение {byte_pos})")
+                read_more()
+                continue
+            # Значение, за которым в буфере нет разделителя (например, число "15" из "15.5"),
+            # может быть обрезано границей блока - дочитываем и разбираем заново
+            if not eof and (end >= len(buf) or buf[end] not in _DELIMITERS):
+                read_more()
+                continue
+            advance(end)
+            state = 'separator'
+            yield item, byte_pos
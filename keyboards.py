@@ -0,0 +1,120 @@
+"""
+Реестр готовых inline-клавиатур для статичных меню
+
+Клавиатуры строятся один раз (вместе с их JSON-представлением, которое
+отправляется в Bot API) и переиспользуются во всех обработчиках. Для каждой
+клавиатуры можно указать источник данных (например, каталог марок и
+моделей): если данные источника изменились, клавиатура перестраивается при
+следующем обращении.
+"""
+import logging
+import threading
+from telegram import InlineKeyboardMarkup
+
+class CachedInlineKeyboardMarkup(InlineKeyboardMarkup):
+    """
+    InlineKeyboardMarkup, сериализуемая в JSON один раз
+
+    Объект используется несколькими обработчиками одновременно, поэтому
+    изменять его кнопки после создания нельзя.
+    """
+    __slots__ = ('_json',)
+
+    def __init__(self, inline_keyboard, **_kwargs):
+        super().__init__(inline_keyboard, **_kwargs)
+        self._json = super().to_json()
+
+    def to_json(self):
+        return self._json
+
+def _freeze(value):
+    """Неизменяемый снимок данных источника для сравнения"""
+    if isinstance(value, dict):
+        return tuple((key, _freeze(item)) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+class KeyboardRegistry:
+    """
+    Реестр клавиатур с автоматической перестройкой при изменении данных
+    """
+
+    def __init__(self):
+        self._builders = {}
+        self._markups = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.builds = 0
+
+    def register(self, name, builder, source=None, variants=None):
+        """
+        Регистрация клавиатуры
+
+        Args:
+            name: имя клавиатуры
+            builder: функция, возвращающая список рядов кнопок; получает
+                     аргументы, переданные в get
+            source: функция, возвращающая данные, из которых строится клавиатура
+                    (получает те же аргументы); None - клавиатура не меняется
+            variants: функция, возвращающая список кортежей аргументов, для
+                      которых клавиатуру нужно построить заранее (см. warm_up)
+        """
+        self._builders[name] = (builder, source, variants)
+        with self._lock:
+            for key in [key for key in self._markups if key[0] == name]:
+                del self._markups[key]
+
+    def get(self, name, *args):
+        """
+        Получение готовой клавиатуры
+
+        Args:
+            name: имя зарегистрированной клавиатуры
+            *args: аргументы для функции построения (например, марка автомобиля)
+
+        Returns:
+            CachedInlineKeyboardMarkup: клавиатура
+        """
+        builder, source, _ = self._builders[name]
+        fingerprint = _freeze(source(*args)) if source else None
+        key = (name,) + args
+
+        with self._lock:
+            entry = self._markups.get(key)
+            if entry is not None and entry[0] == fingerprint:
+                self.hits += 1
+                return entry[1]
+
+        markup = CachedInlineKeyboardMarkup(builder(*args))
+        with self._lock:
+            if entry is not None:
+                logging.info(f"Данные клавиатуры {name}{list(args) if args else ''} изменились, клавиатура перестроена")
+            self._markups[key] = (fingerprint, markup)
+            self.builds += 1
+        return markup
+
+    def warm_up(self):
+        """Построение всех зарегистрированных клавиатур заранее"""
+        for name, (_, _, variants) in list(self._builders.items()):
+            for args in (variants() if variants else [()]):
+                self.get(name, *args)
+        logging.info(f"Подготовлено клавиатур: {len(self._markups)}")
+
+    def clear(self):
+        """Удаление всех построенных клавиатур"""
+        with self._lock:
+            self._markups.clear()
+
+    def stats(self):
+        """
+        Получение счетчиков реестра
+
+        Returns:
+            dict: количество клавиатур, обращений из кэша и построений
+        """
+        with self._lock:
+            return {'size': len(self._markups), 'hits': self.hits, 'builds': self.builds}
+
+# Глобальный реестр клавиатур
+keyboards = KeyboardRegistry()
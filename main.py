@@ -62,6 +62,8 @@ def check_and_migrate():
 if __name__ == "__main__":
     # Регистрируем обработчик сигнала прерывания (Ctrl+C)
     signal.signal(signal.SIGINT, signal_handler)
+    # SIGTERM приходит при перезапуске сервиса - останавливаемся так же, с сохранением состояния диалогов
+    signal.signal(signal.SIGTERM, signal_handler)
     
     # Инициализируем базу данных и запускаем миграцию если необходимо
     init_db()
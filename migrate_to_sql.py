@@ -1,202 +1,570 @@
-"""
-Скрипт для миграции данных из JSON файлов в SQL базу данных
-"""
-import json
-import logging
-import os
-from datetime import datetime
-from database import init_db, get_session, close_session, engine
-
-# Настройка логгирования
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
-logger = logging.getLogger(__name__)
-
-def migrate_users():
-    """
-    Миграция пользователей из JSON в базу данных
-    """
-    from models import User  # Импортируем здесь, чтобы избежать циклических импортов
-    
-    if not os.path.exists('users.json'):
-        logger.warning("Файл users.json не найден, миграция пользователей не требуется")
-        return []
-        
-    session = get_session()
-    users = []
-    
-    try:
-        with open('users.json', 'r', encoding='utf-8') as f:
-            users_data = json.load(f)
-            logger.info(f"Загружено {len(users_data)} записей пользователей из JSON")
-            
-            for user_data in users_data:
-                # Проверяем, существует ли пользователь в базе данных
-                user = session.query(User).filter_by(telegram_id=user_data['telegram_id']).first()
-                
-                if not user:
-                    # Создаем нового пользователя
-                    user = User(
-                        telegram_id=user_data['telegram_id'],
-                        username=user_data.get('username'),
-                        first_name=user_data.get('first_name'),
-                        last_name=user_data.get('last_name'),
-                        phone=user_data.get('phone')
-                    )
-                    
-                    # Преобразуем строку даты в объект datetime
-                    if 'created_at' in user_data:
-                        try:
-                            user.created_at = datetime.fromisoformat(user_data['created_at'])
-                        except (ValueError, TypeError):
-                            user.created_at = datetime.now()
-                    
-                    session.add(user)
-                    logger.info(f"Добавлен пользователь с telegram_id: {user.telegram_id}")
-                    users.append(user)
-                else:
-                    logger.info(f"Пользователь с telegram_id: {user.telegram_id} уже существует")
-                    users.append(user)
-            
-            session.commit()
-            logger.info(f"Миграция пользователей завершена успешно, добавлено {len(users)} пользователей")
-            
-    except Exception as e:
-        session.rollback()
-        logger.error(f"Ошибка при миграции пользователей: {e}")
-    finally:
-        close_session(session)
-    
-    return users
-
-def migrate_requests():
-    """
-    Миграция заявок из JSON в базу данных
-    """
-    from models import User, ServiceRequest, RequestStatus  # Импортируем здесь, чтобы избежать циклических импортов
-    
-    if not os.path.exists('requests.json'):
-        logger.warning("Файл requests.json не найден, миграция заявок не требуется")
-        return
-        
-    session = get_session()
-    
-    try:
-        with open('requests.json', 'r', encoding='utf-8') as f:
-            requests_data = json.load(f)
-            logger.info(f"Загружено {len(requests_data)} заявок из JSON")
-            
-            for req_data in requests_data:
-                # Проверяем, существует ли заявка в базе данных
-                request = session.query(ServiceRequest).filter_by(id=req_data['id']).first()
-                
-                if not request:
-                    # Создаем новую заявку
-                    request = ServiceRequest(
-                        user_id=req_data['user_id'],
-                        car_model=req_data['car_model'],
-                        license_plate=req_data['license_plate'],
-                        mileage=req_data['mileage'],
-                        requested_work=req_data['requested_work'],
-                        preferred_date=req_data['preferred_date'],
-                        preferred_time=req_data.get('preferred_time', ''),
-                        phone=req_data['phone'],
-                        real_name=req_data.get('real_name', None),
-                        real_surname=req_data.get('real_surname', None)
-                    )
-                    
-                    # Устанавливаем ID из JSON
-                    request.id = req_data['id']
-                    
-                    # Устанавливаем статус
-                    try:
-                        # Если статус уже строка, используем его напрямую
-                        if isinstance(req_data['status'], str):
-                            request.status = req_data['status']
-                        else:
-                            # Если это объект Enum, получаем его значение
-                            request.status = RequestStatus(req_data['status']).value
-                    except (ValueError, KeyError):
-                        request.status = RequestStatus.COMPLETED.value
-                    
-                    # Устанавливаем примечания администратора
-                    request.admin_notes = req_data.get('admin_notes', '')
-                    
-                    # Преобразуем строки дат в объекты datetime
-                    if 'created_at' in req_data:
-                        try:
-                            request.created_at = datetime.fromisoformat(req_data['created_at'])
-                        except (ValueError, TypeError):
-                            request.created_at = datetime.now()
-                    
-                    if 'updated_at' in req_data:
-                        try:
-                            request.updated_at = datetime.fromisoformat(req_data['updated_at'])
-                        except (ValueError, TypeError):
-                            request.updated_at = datetime.now()
-                    
-                    # Добавляем заявку в базу
-                    session.add(request)
-                    
-                    # Связываем с пользователем
-                    user = session.query(User).filter_by(telegram_id=request.user_id).first()
-                    if user:
-                        if request not in user.requests:
-                            user.requests.append(request)
-                    
-                    logger.info(f"Добавлена заявка с ID: {request.id}")
-                else:
-                    logger.info(f"Заявка с ID: {request.id} уже существует")
-            
-            session.commit()
-            logger.info("Миграция заявок завершена успешно")
-            
-    except Exception as e:
-        session.rollback()
-        logger.error(f"Ошибка при миграции заявок: {e}")
-    finally:
-        close_session(session)
-
-def create_backup():
-    """
-    Создание резервных копий JSON файлов перед миграцией
-    """
-    try:
-        if os.path.exists('users.json'):
-            with open('users.json', 'r', encoding='utf-8') as f:
-                with open('users.json.bak', 'w', encoding='utf-8') as backup:
-                    backup.write(f.read())
-            logger.info("Создана резервная копия users.json")
-        
-        if os.path.exists('requests.json'):
-            with open('requests.json', 'r', encoding='utf-8') as f:
-                with open('requests.json.bak', 'w', encoding='utf-8') as backup:
-                    backup.write(f.read())
-            logger.info("Создана резервная копия requests.json")
-    except Exception as e:
-        logger.error(f"Ошибка при создании резервных копий: {e}")
-
-def main():
-    """
-    Основная функция миграции
-    """
-    logger.info("Начинаем миграцию данных из JSON в SQL")
-    
-    # Создаем резервные копии файлов JSON
-    create_backup()
-    
-    # Инициализируем базу данных (создаем таблицы)
-    init_db()
-    
-    # Мигрируем пользователей
-    migrate_users()
-    
-    # Мигрируем заявки
-    migrate_requests()
-    
-    logger.info("Миграция данных из JSON в SQL завершена")
-
-if __name__ == "__main__":
-    main()
\ No newline at end of file
+"""
+Скрипт для миграции данных из JSON файлов в SQL базу данных
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import time
+from datetime import datetime
+from sqlalchemy import insert, select
+from database import init_db, get_session, close_session, engine
+from json_stream import iter_json_array
+
+# Настройка логгирования
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+def migrate_users():
+    """
+    Миграция пользователей из JSON в базу данных
+    """
+    from models import User  # Импортируем здесь, чтобы избежать циклических импортов
+    
+    if not os.path.exists('users.json'):
+        logger.warning("Файл users.json не найден, миграция пользователей не требуется")
+        return []
+        
+    session = get_session()
+    users = []
+    
+    try:
+        # Файл читается потоково, без загрузки целиком в память
+        for user_data in _load_records('users.json'):
+            # Проверяем, существует ли пользователь в базе данных
+            user = session.query(User).filter_by(telegram_id=user_data['telegram_id']).first()
+            
+            if not user:
+                # Создаем нового пользователя
+                user = User(
+                    telegram_id=user_data['telegram_id'],
+                    username=user_data.get('username'),
+                    first_name=user_data.get('first_name'),
+                    last_name=user_data.get('last_name'),
+                    phone=user_data.get('phone')
+                )
+                
+                # Преобразуем строку даты в объект datetime
+                if 'created_at' in user_data:
+                    try:
+                        user.created_at = datetime.fromisoformat(user_data['created_at'])
+                    except (ValueError, TypeError):
+                        user.created_at = datetime.now()
+                
+                session.add(user)
+                logger.info(f"Добавлен пользователь с telegram_id: {user.telegram_id}")
+                users.append(user)
+            else:
+                logger.info(f"Пользователь с telegram_id: {user.telegram_id} уже существует")
+                users.append(user)
+        
+        session.commit()
+        logger.info(f"Миграция пользователей завершена успешно, добавлено {len(users)} пользователей")
+        
+    except Exception as e:
+        session.rollback()
+        logger.error(f"Ошибка при миграции пользователей: {e}")
+    finally:
+        close_session(session)
+    
+    return users
+
+def migrate_requests():
+    """
+    Миграция заявок из JSON в базу данных
+    """
+    from models import ServiceRequest, RequestStatus, legacy_request_code  # Импортируем здесь, чтобы избежать циклических импортов
+    
+    if not os.path.exists('requests.json'):
+        logger.warning("Файл requests.json не найден, миграция заявок не требуется")
+        return
+        
+    session = get_session()
+    
+    try:
+        # Файл читается потоково, без загрузки целиком в память
+        for req_data in _load_records('requests.json'):
+            # Проверяем, существует ли заявка в базе данных (UUID из JSON хранится в legacy_id)
+            legacy_id = req_data['id']
+            candidates = session.query(ServiceRequest).filter(
+                ServiceRequest.code.in_((legacy_id[:8], legacy_id))
+            ).all()
+            request = next((candidate for candidate in candidates if candidate.legacy_id == legacy_id), None)
+            
+            if not request:
+                # Создаем новую заявку
+                request = ServiceRequest(
+                    user_id=req_data['user_id'],
+                    car_model=req_data['car_model'],
+                    license_plate=req_data['license_plate'],
+                    mileage=req_data['mileage'],
+                    requested_work=req_data['requested_work'],
+                    preferred_date=req_data['preferred_date'],
+                    preferred_time=req_data.get('preferred_time', ''),
+                    phone=req_data['phone'],
+                    real_name=req_data.get('real_name', None),
+                    real_surname=req_data.get('real_surname', None)
+                )
+                
+                # Сохраняем UUID из JSON; числовой ID назначит база данных
+                request.legacy_id = legacy_id
+                request.code = legacy_request_code(legacy_id, {candidate.code for candidate in candidates})
+                
+                # Устанавливаем статус
+                try:
+                    # Если статус уже строка, используем его напрямую
+                    if isinstance(req_data['status'], str):
+                        request.status = req_data['status']
+                    else:
+                        # Если это объект Enum, получаем его значение
+                        request.status = RequestStatus(req_data['status']).value
+                except (ValueError, KeyError):
+                    request.status = RequestStatus.COMPLETED.value
+                
+                # Устанавливаем примечания администратора
+                request.admin_notes = req_data.get('admin_notes', '')
+                
+                # Преобразуем строки дат в объекты datetime
+                if 'created_at' in req_data:
+                    try:
+                        request.created_at = datetime.fromisoformat(req_data['created_at'])
+                    except (ValueError, TypeError):
+                        request.created_at = datetime.now()
+                
+                if 'updated_at' in req_data:
+                    try:
+                        request.updated_at = datetime.fromisoformat(req_data['updated_at'])
+                    except (ValueError, TypeError):
+                        request.updated_at = datetime.now()
+                
+                # Добавляем заявку в базу (владелец задается полем user_id)
+                session.add(request)
+                
+                logger.info(f"Добавлена заявка с ID: {legacy_id}")
+            else:
+                logger.info(f"Заявка с ID: {legacy_id} уже существует")
+        
+        session.commit()
+        logger.info("Миграция заявок завершена успешно")
+        
+    except Exception as e:
+        session.rollback()
+        logger.error(f"Ошибка при миграции заявок: {e}")
+    finally:
+        close_session(session)
+
+# Размер пакета для массовой вставки по умолчанию
+DEFAULT_BATCH_SIZE = 1000
+
+def _parse_datetime(value):
+    """
+    Преобразование строки ISO 8601 в datetime (текущее время при ошибке)
+    """
+    try:
+        return datetime.fromisoformat(value)
+    except (ValueError, TypeError):
+        return datetime.now()
+
+def _normalize_status(req_data):
+    """
+    Приведение статуса заявки из JSON к строковому значению RequestStatus
+    """
+    from models import RequestStatus  # Импортируем здесь, чтобы избежать циклических импортов
+    
+    try:
+        # Если статус уже строка, используем его напрямую
+        if isinstance(req_data['status'], str):
+            return req_data['status']
+        # Если это объект Enum, получаем его значение
+        return RequestStatus(req_data['status']).value
+    except (ValueError, KeyError):
+        return RequestStatus.COMPLETED.value
+
+def _user_row(user_data):
+    """
+    Преобразование записи пользователя из JSON в строку таблицы users
+    """
+    now = datetime.now()
+    return {
+        'telegram_id': user_data['telegram_id'],
+        'username': user_data.get('username'),
+        'first_name': user_data.get('first_name'),
+        'last_name': user_data.get('last_name'),
+        'phone': user_data.get('phone'),
+        'created_at': _parse_datetime(user_data['created_at']) if 'created_at' in user_data else now,
+    }
+
+def _request_row(req_data, code):
+    """
+    Преобразование записи заявки из JSON в строку таблицы service_requests
+    
+    Числовой ID назначает база данных, UUID из JSON сохраняется в legacy_id.
+    """
+    from models import parse_visit_date, parse_visit_time  # Импортируем здесь, чтобы избежать циклических импортов
+    
+    now = datetime.now()
+    return {
+        'code': code,
+        'legacy_id': req_data['id'],
+        'user_id': req_data['user_id'],
+        'car_model': req_data['car_model'],
+        'license_plate': req_data['license_plate'],
+        'mileage': req_data['mileage'],
+        'requested_work': req_data['requested_work'],
+        'preferred_date': req_data['preferred_date'],
+        'preferred_time': req_data.get('preferred_time', ''),
+        'visit_date': parse_visit_date(req_data['preferred_date']),
+        'visit_time': parse_visit_time(req_data.get('preferred_time')),
+        'phone': req_data['phone'],
+        'real_name': req_data.get('real_name', None),
+        'real_surname': req_data.get('real_surname', None),
+        'status': _normalize_status(req_data),
+        'admin_notes': req_data.get('admin_notes', ''),
+        'created_at': _parse_datetime(req_data['created_at']) if 'created_at' in req_data else now,
+        'updated_at': _parse_datetime(req_data['updated_at']) if 'updated_at' in req_data else now,
+    }
+
+def _load_records(path):
+    """
+    Потоковое чтение записей из JSON-файла с массивом объектов
+    """
+    for record, _ in iter_json_array(path):
+        yield record
+
+class _Checkpoint:
+    """
+    Контрольная точка массовой миграции в файле <путь>.checkpoint
+    
+    Хранит байтовое смещение после последней закоммиченной записи и ее номер,
+    а также размер и время изменения исходного файла, чтобы не продолжить
+    миграцию по контрольной точке от другого файла.
+    """
+    
+    def __init__(self, path):
+        self.source_path = path
+        self.path = f"{path}.checkpoint"
+        self.offset = 0
+        self.index = 0
+    
+    def _source_signature(self):
+        stat = os.stat(self.source_path)
+        return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    
+    def load(self):
+        """
+        Загрузка контрольной точки
+        
+        Returns:
+            bool: True, если найдена контрольная точка для текущего исходного файла
+        """
+        if not os.path.exists(self.path):
+            return False
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Не удалось прочитать контрольную точку {self.path}: {e}")
+            return False
+        if data.get('source') != self._source_signature():
+            logger.warning(f"Файл {self.source_path} изменился после контрольной точки, миграция начнется заново")
+            return False
+        self.offset = data['offset']
+        self.index = data['index']
+        return True
+    
+    def save(self, offset, index):
+        """
+        Атомарная запись контрольной точки после коммита пакета
+        
+        Args:
+            offset: байтовое смещение после последней обработанной записи
+            index: количество обработанных записей с начала файла
+        """
+        self.offset = offset
+        self.index = index
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'offset': offset, 'index': index, 'source': self._source_signature()}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+    
+    def remove(self):
+        """Удаление контрольной точки"""
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+def _iter_with_checkpoint(path, resume):
+    """
+    Потоковое чтение записей с продолжением от контрольной точки
+    
+    Args:
+        path: путь к JSON-файлу
+        resume: продолжить с контрольной точки, если она есть; иначе начать заново
+        
+    Returns:
+        tuple: (контрольная точка, итератор пар (запись, смещение после записи))
+    """
+    checkpoint = _Checkpoint(path)
+    if resume and checkpoint.load():
+        logger.info(f"Продолжаем миграцию {path} с записи {checkpoint.index} (смещение {checkpoint.offset})")
+    else:
+        checkpoint.remove()
+        checkpoint.offset = 0
+        checkpoint.index = 0
+    return checkpoint, iter_json_array(path, offset=checkpoint.offset)
+
+class _Progress:
+    """
+    Журналирование хода массовой миграции и ее пропускной способности
+    """
+    
+    def __init__(self, name, start_index=0):
+        self.name = name
+        self.started = time.perf_counter()
+        self.start_index = start_index
+        self.processed = 0
+        self.inserted = 0
+    
+    def batch_done(self, processed, inserted):
+        self.processed += processed
+        self.inserted += inserted
+        elapsed = time.perf_counter() - self.started
+        rate = self.processed / elapsed if elapsed > 0 else 0.0
+        logger.info(
+            f"{self.name}: обработано {self.start_index + self.processed}, добавлено {self.inserted} "
+            f"({rate:.0f} записей/с)"
+        )
+    
+    def finish(self):
+        elapsed = time.perf_counter() - self.started
+        rate = self.processed / elapsed if elapsed > 0 else 0.0
+        logger.info(
+            f"{self.name}: миграция завершена за {elapsed:.1f} с, обработано {self.processed}, "
+            f"добавлено {self.inserted} ({rate:.0f} записей/с)"
+        )
+
+def _insert_users_batch(session, rows):
+    """
+    Массовая вставка пакета пользователей в одной транзакции
+    """
+    from models import User  # Импортируем здесь, чтобы избежать циклических импортов
+    
+    if rows:
+        session.execute(insert(User.__table__), rows)
+    session.commit()
+
+def _insert_requests_batch(session, rows):
+    """
+    Массовая вставка пакета заявок в одной транзакции
+    """
+    from models import ServiceRequest  # Импортируем здесь, чтобы избежать циклических импортов
+    
+    if rows:
+        session.execute(insert(ServiceRequest.__table__), rows)
+    session.commit()
+
+def migrate_users_bulk(path='users.json', batch_size=DEFAULT_BATCH_SIZE, resume=True):
+    """
+    Массовая миграция пользователей из JSON в базу данных
+    
+    Существующие ID загружаются одним запросом, новые пользователи
+    вставляются пакетами через executemany, каждый пакет - отдельная транзакция.
+    После каждого пакета сохраняется контрольная точка, поэтому прерванную
+    миграцию можно продолжить; уже вставленные записи пропускаются.
+    
+    Args:
+        path: путь к JSON-файлу с пользователями
+        batch_size: количество записей в одном пакете
+        resume: продолжить с контрольной точки, если она есть
+        
+    Returns:
+        int: количество добавленных пользователей
+    """
+    from models import User  # Импортируем здесь, чтобы избежать циклических импортов
+    
+    if not os.path.exists(path):
+        logger.warning(f"Файл {path} не найден, миграция пользователей не требуется")
+        return 0
+    
+    session = get_session()
+    checkpoint, records = _iter_with_checkpoint(path, resume)
+    progress = _Progress("Пользователи", checkpoint.index)
+    
+    try:
+        existing_ids = set(session.execute(select(User.telegram_id)).scalars())
+        logger.info(f"В базе уже есть {len(existing_ids)} пользователей")
+        
+        batch = []
+        processed = 0
+        offset = checkpoint.offset
+        for user_data, offset in records:
+            processed += 1
+            telegram_id = user_data['telegram_id']
+            if telegram_id not in existing_ids:
+                existing_ids.add(telegram_id)
+                batch.append(_user_row(user_data))
+            
+            if processed >= batch_size:
+                _insert_users_batch(session, batch)
+                checkpoint.save(offset, checkpoint.index + processed)
+                progress.batch_done(processed, len(batch))
+                batch = []
+                processed = 0
+        
+        _insert_users_batch(session, batch)
+        progress.batch_done(processed, len(batch))
+        checkpoint.remove()
+        progress.finish()
+    except Exception as e:
+        session.rollback()
+        logger.error(f"Ошибка при массовой миграции пользователей: {e}")
+    finally:
+        close_session(session)
+    
+    return progress.inserted
+
+def migrate_requests_bulk(path='requests.json', batch_size=DEFAULT_BATCH_SIZE, resume=True):
+    """
+    Массовая миграция заявок из JSON в базу данных
+    
+    Существующие ID заявок загружаются одним запросом, заявки вставляются
+    пакетами через executemany, каждый пакет - отдельная транзакция. После каждого пакета сохраняется
+    контрольная точка, поэтому прерванную миграцию можно продолжить.
+    
+    Args:
+        path: путь к JSON-файлу с заявками
+        batch_size: количество записей в одном пакете
+        resume: продолжить с контрольной точки, если она есть
+        
+    Returns:
+        int: количество добавленных заявок
+    """
+    from models import ServiceRequest, legacy_request_code  # Импортируем здесь, чтобы избежать циклических импортов
+    
+    if not os.path.exists(path):
+        logger.warning(f"Файл {path} не найден, миграция заявок не требуется")
+        return 0
+    
+    session = get_session()
+    checkpoint, records = _iter_with_checkpoint(path, resume)
+    progress = _Progress("Заявки", checkpoint.index)
+    
+    try:
+        existing_ids = set(session.execute(
+            select(ServiceRequest.legacy_id).where(ServiceRequest.legacy_id.is_not(None))
+        ).scalars())
+        codes = set(session.execute(select(ServiceRequest.code)).scalars())
+        logger.info(f"В базе уже есть {len(codes)} заявок, из них перенесенных из JSON - {len(existing_ids)}")
+        
+        batch = []
+        processed = 0
+        offset = checkpoint.offset
+        for req_data, offset in records:
+            processed += 1
+            request_id = req_data['id']
+            if request_id not in existing_ids:
+                existing_ids.add(request_id)
+                code = legacy_request_code(request_id, codes)
+                codes.add(code)
+                batch.append(_request_row(req_data, code))
+            
+            if processed >= batch_size:
+                _insert_requests_batch(session, batch)
+                checkpoint.save(offset, checkpoint.index + processed)
+                progress.batch_done(processed, len(batch))
+                batch = []
+                processed = 0
+        
+        _insert_requests_batch(session, batch)
+        progress.batch_done(processed, len(batch))
+        checkpoint.remove()
+        progress.finish()
+    except Exception as e:
+        session.rollback()
+        logger.error(f"Ошибка при массовой миграции заявок: {e}")
+    finally:
+        close_session(session)
+    
+    return progress.inserted
+
+def create_backup():
+    """
+    Создание резервных копий JSON файлов перед миграцией
+    
+    Файлы копируются без чтения в память целиком: shutil.copyfile использует
+    копирование средствами ядра (sendfile/copy_file_range), где это доступно.
+    """
+    try:
+        for path in ('users.json', 'requests.json'):
+            if os.path.exists(path):
+                shutil.copyfile(path, f"{path}.bak")
+                logger.info(f"Создана резервная копия {path}")
+    except Exception as e:
+        logger.error(f"Ошибка при создании резервных копий: {e}")
+
+def main(bulk=False, batch_size=DEFAULT_BATCH_SIZE, resume=True):
+    """
+    Основная функция миграции
+    
+    Args:
+        bulk: использовать массовую пакетную вставку вместо построчной
+        batch_size: размер пакета для массовой вставки
+        resume: в массовом режиме продолжить с контрольных точек, если они есть
+    """
+    logger.info("Начинаем миграцию данных из JSON в SQL")
+    
+    # Создаем резервные копии файлов JSON
+    create_backup()
+    
+    # Инициализируем базу данных (создаем таблицы)
+    init_db()
+    
+    if bulk:
+        # Массовая миграция пакетами
+        migrate_users_bulk(batch_size=batch_size, resume=resume)
+        migrate_requests_bulk(batch_size=batch_size, resume=resume)
+    else:
+        # Мигрируем пользователей
+        migrate_users()
+        
+        # Мигрируем заявки
+        migrate_requests()
+    
+    logger.info("Миграция данных из JSON в SQL завершена")
+
+def parse_args(argv=None):
+    """
+    Разбор аргументов командной строки
+    """
+    parser = argparse.ArgumentParser(description="Миграция данных из JSON файлов в SQL базу данных")
+    parser.add_argument(
+        "--bulk", action="store_true",
+        help="массовая пакетная вставка (рекомендуется для больших файлов)"
+    )
+    parser.add_argument(
+        "--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+        help=f"размер пакета для массовой вставки (по умолчанию {DEFAULT_BATCH_SIZE})"
+    )
+    restart_group = parser.add_mutually_exclusive_group()
+    restart_group.add_argument(
+        "--resume", dest="resume", action="store_true", default=None,
+        help="продолжить прерванную миграцию с контрольной точки (по умолчанию; включает --bulk)"
+    )
+    restart_group.add_argument(
+        "--restart", dest="resume", action="store_false",
+        help="удалить контрольные точки и начать миграцию заново (включает --bulk)"
+    )
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args()
+    main(
+        bulk=args.bulk or args.resume is not None,
+        batch_size=args.batch_size,
+        resume=args.resume is not False
+    )
\ No newline at end of file
@@ -1,9 +1,9 @@
 from enum import Enum
 from datetime import datetime
 import uuid
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Enum as SQLEnum, Table
+from sqlalchemy import Column, Integer, String, Float, Date, DateTime, Time, ForeignKey, Enum as SQLEnum, Index, func, inspect, select
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, column_property
 
 Base = declarative_base()
 
@@ -13,13 +13,57 @@ class RequestStatus(Enum):
     REJECTED = "rejected"
     COMPLETED = "completed"
 
-# Таблица связи для отношения многие-ко-многим между пользователями и заявками
-user_requests = Table(
-    'user_requests',
-    Base.metadata,
-    Column('user_id', Integer, ForeignKey('users.telegram_id')),
-    Column('request_id', String, ForeignKey('service_requests.id'))
-)
+# Форматы даты и времени визита, которые клиент выбирает кнопками
+VISIT_DATE_FORMAT = "%d.%m.%Y"
+VISIT_TIME_FORMAT = "%H:%M"
+
+def parse_visit_date(value):
+    """
+    Дата визита из строки ДД.ММ.ГГГГ
+    
+    Returns:
+        datetime.date или None, если строка - свободный текст ("В ближайшее время")
+    """
+    try:
+        return datetime.strptime(value, VISIT_DATE_FORMAT).date()
+    except (TypeError, ValueError):
+        return None
+
+def new_request_code():
+    """
+    Короткий код заявки, который видят клиент и администратор (#1a2b3c4d)
+    
+    Код из одних цифр не выдается, чтобы его нельзя было спутать с числовым ID.
+    """
+    while True:
+        code = uuid.uuid4().hex[:8]
+        if not code.isdigit():
+            return code
+
+def legacy_request_code(legacy_id, taken_codes):
+    """
+    Код заявки, созданной до перехода на числовые ID: первые 8 символов ее
+    UUID, как номер заявки в старых сообщениях, или весь UUID, если такой
+    код уже занят
+    
+    Args:
+        legacy_id: UUID заявки
+        taken_codes: коды, уже занятые другими заявками
+    """
+    code = legacy_id[:8]
+    return legacy_id if code in taken_codes else code
+
+def parse_visit_time(value):
+    """
+    Время визита из строки ЧЧ:ММ
+    
+    Returns:
+        datetime.time или None, если строка - свободный текст ("Любое время")
+    """
+    try:
+        return datetime.strptime(value, VISIT_TIME_FORMAT).time()
+    except (TypeError, ValueError):
+        return None
 
 class User(Base):
     __tablename__ = 'users'
@@ -31,8 +75,8 @@ class User(Base):
     phone = Column(String, nullable=True)
     created_at = Column(DateTime, default=datetime.now)
     
-    # Отношение с заявками
-    requests = relationship("ServiceRequest", secondary=user_requests, back_populates="users")
+    # Заявки пользователя (по внешнему ключу service_requests.user_id)
+    requests = relationship("ServiceRequest", back_populates="user")
     
     def __init__(self, telegram_id, username=None, first_name=None, last_name=None, phone=None):
         self.telegram_id = telegram_id
@@ -43,27 +87,41 @@ class User(Base):
         self.created_at = datetime.now()
         
     def to_dict(self):
-        return {
+        data = {
             'telegram_id': self.telegram_id,
             'username': self.username,
             'first_name': self.first_name,
             'last_name': self.last_name,
             'phone': self.phone,
-            'created_at': self.created_at.isoformat(),
-            'request_count': len(self.requests)
+            'created_at': self.created_at.isoformat()
         }
+        # У объекта вне сессии (созданного в коде или уже отсоединенного) количество
+        # заявок не загружено и не может быть загружено - ключ не добавляется
+        state = inspect(self)
+        if state.session is not None or 'request_count' not in state.unloaded:
+            data['request_count'] = self.request_count
+        return data
         
 class ServiceRequest(Base):
     __tablename__ = 'service_requests'
     
-    id = Column(String, primary_key=True)
+    # Числовой ключ: короче UUID в индексах и в callback_data кнопок
+    id = Column(Integer, primary_key=True)
+    # Короткий код для показа людям
+    code = Column(String(36), nullable=False)
+    # UUID заявок, созданных до перехода на числовой ключ (для старых кнопок и повторной миграции)
+    legacy_id = Column(String, nullable=True, index=True)
     user_id = Column(Integer, ForeignKey('users.telegram_id'))
     car_model = Column(String, nullable=False)
     license_plate = Column(String, nullable=False)
     mileage = Column(Float, nullable=True)
     requested_work = Column(String, nullable=False)
+    # Дата и время в том виде, в котором их выбрал или ввел клиент (может быть свободный текст)
     preferred_date = Column(String, nullable=False)
     preferred_time = Column(String, nullable=True)
+    # Те же дата и время в виде значений для выборок по диапазону; None для свободного текста
+    visit_date = Column(Date, nullable=True)
+    visit_time = Column(Time, nullable=True)
     phone = Column(String, nullable=False)
     real_name = Column(String, nullable=True)
     real_surname = Column(String, nullable=True)
@@ -72,12 +130,30 @@ class ServiceRequest(Base):
     updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
     admin_notes = Column(String, nullable=True)
     
-    # Отношение с пользователями
-    users = relationship("User", secondary=user_requests, back_populates="requests")
+    # Владелец заявки
+    user = relationship("User", back_populates="requests")
+    
+    # Индексы под основные сценарии чтения: списки по статусу и типу работ
+    # для админ-панели и заявки конкретного пользователя, новейшие сначала
+    __table_args__ = (
+        Index('ix_service_requests_status_created_at', 'status', 'created_at', 'id'),
+        Index('ix_service_requests_user_id_created_at', 'user_id', 'created_at'),
+        Index('ix_service_requests_work_status_created_at', 'requested_work', 'status', 'created_at', 'id'),
+        # Расписание по диапазону дат и подсчет занятых мест на дату записи
+        # (статусов в фильтре мало, поэтому статус идет первым)
+        Index('ix_service_requests_status_visit_date', 'status', 'visit_date'),
+        # Поиск заявки по коду
+        Index('ix_service_requests_code', 'code', unique=True),
+        # ID удаленных заявок не выдаются повторно, чтобы старые кнопки не открыли чужую заявку
+        {'sqlite_autoincrement': True},
+    )
     
     def __init__(self, user_id, car_model, license_plate, mileage, 
                  requested_work, preferred_date, preferred_time, phone, real_name=None, real_surname=None):
-        self.id = str(uuid.uuid4())
+        # ID назначает база данных при добавлении заявки
+        self.id = None
+        self.code = new_request_code()
+        self.legacy_id = None
         self.user_id = user_id
         self.car_model = car_model
         self.license_plate = license_plate
@@ -85,6 +161,8 @@ class ServiceRequest(Base):
         self.requested_work = requested_work
         self.preferred_date = preferred_date
         self.preferred_time = preferred_time
+        self.visit_date = parse_visit_date(preferred_date)
+        self.visit_time = parse_visit_time(preferred_time)
         self.phone = phone
         self.real_name = real_name
         self.real_surname = real_surname
@@ -111,6 +189,7 @@ class ServiceRequest(Base):
     def to_dict(self):
         return {
             'id': self.id,
+            'code': self.code,
             'user_id': self.user_id,
             'car_model': self.car_model,
             'license_plate': self.license_plate,
@@ -118,6 +197,8 @@ class ServiceRequest(Base):
             'requested_work': self.requested_work,
             'preferred_date': self.preferred_date,
             'preferred_time': self.preferred_time,
+            'visit_date': self.visit_date.isoformat() if self.visit_date else None,
+            'visit_time': self.visit_time.strftime(VISIT_TIME_FORMAT) if self.visit_time else None,
             'phone': self.phone,
             'real_name': self.real_name,
             'real_surname': self.real_surname, 
@@ -126,3 +207,26 @@ class ServiceRequest(Base):
             'updated_at': self.updated_at.isoformat(),
             'admin_notes': self.admin_notes
         }
+
+# Количество заявок пользователя считается в SQL (по индексу user_id), без
+# загрузки самих заявок; deferred - загружается только при обращении
+User.request_count = column_property(
+    select(func.count(ServiceRequest.id))
+    .where(ServiceRequest.user_id == User.telegram_id)
+    .correlate_except(ServiceRequest)
+    .scalar_subquery(),
+    deferred=True
+)
+
+class DayCapacity(Base):
+    """Количество мест для записи на конкретную дату, заданное администратором"""
+    __tablename__ = 'day_capacity'
+    
+    date = Column(Date, primary_key=True)
+    capacity = Column(Integer, nullable=False)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+    
+    def __init__(self, date, capacity):
+        self.date = date
+        self.capacity = capacity
+        self.updated_at = datetime.now()
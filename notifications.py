@@ -0,0 +1,246 @@
+"""
+Очередь исходящих уведомлений с собственным пулом потоков
+
+Обработчики Telegram ставят сообщения в очередь и сразу возвращаются, а
+отправкой занимаются отдельные потоки. Отправка учитывает ограничения
+Telegram (около 30 сообщений в секунду всего и 1 сообщение в секунду в один
+чат) и повторяет попытки при RetryAfter и сетевых ошибках.
+"""
+import logging
+import queue
+import threading
+import time
+from telegram.error import BadRequest, NetworkError, RetryAfter, TimedOut, Unauthorized
+from config import NOTIFY_WORKERS, NOTIFY_GLOBAL_RATE, NOTIFY_CHAT_INTERVAL
+
+RETRY_AFTER_STOP_ERROR = "очередь уведомлений остановлена до повторной отправки"
+
+class _Notification:
+    """
+    Сообщение, ожидающее отправки
+    """
+    __slots__ = ('bot', 'chat_id', 'text', 'kwargs', 'on_failure', 'attempt', 'enqueued_at')
+
+    def __init__(self, bot, chat_id, text, kwargs, on_failure):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.text = text
+        self.kwargs = kwargs
+        self.on_failure = on_failure
+        self.attempt = 0
+        self.enqueued_at = time.monotonic()
+
+class NotificationDispatcher:
+    """
+    Диспетчер исходящих уведомлений
+    """
+
+    def __init__(self, workers=2, global_rate=30.0, per_chat_interval=1.0,
+                 max_attempts=5, base_backoff=1.0):
+        """
+        Инициализация диспетчера
+
+        Args:
+            workers: количество потоков отправки
+            global_rate: максимальное количество сообщений в секунду для всего бота
+            per_chat_interval: минимальный интервал между сообщениями в один чат, в секундах
+            max_attempts: максимальное количество попыток отправки одного сообщения
+            base_backoff: начальная задержка повтора при сетевой ошибке, в секундах
+        """
+        self.workers = workers
+        self.global_rate = global_rate
+        self.per_chat_interval = per_chat_interval
+        self.max_attempts = max_attempts
+        self.base_backoff = base_backoff
+
+        self._queue = queue.Queue()
+        self._threads = []
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()
+        # Ближайшее время (time.monotonic), когда можно отправить следующее сообщение
+        self._global_next = 0.0
+        self._chat_next = {}
+        # Сообщения, ожидающие повтора, и их таймеры
+        self._pending_retries = {}
+
+        self._stats = {
+            'enqueued': 0,
+            'sent': 0,
+            'retried': 0,
+            'failed': 0,
+            'total_delivery_seconds': 0.0,
+        }
+
+    @property
+    def running(self):
+        return bool(self._threads)
+
+    def start(self):
+        """Запуск потоков отправки (повторный вызов ничего не делает)"""
+        with self._lock:
+            if self._threads:
+                return
+            self._stop_event.clear()
+            for i in range(self.workers):
+                thread = threading.Thread(
+                    target=self._worker, name=f"notification_worker_{i}", daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+        logging.info(f"Очередь уведомлений запущена ({self.workers} потоков)")
+
+    def stop(self, timeout=10.0):
+        """
+        Остановка потоков отправки после отправки уже поставленных сообщений
+
+        Сообщения, ожидающие повтора, не отправляются: для них вызывается on_failure.
+
+        Args:
+            timeout: максимальное время ожидания каждого потока, в секундах
+        """
+        with self._lock:
+            threads = self._threads
+            self._threads = []
+        if not threads:
+            return
+        for _ in threads:
+            self._queue.put(None)
+        for thread in threads:
+            thread.join(timeout)
+        self._stop_event.set()
+        with self._lock:
+            pending = self._pending_retries
+            self._pending_retries = {}
+        for notification, timer in pending.items():
+            timer.cancel()
+            self._fail(notification, RuntimeError(RETRY_AFTER_STOP_ERROR))
+        logging.info("Очередь уведомлений остановлена")
+
+    def send_message(self, bot, chat_id, text, on_failure=None, **kwargs):
+        """
+        Постановка сообщения в очередь на отправку
+
+        Args:
+            bot: экземпляр telegram.Bot, через который отправляется сообщение
+            chat_id: ID чата получателя
+            text: текст сообщения
+            on_failure: функция, вызываемая с исключением, если сообщение
+                        не удалось отправить после всех попыток
+            **kwargs: дополнительные параметры Bot.send_message (например, reply_markup)
+        """
+        if not self.running:
+            self.start()
+        with self._lock:
+            self._stats['enqueued'] += 1
+        self._queue.put(_Notification(bot, chat_id, text, kwargs, on_failure))
+
+    def _reserve_slot(self, chat_id):
+        """
+        Резервирование времени отправки с учетом общего и поштучного ограничений
+
+        Returns:
+            float: сколько секунд нужно подождать перед отправкой
+        """
+        with self._lock:
+            now = time.monotonic()
+            send_at = max(now, self._global_next, self._chat_next.get(chat_id, 0.0))
+            self._global_next = send_at + 1.0 / self.global_rate
+            self._chat_next[chat_id] = send_at + self.per_chat_interval
+
+            # Не храним ограничения для чатов, в которые давно ничего не отправлялось
+            if len(self._chat_next) > 10000:
+                self._chat_next = {
+                    chat: next_time for chat, next_time in self._chat_next.items() if next_time > now
+                }
+            return send_at - now
+
+    def _retry_later(self, notification, delay):
+        """Повторная постановка сообщения в очередь через delay секунд"""
+        timer = threading.Timer(delay, self._requeue, args=(notification,))
+        timer.daemon = True
+        with self._lock:
+            self._stats['retried'] += 1
+            self._pending_retries[notification] = timer
+        timer.start()
+
+    def _requeue(self, notification):
+        """Возврат сообщения в очередь по таймеру повтора"""
+        with self._lock:
+            timer = self._pending_retries.pop(notification, None)
+            stopped = not self._threads
+        if timer is None:
+            # Повтор отменен при остановке, on_failure уже вызван
+            return
+        if stopped:
+            self._fail(notification, RuntimeError(RETRY_AFTER_STOP_ERROR))
+        else:
+            self._queue.put(notification)
+
+    def _fail(self, notification, error):
+        """Окончательный отказ в отправке сообщения"""
+        with self._lock:
+            self._stats['failed'] += 1
+        logging.error(f"Не удалось отправить уведомление в чат {notification.chat_id}: {error}")
+        if notification.on_failure:
+            try:
+                notification.on_failure(error)
+            except Exception as e:
+                logging.error(f"Ошибка в обработчике неудачной отправки уведомления: {e}")
+
+    def _worker(self):
+        while True:
+            notification = self._queue.get()
+            if notification is None:
+                return
+
+            delay = self._reserve_slot(notification.chat_id)
+            if delay > 0:
+                self._stop_event.wait(delay)
+
+            notification.attempt += 1
+            try:
+                notification.bot.send_message(
+                    chat_id=notification.chat_id, text=notification.text, **notification.kwargs
+                )
+            except RetryAfter as e:
+                if notification.attempt >= self.max_attempts:
+                    self._fail(notification, e)
+                else:
+                    logging.warning(f"Превышен лимит Telegram, повтор через {e.retry_after} с")
+                    self._retry_later(notification, float(e.retry_after))
+            except (BadRequest, Unauthorized) as e:
+                # Ошибки в самом запросе или заблокированный бот - повтор не поможет
+                self._fail(notification, e)
+            except (TimedOut, NetworkError) as e:
+                if notification.attempt >= self.max_attempts:
+                    self._fail(notification, e)
+                else:
+                    self._retry_later(notification, self.base_backoff * 2 ** (notification.attempt - 1))
+            except Exception as e:
+                self._fail(notification, e)
+            else:
+                with self._lock:
+                    self._stats['sent'] += 1
+                    self._stats['total_delivery_seconds'] += time.monotonic() - notification.enqueued_at
+
+    def stats(self):
+        """
+        Получение счетчиков очереди уведомлений
+
+        Returns:
+            dict: количество поставленных, отправленных, повторенных и
+                  неотправленных сообщений, длина очереди и среднее время доставки
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        total = stats.pop('total_delivery_seconds')
+        stats['queued'] = self._queue.qsize()
+        stats['avg_delivery_seconds'] = round(total / stats['sent'], 3) if stats['sent'] else 0.0
+        return stats
+
+# Глобальный экземпляр очереди уведомлений
+notifier = NotificationDispatcher(
+    workers=NOTIFY_WORKERS,
+    global_rate=NOTIFY_GLOBAL_RATE,
+    per_chat_interval=NOTIFY_CHAT_INTERVAL
+)
@@ -0,0 +1,157 @@
+"""
+Сохранение состояния диалогов между перезапусками бота
+
+Состояния ConversationHandler и context.user_data хранятся в памяти и
+записываются в pickle-файл не на каждое обновление, а периодически (задача
+JobQueue) и при остановке бота. Файл перезаписывается только если данные
+изменились, запись атомарная (временный файл + os.replace), поэтому сбой во
+время записи не портит ранее сохраненное состояние.
+"""
+import logging
+import os
+import pickle
+import threading
+from telegram.ext import ConversationHandler, PicklePersistence
+from telegram.ext.utils.promise import Promise
+
+class CoalescingPicklePersistence(PicklePersistence):
+    """
+    PicklePersistence с отложенной записью
+
+    Хранит только состояния диалогов и user_data (chat_data, bot_data и
+    callback_data ботом не используются).
+    """
+
+    def __init__(self, filename):
+        """
+        Инициализация хранилища
+
+        Args:
+            filename: путь к файлу состояния
+        """
+        super().__init__(
+            filename,
+            store_user_data=True,
+            store_chat_data=False,
+            store_bot_data=False,
+            single_file=True,
+            on_flush=True
+        )
+        self._flush_lock = threading.Lock()
+        # Последнее записанное содержимое файла
+        self._last_dump = None
+        self.flush_count = 0
+        self.write_count = 0
+
+    def update_conversation(self, name, key, new_state):
+        # Завершенные диалоги удаляем, а не храним с состоянием None
+        if new_state is None:
+            if self.conversations and name in self.conversations:
+                self.conversations[name].pop(key, None)
+            return
+        super().update_conversation(name, key, new_state)
+
+    @staticmethod
+    def _resolved_state(state):
+        """
+        Состояние диалога без Promise
+
+        Пока асинхронный обработчик выполняется, состояние диалога хранится как
+        (предыдущее состояние, Promise), причем предыдущее состояние само может
+        быть такой парой (ConversationHandler передает в update_conversation
+        ((состояние, Promise), Promise)). Promise сохранить нельзя, поэтому
+        пары разворачиваются до результата завершенного обработчика или, если
+        он еще не завершен, до предыдущего состояния.
+        """
+        while isinstance(state, tuple) and len(state) == 2 and isinstance(state[1], Promise):
+            old_state, promise = state
+            if promise.done.is_set() and not promise.exception:
+                result = promise.result(timeout=0)
+                if result is not None:
+                    return result
+            state = old_state
+        return state
+
+    def _snapshot_conversations(self):
+        """Копия состояний диалогов, пригодная для pickle"""
+        conversations = {}
+        for name, states in (self.conversations or {}).items():
+            snapshot = {}
+            for key, state in list(states.items()):
+                state = self._resolved_state(state)
+                if state is None or state == ConversationHandler.END:
+                    continue
+                snapshot[key] = state
+            conversations[name] = snapshot
+        return conversations
+
+    def _dump_singlefile(self):
+        data = pickle.dumps({
+            'conversations': self._snapshot_conversations(),
+            'user_data': {user_id: data for user_id, data in (self.user_data or {}).items() if data},
+            'chat_data': {},
+            'bot_data': {},
+            'callback_data': None,
+        }, protocol=pickle.HIGHEST_PROTOCOL)
+
+        self.flush_count += 1
+        # Ничего не изменилось с прошлой записи - диск не трогаем
+        if data == self._last_dump:
+            return
+
+        temp_filename = f"{self.filename}.tmp"
+        with open(temp_filename, 'wb') as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_filename, self.filename)
+        self._last_dump = data
+        self.write_count += 1
+
+    def flush(self):
+        """Запись состояния в файл, если оно изменилось с прошлой записи"""
+        with self._flush_lock:
+            # user_data изменяется обработчиками в других потоках; если словарь
+            # изменился во время сериализации, запись повторится при следующем вызове
+            try:
+                self._dump_singlefile()
+            except RuntimeError as e:
+                logging.warning(f"Состояние диалогов изменилось во время сохранения, повтор позже: {e}")
+            except Exception as e:
+                logging.error(f"Ошибка при сохранении состояния диалогов в {self.filename}: {e}")
+
+def create_persistence(filename):
+    """
+    Создание хранилища состояния диалогов
+
+    Args:
+        filename: путь к файлу состояния (пустая строка - без сохранения)
+
+    Returns:
+        CoalescingPicklePersistence или None
+    """
+    if not filename:
+        return None
+    persistence = CoalescingPicklePersistence(filename)
+    # Загружаем файл сразу, чтобы поврежденный файл не мешал запуску бота
+    try:
+        persistence.get_conversations("")
+        persistence.get_user_data()
+    except TypeError as e:
+        logging.error(f"Не удалось прочитать состояние диалогов из {filename}, начинаем с пустого: {e}")
+        os.replace(filename, f"{filename}.broken")
+        persistence = CoalescingPicklePersistence(filename)
+    return persistence
+
+def schedule_flush(job_queue, persistence, interval):
+    """
+    Периодическая запись состояния диалогов
+
+    Args:
+        job_queue: JobQueue бота
+        persistence: хранилище состояния
+        interval: интервал записи, в секундах
+    """
+    job_queue.run_repeating(
+        lambda context: persistence.flush(), interval=interval, first=interval, name="persistence_flush"
+    )
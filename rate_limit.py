@@ -0,0 +1,198 @@
+"""
+Ограничение частоты запросов пользователей (защита от флуда)
+
+Middleware выполняется раньше всех остальных обработчиков и для каждого
+обновления списывает токен из корзины пользователя и корзины чата (алгоритм
+token bucket). Если токенов нет, обновление дальше не обрабатывается
+(DispatcherHandlerStop), поэтому частые нажатия кнопок одного клиента не
+занимают потоки диспетчера и соединения с базой данных.
+"""
+import logging
+import threading
+import time
+from telegram.ext import DispatcherHandlerStop
+from config import (
+    ADMIN_IDS, MILEAGE_ADMIN_ID, RATE_LIMIT_MODE, RATE_LIMIT_USER_RATE, RATE_LIMIT_USER_BURST,
+    RATE_LIMIT_CHAT_RATE, RATE_LIMIT_CHAT_BURST
+)
+
+class TokenBucketLimiter:
+    """
+    Набор корзин токенов, по одной на ключ (пользователя или чат)
+
+    Для каждого ключа хранится только кортеж (токены, время последнего
+    обновления). Корзина, которая успела заполниться полностью, ничем не
+    отличается от отсутствующей, поэтому такие записи удаляются при
+    превышении max_keys.
+    """
+
+    def __init__(self, rate, burst, max_keys=100000):
+        """
+        Инициализация
+
+        Args:
+            rate: скорость пополнения, токенов в секунду
+            burst: емкость корзины (сколько запросов можно сделать подряд)
+            max_keys: количество корзин, после которого выполняется очистка
+        """
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets = {}
+        self._lock = threading.Lock()
+        # Размер, при котором выполнится следующая очистка
+        self._prune_at = max_keys
+
+    def consume(self, key, now=None):
+        """
+        Списание одного токена
+
+        Args:
+            key: ключ корзины
+            now: текущее время (time.monotonic), по умолчанию - сейчас
+
+        Returns:
+            bool: True, если токен был и запрос можно обработать
+        """
+        if now is None:
+            now = time.monotonic()
+        with self._lock:
+            entry = self._buckets.get(key)
+            if entry is None:
+                tokens = self.burst
+            else:
+                tokens = min(self.burst, entry[0] + (now - entry[1]) * self.rate)
+            allowed = tokens >= 1.0
+            if allowed:
+                tokens -= 1.0
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self._prune_at:
+                self._prune(now)
+            return allowed
+
+    def _prune(self, now):
+        """Удаление полностью заполнившихся корзин (вызывается под блокировкой)"""
+        self._buckets = {
+            key: entry for key, entry in self._buckets.items()
+            if entry[0] + (now - entry[1]) * self.rate < self.burst
+        }
+        # Если активных корзин все еще много, следующая очистка - не раньше, чем их
+        # станет вдвое больше, чтобы очистка не выполнялась на каждом обновлении
+        self._prune_at = max(self.max_keys, 2 * len(self._buckets))
+
+    def __len__(self):
+        return len(self._buckets)
+
+class FloodProtection:
+    """
+    Middleware ограничения частоты обновлений от пользователей и чатов
+    """
+
+    def __init__(self, user_limiter, chat_limiter, mode="notify", exempt_ids=(), notify_interval=10.0):
+        """
+        Инициализация
+
+        Args:
+            user_limiter: корзины пользователей (TokenBucketLimiter)
+            chat_limiter: корзины чатов (TokenBucketLimiter)
+            mode: "notify" - один раз в notify_interval секунд просить
+                  пользователя подождать, "drop" - молча отбрасывать
+                  лишние обновления, "off" - не ограничивать
+            exempt_ids: ID пользователей без ограничений (администраторы)
+            notify_interval: минимальный интервал между предупреждениями
+                             одному пользователю, в секундах
+        """
+        self.user_limiter = user_limiter
+        self.chat_limiter = chat_limiter
+        self.mode = mode
+        self.exempt_ids = frozenset(exempt_ids)
+        self.notify_interval = notify_interval
+        self._lock = threading.Lock()
+        # Время последнего предупреждения пользователю (time.monotonic)
+        self._notified_at = {}
+        # Количество отброшенных обновлений по пользователям
+        self._limited_by_user = {}
+        self._stats = {'checked': 0, 'limited': 0, 'notified': 0}
+
+    @property
+    def enabled(self):
+        return self.mode != "off"
+
+    def __call__(self, update, context):
+        """Обработчик TypeHandler(Update, ...): пропускает обновление или останавливает его обработку"""
+        user = update.effective_user
+        if user is not None and user.id in self.exempt_ids:
+            return
+
+        now = time.monotonic()
+        chat = update.effective_chat
+        allowed = (user is None or self.user_limiter.consume(user.id, now)) and \
+                  (chat is None or self.chat_limiter.consume(chat.id, now))
+
+        with self._lock:
+            self._stats['checked'] += 1
+            if allowed:
+                return
+            self._stats['limited'] += 1
+            user_id = user.id if user is not None else None
+            self._limited_by_user[user_id] = self._limited_by_user.get(user_id, 0) + 1
+            if len(self._limited_by_user) > 10000:
+                self._limited_by_user.clear()
+            notify = self.mode == "notify" and user is not None and \
+                now - self._notified_at.get(user.id, float('-inf')) >= self.notify_interval
+            if notify:
+                self._notified_at[user.id] = now
+                self._stats['notified'] += 1
+                if len(self._notified_at) > 10000:
+                    self._notified_at = {
+                        key: notified_at for key, notified_at in self._notified_at.items()
+                        if now - notified_at < self.notify_interval
+                    }
+
+        if notify:
+            self._notify(update)
+        raise DispatcherHandlerStop()
+
+    def _notify(self, update):
+        """Просьба пользователю подождать"""
+        text = "⏳ Слишком много запросов. Пожалуйста, подождите несколько секунд."
+        try:
+            if update.callback_query:
+                update.callback_query.answer(text)
+            elif update.effective_message:
+                update.effective_message.reply_text(text)
+        except Exception as e:
+            logging.warning(f"Не удалось предупредить пользователя о превышении частоты запросов: {e}")
+
+    def stats(self, top=5):
+        """
+        Получение счетчиков ограничения частоты
+
+        Args:
+            top: сколько пользователей с наибольшим количеством отброшенных обновлений вернуть
+
+        Returns:
+            dict: количество проверенных, отброшенных обновлений и предупреждений,
+                  количество корзин и список (ID пользователя, отброшено)
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            top_users = sorted(self._limited_by_user.items(), key=lambda item: item[1], reverse=True)[:top]
+        stats['user_buckets'] = len(self.user_limiter)
+        stats['chat_buckets'] = len(self.chat_limiter)
+        stats['top_users'] = top_users
+        return stats
+
+    def reset(self):
+        """Сброс счетчиков"""
+        with self._lock:
+            self._stats = dict.fromkeys(self._stats, 0)
+            self._limited_by_user.clear()
+
+# Глобальный экземпляр защиты от флуда; администраторы не ограничиваются
+flood_protection = FloodProtection(
+    TokenBucketLimiter(RATE_LIMIT_USER_RATE, RATE_LIMIT_USER_BURST),
+    TokenBucketLimiter(RATE_LIMIT_CHAT_RATE, RATE_LIMIT_CHAT_BURST),
+    mode=RATE_LIMIT_MODE,
+    exempt_ids=set(ADMIN_IDS) | ({MILEAGE_ADMIN_ID} if MILEAGE_ADMIN_ID else set())
+)
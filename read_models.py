@@ -0,0 +1,55 @@
+"""
+Легковесные модели для чтения списков заявок и пользователей
+
+Списки (мои заявки, списки администратора, расписание) показывают лишь
+несколько полей каждой строки. Вместо полных объектов SQLAlchemy со
+служебным состоянием сессии DataStore выбирает только нужные столбцы и
+возвращает неизменяемые именованные кортежи: они не зависят от сессии
+(нет ошибок ленивой загрузки после ее закрытия) и занимают в несколько раз
+меньше памяти на строку.
+"""
+from collections import namedtuple
+from models import User, ServiceRequest
+
+# Столбцы заявки и владельца, которые выводятся в списках заявок
+REQUEST_SUMMARY_COLUMNS = (
+    ServiceRequest.id,
+    ServiceRequest.user_id,
+    ServiceRequest.car_model,
+    ServiceRequest.license_plate,
+    ServiceRequest.requested_work,
+    ServiceRequest.status,
+    ServiceRequest.visit_date,
+    ServiceRequest.visit_time,
+    ServiceRequest.created_at,
+    User.telegram_id.label('owner_id'),
+    User.first_name,
+    User.last_name,
+)
+
+# Столбцы пользователя для списков пользователей
+USER_SUMMARY_COLUMNS = (
+    User.telegram_id,
+    User.username,
+    User.first_name,
+    User.last_name,
+    User.phone,
+    User.created_at,
+)
+
+class RequestSummary(namedtuple('RequestSummary', [
+    'id', 'user_id', 'car_model', 'license_plate', 'requested_work', 'status',
+    'visit_date', 'visit_time', 'created_at', 'owner_id', 'first_name', 'last_name'
+])):
+    """
+    Строка списка заявок вместе с именем владельца
+
+    owner_id равен None, если пользователь заявки не найден.
+    """
+    __slots__ = ()
+
+class UserSummary(namedtuple('UserSummary', [
+    'telegram_id', 'username', 'first_name', 'last_name', 'phone', 'created_at'
+])):
+    """Строка списка пользователей"""
+    __slots__ = ()
@@ -1,13 +1,23 @@
+import functools
 import logging
 import datetime
+import re
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, KeyboardButton, ParseMode, ReplyKeyboardRemove
 from telegram.ext import (
     CallbackContext, ConversationHandler, CommandHandler, 
-    MessageHandler, CallbackQueryHandler, Filters
+    MessageHandler, CallbackQueryHandler, Filters, TypeHandler
 )
-from models import User, ServiceRequest, RequestStatus
-from config import ADMIN_IDS, MILEAGE_ADMIN_ID
-from data_store import data_store
+from models import User, ServiceRequest, RequestStatus, VISIT_DATE_FORMAT, VISIT_TIME_FORMAT, parse_visit_date
+from config import ADMIN_IDS, MILEAGE_ADMIN_ID, ADMIN_PAGE_SIZE, RUN_ASYNC_HANDLERS, HOUSEKEEPING_INTERVAL
+from data_store import data_store, DayFullError
+from database import engine, SQL_METRICS_DUMP_PATH, begin_unit_of_work, end_unit_of_work, unit_of_work
+from db_metrics import sql_metrics
+from notifications import notifier
+from keyboards import keyboards
+from booking_calendar import booking_calendar, DAY_NAMES
+from housekeeping import housekeeper
+from rate_limit import flood_protection
+from callback_router import CallbackRouter, Route
 
 # Define conversation states
 (
@@ -20,6 +30,37 @@ from data_store import data_store
     MILEAGE_RESPONSE, MILEAGE_RESPONSE_TEXT  # Новые состояния для обработки запросов о пробеге предыдущего ТО
 ) = range(27)
 
+# Названия состояний для отчетов (/memstats)
+STATE_NAMES = {
+    START: "START",
+    REGISTER: "REGISTER",
+    REGISTER_NAME: "REGISTER_NAME",
+    REGISTER_SURNAME: "REGISTER_SURNAME",
+    MAIN_MENU: "MAIN_MENU",
+    FORM_CAR_BRAND: "FORM_CAR_BRAND",
+    FORM_CAR_MODEL: "FORM_CAR_MODEL",
+    FORM_CAR_YEAR: "FORM_CAR_YEAR",
+    FORM_LICENSE_PLATE: "FORM_LICENSE_PLATE",
+    FORM_MILEAGE: "FORM_MILEAGE",
+    FORM_REQUESTED_WORK: "FORM_REQUESTED_WORK",
+    FORM_PREFERRED_DATE: "FORM_PREFERRED_DATE",
+    FORM_PHONE: "FORM_PHONE",
+    FORM_CONFIRM: "FORM_CONFIRM",
+    MY_REQUESTS: "MY_REQUESTS",
+    ADMIN_MENU: "ADMIN_MENU",
+    REQUEST_DETAILS: "REQUEST_DETAILS",
+    FORM_MODEL_MANUAL: "FORM_MODEL_MANUAL",
+    FORM_REAL_NAME: "FORM_REAL_NAME",
+    FORM_REAL_SURNAME: "FORM_REAL_SURNAME",
+    ADMIN_NOTE: "ADMIN_NOTE",
+    FORM_WORK_TYPE: "FORM_WORK_TYPE",
+    FORM_WORK_MANUAL: "FORM_WORK_MANUAL",
+    FORM_SELECT_DATE: "FORM_SELECT_DATE",
+    FORM_PHONE_CHOICE: "FORM_PHONE_CHOICE",
+    MILEAGE_RESPONSE: "MILEAGE_RESPONSE",
+    MILEAGE_RESPONSE_TEXT: "MILEAGE_RESPONSE_TEXT",
+}
+
 # Структура марок и моделей автомобилей - УПРОЩЁННАЯ ВЕРСИЯ
 # Каждая марка просто содержит список моделей с полными названиями
 
@@ -208,17 +249,10 @@ def start_new_request(update: Update, context: CallbackContext) -> int:
     query = update.callback_query
     query.answer()
     
-    # Создаем клавиатуру с марками Toyota и Lexus
-    buttons = [
-        [InlineKeyboardButton("Lexus", callback_data="brand_Lexus")],
-        [InlineKeyboardButton("Toyota", callback_data="brand_Toyota")],
-        [InlineKeyboardButton("🔙 Назад", callback_data="main_menu")]
-    ]
-    
     query.message.edit_text(
         "Создание новой заявки на обслуживание автомобиля\n\n"
         "Выберите марку вашего автомобиля:",
-        reply_markup=InlineKeyboardMarkup(buttons)
+        reply_markup=keyboards.get("car_brands")
     )
     
     return FORM_CAR_BRAND
@@ -240,7 +274,7 @@ def process_car_brand(update: Update, context: CallbackContext) -> int:
     query.message.edit_text(
         f"Выбрана марка: {brand_data}\n\n"
         "Теперь выберите год выпуска вашего автомобиля:",
-        reply_markup=InlineKeyboardMarkup(create_year_buttons())
+        reply_markup=keyboards.get("car_years")
     )
     
     return FORM_CAR_YEAR
@@ -324,7 +358,7 @@ def process_model_manual(update: Update, context: CallbackContext) -> int:
         update.message.reply_text(
             f"Автомобиль: {car_model}\n\n"
             "Теперь выберите год выпуска вашего автомобиля:",
-            reply_markup=InlineKeyboardMarkup(create_year_buttons())
+            reply_markup=keyboards.get("car_years")
         )
         
         return FORM_CAR_YEAR
@@ -336,11 +370,33 @@ def show_car_year_selection(update: Update, context: CallbackContext) -> int:
     query.message.edit_text(
         f"Автомобиль: {context.user_data['car_model']}\n\n"
         "Теперь выберите год выпуска вашего автомобиля:",
-        reply_markup=InlineKeyboardMarkup(create_year_buttons())
+        reply_markup=keyboards.get("car_years")
     )
     
     return FORM_CAR_YEAR
 
+def create_brand_buttons():
+    """Create buttons for car brand selection"""
+    buttons = [[InlineKeyboardButton(brand, callback_data=f"brand_{brand}")] for brand in sorted(CAR_BRANDS)]
+    buttons.append([InlineKeyboardButton("🔙 Назад", callback_data="main_menu")])
+    return buttons
+
+def create_model_buttons(car_brand):
+    """Create buttons for selecting a model of the given brand"""
+    # Размещаем модели в отдельных кнопках для лучшей читаемости
+    buttons = []
+    for model in CAR_BRANDS[car_brand]:
+        # Заменяем пробелы в callback_data на подчеркивания для моделей с пробелами
+        model_key = model.replace(" ", "_")
+        buttons.append([InlineKeyboardButton(model, callback_data=f"model_{model_key}")])
+    
+    # Добавляем опцию для выбора другой модели
+    other_model_text = f"Другая модель {car_brand}"
+    buttons.append([InlineKeyboardButton(other_model_text, callback_data="model_other")])
+    buttons.append([InlineKeyboardButton("🔙 Назад", callback_data="new_request")])
+    
+    return buttons
+
 def create_year_buttons():
     """Create buttons for year selection"""
     buttons = []
@@ -371,28 +427,12 @@ def process_car_year(update: Update, context: CallbackContext) -> int:
     
     car_brand = context.user_data['car_brand']
     
-    # Получаем все модели выбранной марки
-    all_models = CAR_BRANDS[car_brand]
-    
-    # Создаем клавиатуру для отображения всех моделей
-    # Размещаем модели в отдельных кнопках для лучшей читаемости
-    buttons = []
-    for model in all_models:
-        # Заменяем пробелы в callback_data на подчеркивания для моделей с пробелами
-        model_key = model.replace(" ", "_")
-        buttons.append([InlineKeyboardButton(model, callback_data=f"model_{model_key}")])
-    
-    # Добавляем опцию для выбора другой модели
-    other_model_text = f"Другая модель {car_brand}"
-    buttons.append([InlineKeyboardButton(other_model_text, callback_data="model_other")])
-    buttons.append([InlineKeyboardButton("🔙 Назад", callback_data="new_request")])
-    
     # Выводим сообщение с полным списком моделей
     query.message.edit_text(
         f"Выбрана марка: {car_brand}\n"
         f"Выбран год: {year}\n\n"
         "Теперь выберите модель автомобиля:",
-        reply_markup=InlineKeyboardMarkup(buttons)
+        reply_markup=keyboards.get("car_models", car_brand)
     )
     
     return FORM_CAR_MODEL
@@ -406,51 +446,12 @@ def back_to_date_selection(update: Update, context: CallbackContext) -> int:
     requested_work = context.user_data.get('requested_work', 'Не указано')
     
     # Переходим к выбору даты
-    now = datetime.datetime.now()
-    available_dates = []
-    
-    # Находим дату начала следующей недели (понедельник)
-    days_until_next_monday = 7 - now.weekday() if now.weekday() > 0 else 7
-    next_monday = now + datetime.timedelta(days=days_until_next_monday)
-    
-    # Генерируем даты на ближайшие 2 месяца (60 дней), начиная со следующей недели
-    for i in range(60):
-        date = next_monday + datetime.timedelta(days=i)
-        # Ограничиваем выбор только вторником, средой и четвергом
-        if date.weekday() in [1, 2, 3]:  # 0 - понедельник, 1 - вторник, ...
-            available_dates.append(date)
-    
-    # Создаем кнопки с датами
-    buttons = []
-    dates_per_row = 3
-    date_buttons = []
-    
-    for date in available_dates[:18]:  # Ограничимся первыми 18 доступными датами
-        formatted_date = date.strftime("%d.%m")
-        day_names = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
-        day_name = day_names[date.weekday()]
-        button_text = f"{formatted_date} ({day_name})"
-        date_key = date.strftime("%d.%m.%Y")
-        date_buttons.append(InlineKeyboardButton(button_text, callback_data=f"date_{date_key}"))
-        
-        # Группируем даты по 3 в ряд
-        if len(date_buttons) == dates_per_row:
-            buttons.append(date_buttons)
-            date_buttons = []
-    
-    # Добавляем оставшиеся даты
-    if date_buttons:
-        buttons.append(date_buttons)
-    
-    # Добавляем кнопку "Назад"
-    buttons.append([InlineKeyboardButton("🔙 Назад", callback_data="main_menu")])
-    
     query.message.edit_text(
         f"Выбран тип работ: {requested_work}\n\n"
-        "Выберите предпочтительную дату визита (вторник-четверг):\n"
+        f"Выберите предпочтительную дату визита ({booking_calendar.workdays_label()}):\n"
         "❗ Дата и время предварительные\n"
         "❗ Менеджер свяжется с вами для подтверждения в ближайший понедельник",
-        reply_markup=InlineKeyboardMarkup(buttons)
+        reply_markup=keyboards.get("booking_dates")
     )
     
     return FORM_SELECT_DATE
@@ -499,6 +500,8 @@ def process_mileage(update: Update, context: CallbackContext) -> int:
 
 def handle_mileage_admin_response(update: Update, context: CallbackContext) -> int:
     """Обработчик нажатия кнопки 'Ответить' для запроса о пробеге"""
+    if deny_non_admin(update, allow_mileage_admin=True):
+        return None
     query = update.callback_query
     query.answer()
     
@@ -537,26 +540,28 @@ def process_mileage_response_text(update: Update, context: CallbackContext) -> i
     # Получаем текст ответа админа
     response_text = update.message.text
     
-    # Отправляем ответ пользователю
-    try:
-        context.bot.send_message(
-            chat_id=user_id,
-            text=f"📊 Информация о пробеге предыдущего ТО:\n\n{response_text}"
-        )
-        
-        # Подтверждаем админу, что сообщение отправлено
-        update.message.reply_text(
-            "✅ Ваш ответ успешно отправлен пользователю!",
-            reply_markup=create_main_menu_keyboard()
-        )
-        
-        logging.info(f"Ответ о пробеге отправлен пользователю {user_id}")
-    except Exception as e:
-        update.message.reply_text(
-            f"❌ Ошибка при отправке ответа: {e}",
-            reply_markup=create_main_menu_keyboard()
-        )
-        logging.error(f"Не удалось отправить ответ о пробеге пользователю {user_id}: {e}")
+    # Ставим ответ пользователю в очередь; об ошибке доставки админ узнает отдельным сообщением
+    admin_chat_id = update.effective_chat.id
+    bot = context.bot
+    
+    def report_failure(error):
+        logging.error(f"Не удалось отправить ответ о пробеге пользователю {user_id}: {error}")
+        notifier.send_message(bot, admin_chat_id, f"❌ Ошибка при отправке ответа: {error}")
+    
+    notifier.send_message(
+        bot,
+        user_id,
+        f"📊 Информация о пробеге предыдущего ТО:\n\n{response_text}",
+        on_failure=report_failure
+    )
+    
+    # Подтверждаем админу, что сообщение поставлено на отправку
+    update.message.reply_text(
+        "✅ Ваш ответ отправляется пользователю!",
+        reply_markup=create_main_menu_keyboard()
+    )
+    
+    logging.info(f"Ответ о пробеге поставлен в очередь для пользователя {user_id}")
     
     # Очищаем сохраненный ID пользователя
     if 'mileage_response_user_id' in context.user_data:
@@ -634,51 +639,12 @@ def process_work_type(update: Update, context: CallbackContext) -> int:
     context.user_data['requested_work'] = work_types[work_type]
     
     # Переходим к выбору даты
-    now = datetime.datetime.now()
-    available_dates = []
-    
-    # Находим дату начала следующей недели (понедельник)
-    days_until_next_monday = 7 - now.weekday() if now.weekday() > 0 else 7
-    next_monday = now + datetime.timedelta(days=days_until_next_monday)
-    
-    # Генерируем даты на ближайшие 2 месяца (60 дней), начиная со следующей недели
-    for i in range(60):
-        date = next_monday + datetime.timedelta(days=i)
-        # Ограничиваем выбор только вторником, средой и четвергом
-        if date.weekday() in [1, 2, 3]:  # 0 - понедельник, 1 - вторник, ...
-            available_dates.append(date)
-    
-    # Создаем кнопки с датами
-    buttons = []
-    dates_per_row = 3
-    date_buttons = []
-    
-    for date in available_dates[:18]:  # Ограничимся первыми 18 доступными датами
-        formatted_date = date.strftime("%d.%m")
-        day_names = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
-        day_name = day_names[date.weekday()]
-        button_text = f"{formatted_date} ({day_name})"
-        date_key = date.strftime("%d.%m.%Y")
-        date_buttons.append(InlineKeyboardButton(button_text, callback_data=f"date_{date_key}"))
-        
-        # Группируем даты по 3 в ряд
-        if len(date_buttons) == dates_per_row:
-            buttons.append(date_buttons)
-            date_buttons = []
-    
-    # Добавляем оставшиеся даты
-    if date_buttons:
-        buttons.append(date_buttons)
-    
-    # Добавляем кнопку "Назад"
-    buttons.append([InlineKeyboardButton("🔙 Назад", callback_data="main_menu")])
-    
     query.message.edit_text(
         f"Выбран тип работ: {work_types[work_type]}\n\n"
-        "Выберите предпочтительную дату визита (вторник-четверг):\n"
+        f"Выберите предпочтительную дату визита ({booking_calendar.workdays_label()}):\n"
         "❗ Дата и время предварительные\n"
         "❗ Менеджер свяжется с вами для подтверждения в ближайший понедельник",
-        reply_markup=InlineKeyboardMarkup(buttons)
+        reply_markup=keyboards.get("booking_dates")
     )
     
     return FORM_SELECT_DATE
@@ -689,51 +655,12 @@ def process_work_manual(update: Update, context: CallbackContext) -> int:
     context.user_data['requested_work'] = work_description
     
     # Переходим к выбору даты
-    now = datetime.datetime.now()
-    available_dates = []
-    
-    # Находим дату начала следующей недели (понедельник)
-    days_until_next_monday = 7 - now.weekday() if now.weekday() > 0 else 7
-    next_monday = now + datetime.timedelta(days=days_until_next_monday)
-    
-    # Генерируем даты на ближайшие 2 месяца (60 дней), начиная со следующей недели
-    for i in range(60):
-        date = next_monday + datetime.timedelta(days=i)
-        # Ограничиваем выбор только вторником, средой и четвергом
-        if date.weekday() in [1, 2, 3]:  # 0 - понедельник, 1 - вторник, ...
-            available_dates.append(date)
-    
-    # Создаем кнопки с датами
-    buttons = []
-    dates_per_row = 3
-    date_buttons = []
-    
-    for date in available_dates[:18]:  # Ограничимся первыми 18 доступными датами
-        formatted_date = date.strftime("%d.%m")
-        day_names = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
-        day_name = day_names[date.weekday()]
-        button_text = f"{formatted_date} ({day_name})"
-        date_key = date.strftime("%d.%m.%Y")
-        date_buttons.append(InlineKeyboardButton(button_text, callback_data=f"date_{date_key}"))
-        
-        # Группируем даты по 3 в ряд
-        if len(date_buttons) == dates_per_row:
-            buttons.append(date_buttons)
-            date_buttons = []
-    
-    # Добавляем оставшиеся даты
-    if date_buttons:
-        buttons.append(date_buttons)
-    
-    # Добавляем кнопку "Назад"
-    buttons.append([InlineKeyboardButton("🔙 Назад", callback_data="main_menu")])
-    
     update.message.reply_text(
         f"Вы ввели: {work_description}\n\n"
-        "Выберите предпочтительную дату визита (вторник-четверг):\n"
+        f"Выберите предпочтительную дату визита ({booking_calendar.workdays_label()}):\n"
         "❗ Дата и время предварительные\n"
         "❗ Менеджер свяжется с вами для подтверждения в ближайший понедельник",
-        reply_markup=InlineKeyboardMarkup(buttons)
+        reply_markup=keyboards.get("booking_dates")
     )
     
     return FORM_SELECT_DATE
@@ -741,9 +668,27 @@ def process_work_manual(update: Update, context: CallbackContext) -> int:
 def process_date_selection(update: Update, context: CallbackContext) -> int:
     """Process date selection from buttons"""
     query = update.callback_query
-    query.answer()
-    
     date_str = query.data.split('_', 1)[1]
+    
+    # Дата из callback_data может быть вне окна записи (устаревшая клавиатура
+    # или подставленные данные) или заполниться, пока пользователь смотрел на клавиатуру
+    visit_date = parse_visit_date(date_str)
+    if visit_date is None or not booking_calendar.is_bookable(visit_date):
+        alert = f"Запись на {date_str} недоступна, выберите другую дату"
+    elif booking_calendar.is_full(visit_date):
+        alert = f"На {date_str} свободных мест нет, выберите другую дату"
+    else:
+        alert = None
+    if alert:
+        query.answer(alert, show_alert=True)
+        try:
+            query.message.edit_reply_markup(reply_markup=keyboards.get("booking_dates"))
+        except Exception as e:
+            # Клавиатура могла не измениться (Telegram отвечает ошибкой "message is not modified")
+            logging.debug(f"Клавиатура дат не обновлена: {e}")
+        return FORM_SELECT_DATE
+    
+    query.answer()
     context.user_data['preferred_date'] = date_str
     
     # Проверяем, есть ли у пользователя сохраненный номер телефона
@@ -930,8 +875,17 @@ def confirm_request(update: Update, context: CallbackContext) -> int:
         real_surname=db_user.last_name if db_user else user.last_name
     )
     
-    # Save the request
-    data_store.add_request(new_request)
+    # Save the request; для записи на дату место проверяется атомарно при вставке
+    is_mileage_request = user_data['requested_work'] == "Узнать пробег предыдущего техобслуживания"
+    try:
+        data_store.add_request(new_request, check_capacity=not is_mileage_request)
+    except DayFullError:
+        query.message.edit_text(
+            f"😔 К сожалению, на {user_data['preferred_date']} все места уже заняты.\n\n"
+            f"Выберите другую дату визита ({booking_calendar.workdays_label()}):",
+            reply_markup=keyboards.get("booking_dates")
+        )
+        return FORM_SELECT_DATE
     
     # Notify the user
     if user_data['requested_work'] == "Узнать пробег предыдущего техобслуживания":
@@ -949,78 +903,80 @@ def confirm_request(update: Update, context: CallbackContext) -> int:
             "Вы можете отслеживать статус вашей заявки в разделе 'Мои заявки'."
         )
     
+    # Уведомления ставятся в очередь и отправляются отдельными потоками,
+    # чтобы медленная доставка администраторам не задерживала ответ клиенту
+    bot = context.bot
+    
     # Определяем, кому отправлять уведомление
     if user_data['requested_work'] == "Узнать пробег предыдущего техобслуживания" and MILEAGE_ADMIN_ID:
-        # Отправляем запрос о пробеге только специальному администратору
-        try:
-            context.bot.send_message(
-                chat_id=MILEAGE_ADMIN_ID,
-                text=(
-                    "📊 Новый запрос информации о пробеге предыдущего ТО!\n\n"
-                    f"От: {new_request.real_name} {new_request.real_surname if new_request.real_surname else ''}\n"
-                    f"Автомобиль: {new_request.car_model}\n"
-                    f"Гос. номер: {new_request.license_plate}\n"
-                    f"Текущий пробег: {new_request.mileage} км\n"
-                    f"Телефон: {new_request.phone}"
-                ),
-                reply_markup=InlineKeyboardMarkup([
-                    [InlineKeyboardButton("👁 Просмотреть детали", callback_data=f"notification_view_{new_request.id}")]
-                ])
-            )
-            
-            # Уведомляем обычных администраторов о том, что заявка ушла специальному администратору
+        def notify_all_admins(error):
+            # Если специалисту отправить не удалось, отправляем запрос всем администраторам
             for admin_id in ADMIN_IDS:
-                if admin_id != MILEAGE_ADMIN_ID:  # Не отправляем дублирующее сообщение специальному администратору
-                    context.bot.send_message(
-                        chat_id=admin_id,
-                        text=(
-                            "📊 Новый запрос информации о пробеге предыдущего ТО\n\n"
-                            f"От: {new_request.real_name} {new_request.real_surname if new_request.real_surname else ''}\n"
-                            f"Автомобиль: {new_request.car_model}\n"
-                            f"Гос. номер: {new_request.license_plate}\n\n"
-                            "Запрос автоматически направлен специалисту по ТО."
-                        )
-                    )
-        except Exception as e:
-            logging.error(f"Error notifying mileage admin: {e}")
-            # В случае ошибки, отправляем запрос всем администраторам
-            for admin_id in ADMIN_IDS:
-                try:
-                    context.bot.send_message(
-                        chat_id=admin_id,
-                        text=(
-                            "📊 Новый запрос информации о пробеге предыдущего ТО!\n\n"
-                            f"От: {new_request.real_name} {new_request.real_surname if new_request.real_surname else ''}\n"
-                            f"Автомобиль: {new_request.car_model}\n"
-                            f"Гос. номер: {new_request.license_plate}\n"
-                            f"Текущий пробег: {new_request.mileage} км\n"
-                            f"Телефон: {new_request.phone}\n\n"
-                            "⚠️ Не удалось направить специалисту по ТО, пожалуйста, обработайте запрос."
-                        ),
-                        reply_markup=InlineKeyboardMarkup([
-                            [InlineKeyboardButton("👁 Просмотреть детали", callback_data=f"notification_view_{new_request.id}")]
-                        ])
-                    )
-                except Exception as e:
-                    logging.error(f"Error notifying admin {admin_id}: {e}")
-    else:
-        # Для всех остальных типов заявок уведомляем всех администраторов
-        for admin_id in ADMIN_IDS:
-            try:
-                context.bot.send_message(
-                    chat_id=admin_id,
-                    text=(
-                        "📣 Новая заявка!\n\n"
+                notifier.send_message(
+                    bot,
+                    admin_id,
+                    (
+                        "📊 Новый запрос информации о пробеге предыдущего ТО!\n\n"
                         f"От: {new_request.real_name} {new_request.real_surname if new_request.real_surname else ''}\n"
                         f"Автомобиль: {new_request.car_model}\n"
-                        f"Гос. номер: {new_request.license_plate}"
+                        f"Гос. номер: {new_request.license_plate}\n"
+                        f"Текущий пробег: {new_request.mileage} км\n"
+                        f"Телефон: {new_request.phone}\n\n"
+                        "⚠️ Не удалось направить специалисту по ТО, пожалуйста, обработайте запрос."
                     ),
                     reply_markup=InlineKeyboardMarkup([
                         [InlineKeyboardButton("👁 Просмотреть детали", callback_data=f"notification_view_{new_request.id}")]
                     ])
                 )
-            except Exception as e:
-                logging.error(f"Error notifying admin {admin_id}: {e}")
+        
+        # Отправляем запрос о пробеге только специальному администратору
+        notifier.send_message(
+            bot,
+            MILEAGE_ADMIN_ID,
+            (
+                "📊 Новый запрос информации о пробеге предыдущего ТО!\n\n"
+                f"От: {new_request.real_name} {new_request.real_surname if new_request.real_surname else ''}\n"
+                f"Автомобиль: {new_request.car_model}\n"
+                f"Гос. номер: {new_request.license_plate}\n"
+                f"Текущий пробег: {new_request.mileage} км\n"
+                f"Телефон: {new_request.phone}"
+            ),
+            on_failure=notify_all_admins,
+            reply_markup=InlineKeyboardMarkup([
+                [InlineKeyboardButton("👁 Просмотреть детали", callback_data=f"notification_view_{new_request.id}")]
+            ])
+        )
+        
+        # Уведомляем обычных администраторов о том, что заявка ушла специальному администратору
+        for admin_id in ADMIN_IDS:
+            if admin_id != MILEAGE_ADMIN_ID:  # Не отправляем дублирующее сообщение специальному администратору
+                notifier.send_message(
+                    bot,
+                    admin_id,
+                    (
+                        "📊 Новый запрос информации о пробеге предыдущего ТО\n\n"
+                        f"От: {new_request.real_name} {new_request.real_surname if new_request.real_surname else ''}\n"
+                        f"Автомобиль: {new_request.car_model}\n"
+                        f"Гос. номер: {new_request.license_plate}\n\n"
+                        "Запрос автоматически направлен специалисту по ТО."
+                    )
+                )
+    else:
+        # Для всех остальных типов заявок уведомляем всех администраторов
+        for admin_id in ADMIN_IDS:
+            notifier.send_message(
+                bot,
+                admin_id,
+                (
+                    "📣 Новая заявка!\n\n"
+                    f"От: {new_request.real_name} {new_request.real_surname if new_request.real_surname else ''}\n"
+                    f"Автомобиль: {new_request.car_model}\n"
+                    f"Гос. номер: {new_request.license_plate}"
+                ),
+                reply_markup=InlineKeyboardMarkup([
+                    [InlineKeyboardButton("👁 Просмотреть детали", callback_data=f"notification_view_{new_request.id}")]
+                ])
+            )
     
     # Clear the form data
     context.user_data.clear()
@@ -1096,6 +1052,36 @@ def show_my_requests(update: Update, context: CallbackContext) -> int:
     
     return MY_REQUESTS
 
+def deny_non_admin(update: Update, allow_mileage_admin=False) -> bool:
+    """
+    Проверка прав на кнопки и сообщения админ-панели
+    
+    ID заявок в callback_data - последовательные числа, которые легко подобрать,
+    поэтому обработчики управления заявками выполняются только для
+    администраторов. Отказ показывается во всплывающем сообщении, состояние
+    диалога не меняется.
+    
+    Args:
+        update: обновление Telegram
+        allow_mileage_admin: разрешить специалисту по ТО (MILEAGE_ADMIN_ID)
+        
+    Returns:
+        bool: True, если прав нет и обработку нужно прекратить
+    """
+    user_id = update.effective_user.id
+    if user_id in ADMIN_IDS or (allow_mileage_admin and MILEAGE_ADMIN_ID and user_id == MILEAGE_ADMIN_ID):
+        return False
+    
+    logging.warning(f"Пользователь {user_id} без прав администратора отправил {describe_update(update)}")
+    if update.callback_query:
+        update.callback_query.answer("⛔ Недостаточно прав", show_alert=True)
+    return True
+
+def can_view_request(user_id, request) -> bool:
+    """Заявку видят ее владелец, администраторы и специалист по ТО"""
+    return request.user_id == user_id or user_id in ADMIN_IDS or \
+        (MILEAGE_ADMIN_ID is not None and user_id == MILEAGE_ADMIN_ID)
+
 def show_request_details(update: Update, context: CallbackContext) -> int:
     """Show details of a specific request"""
     query = update.callback_query
@@ -1104,7 +1090,8 @@ def show_request_details(update: Update, context: CallbackContext) -> int:
     request_id = query.data.split('_', 2)[2]
     request = data_store.get_request(request_id)
     
-    if not request:
+    # Чужая заявка показывается так же, как несуществующая
+    if not request or not can_view_request(update.effective_user.id, request):
         query.message.edit_text(
             "Заявка не найдена.",
             reply_markup=InlineKeyboardMarkup([
@@ -1122,7 +1109,7 @@ def show_request_details(update: Update, context: CallbackContext) -> int:
     
     if request.requested_work == "Узнать пробег предыдущего техобслуживания":
         details_text = (
-            f"📋 Запрос информации #{request.id[:8]}...\n\n"
+            f"📋 Запрос информации #{request.code}...\n\n"
             f"Статус: {status_text}\n"
             f"Создан: {request.created_at.strftime('%d.%m.%Y %H:%M')}\n\n"
             f"🚗 Автомобиль: {request.car_model}\n"
@@ -1134,7 +1121,7 @@ def show_request_details(update: Update, context: CallbackContext) -> int:
             details_text += f"\n⏳ Ваш запрос обрабатывается специалистом.\n"
     else:
         details_text = (
-            f"📋 Заявка #{request.id[:8]}...\n\n"
+            f"📋 Заявка #{request.code}...\n\n"
             f"Статус: {status_text}\n"
             f"Создана: {request.created_at.strftime('%d.%m.%Y %H:%M')}\n\n"
             f"🚗 Автомобиль: {request.car_model}\n"
@@ -1165,23 +1152,30 @@ def show_request_details(update: Update, context: CallbackContext) -> int:
     
     return MY_REQUESTS
 
-def show_admin_menu(update: Update, context: CallbackContext) -> int:
-    """Show the admin menu with options"""
-    query = update.callback_query
-    query.answer()
-    
-    buttons = [
+def create_admin_menu_buttons():
+    """Create buttons for the admin menu"""
+    return [
         [InlineKeyboardButton("📥 Новые заявки", callback_data="admin_requests_pending")],
         [InlineKeyboardButton("🏁 Выполненные заявки", callback_data="admin_requests_completed")],
         [InlineKeyboardButton("📊 Запросы о пробеге", callback_data="admin_mileage_requests")],
+        [InlineKeyboardButton("📅 Расписание на неделю", callback_data="admin_schedule")],
         [InlineKeyboardButton("🔙 Вернуться в главное меню", callback_data="main_menu")]
     ]
+
+def show_admin_menu(update: Update, context: CallbackContext) -> int:
+    """Show the admin menu with options"""
+    if deny_non_admin(update):
+        return None
+    query = update.callback_query
+    query.answer()
+    
+    reply_markup = keyboards.get("admin_menu")
     
     try:
         query.message.edit_text(
             "👨‍💼 Панель администратора.\n\n"
             "Выберите категорию заявок для просмотра:",
-            reply_markup=InlineKeyboardMarkup(buttons)
+            reply_markup=reply_markup
         )
     except Exception as e:
         logging.error(f"Ошибка при показе админ-меню: {e}")
@@ -1189,136 +1183,228 @@ def show_admin_menu(update: Update, context: CallbackContext) -> int:
         query.message.reply_text(
             "👨‍💼 Панель администратора.\n\n"
             "Выберите категорию заявок для просмотра:",
-            reply_markup=InlineKeyboardMarkup(buttons)
+            reply_markup=reply_markup
         )
     
     return ADMIN_MENU
 
+# Параметры списков заявок в админ-панели: фильтры запроса и заголовки
+ADMIN_REQUEST_LISTS = {
+    "mileage": {
+        "filters": {
+            "status": RequestStatus.PENDING.value,
+            "requested_work": "Узнать пробег предыдущего техобслуживания",
+        },
+        "title": "Список запросов о пробеге предыдущего ТО",
+        "empty": "Нет запросов о пробеге предыдущего ТО.",
+        "show_status": True,
+    },
+    "pending": {
+        # Запросы о пробеге показываются только в разделе "Запросы о пробеге"
+        "filters": {
+            "status": RequestStatus.PENDING.value,
+            "exclude_work": "Узнать пробег предыдущего техобслуживания",
+        },
+        "title": "Список новых заявок",
+        "empty": "Нет новых заявок.",
+    },
+    "approved": {
+        "filters": {"status": RequestStatus.APPROVED.value},
+        "title": "Список одобренных заявок",
+        "empty": "Нет одобренных заявок.",
+    },
+    "rejected": {
+        "filters": {"status": RequestStatus.REJECTED.value},
+        "title": "Список отклоненных заявок",
+        "empty": "Нет отклоненных заявок.",
+    },
+    "completed": {
+        "filters": {"status": RequestStatus.COMPLETED.value},
+        "title": "Список выполненных заявок",
+        "empty": "Нет выполненных заявок.",
+    },
+}
+
 def show_admin_requests(update: Update, context: CallbackContext) -> int:
-    """Show requests with a specific status to the admin"""
+    """Show the first page of requests with a specific status to the admin"""
+    if deny_non_admin(update):
+        return None
     query = update.callback_query
     query.answer()
     
-    callback_data = query.data
+    # Определяем, какой список запрошен
+    if query.data == "admin_mileage_requests":
+        list_kind = "mileage"
+    else:
+        list_kind = query.data.split('_')[-1]
     
-    # Проверяем, если это запрос на показ запросов о пробеге
-    if callback_data == "admin_mileage_requests":
-        # Получаем все запросы и фильтруем только те, которые о пробеге и имеют статус PENDING
-        all_requests = data_store.get_all_requests()
-        # Фильтруем запросы: должны быть о пробеге и иметь статус PENDING
-        mileage_requests = [
-            r for r in all_requests 
-            if r.requested_work == "Узнать пробег предыдущего техобслуживания" and r.status == RequestStatus.PENDING.value
-        ]
-        
-        if not mileage_requests:
-            query.message.edit_text(
-                "Нет запросов о пробеге предыдущего ТО.",
-                reply_markup=InlineKeyboardMarkup([
-                    [InlineKeyboardButton("🔙 Назад", callback_data="admin_menu")]
-                ])
-            )
-            return ADMIN_MENU
-            
-        # Сортируем запросы - новейшие сначала
-        mileage_requests.sort(key=lambda r: r.created_at, reverse=True)
-        
-        # Создаем кнопки для каждого запроса
-        buttons = []
-        for request in mileage_requests:
-            user = data_store.get_user(request.user_id)
-            user_name = f"{user.first_name} {user.last_name}" if user else "Неизвестный"
-            
-            date_created = request.created_at.strftime("%d.%m.%Y")
-            
-            buttons.append([
-                InlineKeyboardButton(
-                    f"{request.car_model} - {user_name} ({date_created}) - {request.status}",
-                    callback_data=f"admin_view_{request.id}"
-                )
-            ])
-        
-        buttons.append([InlineKeyboardButton("🔙 Назад", callback_data="admin_menu")])
-        
-        try:
-            query.message.edit_text(
-                "Список запросов о пробеге предыдущего ТО:",
-                reply_markup=InlineKeyboardMarkup(buttons)
-            )
-        except Exception as e:
-            logging.error(f"Ошибка при показе списка запросов о пробеге: {e}")
-            query.message.reply_text(
-                "Список запросов о пробеге предыдущего ТО:",
-                reply_markup=InlineKeyboardMarkup(buttons)
-            )
-        
-        return ADMIN_MENU
+    if list_kind not in ADMIN_REQUEST_LISTS:
+        logging.error(f"Неизвестный список заявок: {query.data}")
+        return show_admin_menu(update, context)
     
-    # Обычная обработка запросов по статусу
-    status = query.data.split('_')[-1]
+    # Состояние пагинации: курсоры начала каждой уже открытой страницы
+    context.user_data['admin_list'] = {
+        'kind': list_kind,
+        'cursors': [None],
+        'page': 0,
+    }
     
-    # Get requests by status
-    # Для новых заявок (pending) исключаем запросы о пробеге, так как они должны быть только в разделе "Запросы о пробеге"
-    if status == "pending":
-        all_pending = data_store.get_requests_by_status(status)
-        # Фильтруем, исключая запросы о пробеге
-        requests_list = [r for r in all_pending if r.requested_work != "Узнать пробег предыдущего техобслуживания"]
-    else:
-        requests_list = data_store.get_requests_by_status(status)
+    return render_admin_requests_page(update, context)
+
+def change_admin_requests_page(update: Update, context: CallbackContext) -> int:
+    """Handle the ◀️ / ▶️ buttons of an admin request list"""
+    if deny_non_admin(update):
+        return None
+    query = update.callback_query
+    query.answer()
     
-    status_text = {
-        "pending": "новых",
-        "approved": "одобренных",
-        "rejected": "отклоненных",
-        "completed": "выполненных"
-    }.get(status, "")
+    list_state = context.user_data.get('admin_list')
+    if not list_state:
+        # Состояние списка потеряно - возвращаем администратора в меню
+        return show_admin_menu(update, context)
     
-    if not requests_list:
+    if query.data == "admin_page_next" and list_state['page'] + 1 < len(list_state['cursors']):
+        list_state['page'] += 1
+    elif query.data == "admin_page_prev" and list_state['page'] > 0:
+        list_state['page'] -= 1
+    
+    return render_admin_requests_page(update, context)
+
+def render_admin_requests_page(update: Update, context: CallbackContext) -> int:
+    """Render the current page of the admin request list stored in user_data"""
+    query = update.callback_query
+    list_state = context.user_data['admin_list']
+    list_config = ADMIN_REQUEST_LISTS[list_state['kind']]
+    page = list_state['page']
+    
+    # Заявки уже отсортированы (новейшие сначала) и содержат имена владельцев
+    requests_page, next_cursor = data_store.get_requests_page(
+        cursor=list_state['cursors'][page],
+        limit=ADMIN_PAGE_SIZE,
+        **list_config['filters']
+    )
+    
+    if not requests_page and page == 0:
         query.message.edit_text(
-            f"Нет {status_text} заявок.",
+            list_config['empty'],
             reply_markup=InlineKeyboardMarkup([
                 [InlineKeyboardButton("🔙 Назад", callback_data="admin_menu")]
             ])
         )
         return ADMIN_MENU
     
-    # Sort requests - newest first
-    requests_list.sort(key=lambda r: r.created_at, reverse=True)
+    # Запоминаем курсор следующей страницы, чтобы кнопка ▶️ знала, откуда продолжать
+    del list_state['cursors'][page + 1:]
+    if next_cursor is not None:
+        list_state['cursors'].append(next_cursor)
     
     # Create buttons for each request
     buttons = []
-    for request in requests_list:
-        user = data_store.get_user(request.user_id)
-        user_name = f"{user.first_name} {user.last_name}" if user else "Неизвестный"
+    for request in requests_page:
+        user_name = f"{request.first_name} {request.last_name}" if request.owner_id is not None else "Неизвестный"
         
         date_created = request.created_at.strftime("%d.%m.%Y")
+        button_text = f"{request.car_model} - {user_name} ({date_created})"
+        if list_config.get('show_status'):
+            button_text += f" - {request.status}"
         
         buttons.append([
-            InlineKeyboardButton(
-                f"{request.car_model} - {user_name} ({date_created})",
-                callback_data=f"admin_view_{request.id}"
-            )
+            InlineKeyboardButton(button_text, callback_data=f"admin_view_{request.id}")
         ])
     
+    # Кнопки переключения страниц
+    navigation = []
+    if page > 0:
+        navigation.append(InlineKeyboardButton("◀️", callback_data="admin_page_prev"))
+    if next_cursor is not None:
+        navigation.append(InlineKeyboardButton("▶️", callback_data="admin_page_next"))
+    if navigation:
+        buttons.append(navigation)
+    
     buttons.append([InlineKeyboardButton("🔙 Назад", callback_data="admin_menu")])
     
+    title = f"{list_config['title']}:"
+    if page > 0 or next_cursor is not None:
+        title = f"{list_config['title']} (стр. {page + 1}):"
+    
     try:
         query.message.edit_text(
-            f"Список {status_text} заявок:",
+            title,
             reply_markup=InlineKeyboardMarkup(buttons)
         )
     except Exception as e:
         logging.error(f"Ошибка при показе списка заявок: {e}")
         # Отправляем новое сообщение вместо редактирования
         query.message.reply_text(
-            f"Список {status_text} заявок:",
+            title,
             reply_markup=InlineKeyboardMarkup(buttons)
         )
     
     return ADMIN_MENU
 
+def show_admin_schedule(update: Update, context: CallbackContext) -> int:
+    """Show booked visits for a week (admin_schedule or admin_schedule_<week offset>)"""
+    if deny_non_admin(update):
+        return None
+    query = update.callback_query
+    query.answer()
+    
+    # Смещение в неделях относительно текущей недели
+    match = re.match(r'^admin_schedule_(-?\d+)$', query.data)
+    week_offset = int(match.group(1)) if match else 0
+    
+    today = datetime.date.today()
+    week_start = today - datetime.timedelta(days=today.weekday()) + datetime.timedelta(weeks=week_offset)
+    week_end = week_start + datetime.timedelta(days=6)
+    
+    # Одна выборка по индексу visit_date вместо разбора строковых дат всех заявок
+    rows = data_store.get_requests_between(week_start, week_end)
+    
+    lines = [
+        f"📅 Расписание на неделю {week_start.strftime('%d.%m')} - {week_end.strftime(VISIT_DATE_FORMAT)}\n"
+    ]
+    buttons = []
+    current_date = None
+    for request in rows:
+        if request.visit_date != current_date:
+            current_date = request.visit_date
+            lines.append(f"\n{DAY_NAMES[current_date.weekday()]} {current_date.strftime('%d.%m')}:")
+        
+        status_emoji = {
+            "pending": "⏳",
+            "approved": "✅",
+        }.get(request.status, "❓")
+        time_str = f"{request.visit_time.strftime(VISIT_TIME_FORMAT)} " if request.visit_time else ""
+        user_name = f"{request.first_name} {request.last_name or ''}".strip() if request.owner_id is not None else "Неизвестный"
+        lines.append(f"{status_emoji} {time_str}{request.car_model} ({request.license_plate}) - {user_name}")
+        
+        # Telegram ограничивает размер клавиатуры, поэтому кнопки только для первых заявок
+        if len(buttons) < ADMIN_PAGE_SIZE:
+            buttons.append([InlineKeyboardButton(
+                f"{current_date.strftime('%d.%m')} {request.car_model} - {user_name}",
+                callback_data=f"admin_view_{request.id}"
+            )])
+    
+    if not rows:
+        lines.append("Записей нет.")
+    
+    text = "\n".join(lines)
+    if len(text) > 4000:
+        text = text[:4000] + "\n…"
+    
+    buttons.append([
+        InlineKeyboardButton("◀️ Пред. неделя", callback_data=f"admin_schedule_{week_offset - 1}"),
+        InlineKeyboardButton("След. неделя ▶️", callback_data=f"admin_schedule_{week_offset + 1}")
+    ])
+    buttons.append([InlineKeyboardButton("🔙 Назад", callback_data="admin_menu")])
+    
+    query.message.edit_text(text, reply_markup=InlineKeyboardMarkup(buttons))
+    return ADMIN_MENU
+
 def admin_view_request(update: Update, context: CallbackContext) -> int:
     """Show request details to an admin with action buttons"""
+    if deny_non_admin(update):
+        return None
     query = update.callback_query
     query.answer()
     
@@ -1380,7 +1466,7 @@ def admin_view_request(update: Update, context: CallbackContext) -> int:
     
     if request.requested_work == "Узнать пробег предыдущего техобслуживания":
         details_text = (
-            f"📊 Запрос информации о пробеге #{request.id[:8]}...\n\n"
+            f"📊 Запрос информации о пробеге #{request.code}...\n\n"
             f"Статус: {status_text}\n"
             f"Создан: {request.created_at.strftime('%d.%m.%Y %H:%M')}\n"
             f"Клиент: {user_name}\n\n"
@@ -1392,7 +1478,7 @@ def admin_view_request(update: Update, context: CallbackContext) -> int:
         )
     else:
         details_text = (
-            f"📋 Заявка #{request.id[:8]}...\n\n"
+            f"📋 Заявка #{request.code}...\n\n"
             f"Статус: {status_text}\n"
             f"Создана: {request.created_at.strftime('%d.%m.%Y %H:%M')}\n"
             f"Клиент: {user_name}\n\n"
@@ -1452,6 +1538,8 @@ def admin_view_request(update: Update, context: CallbackContext) -> int:
 
 def admin_update_request(update: Update, context: CallbackContext) -> int:
     """Handle request status updates (approve, reject, complete)"""
+    if deny_non_admin(update):
+        return None
     query = update.callback_query
     query.answer()
     
@@ -1503,15 +1591,16 @@ def admin_update_request(update: Update, context: CallbackContext) -> int:
             updated = data_store.update_request(request)
             if updated:
                 query.message.edit_text(
-                    f"Запрос о пробеге #{request_id[:8]} был отклонен.",
+                    f"Запрос о пробеге #{request.code} был отклонен.",
                     reply_markup=InlineKeyboardMarkup([ 
                         [InlineKeyboardButton("🔙 Назад к меню", callback_data="admin_menu")]
                     ])
                 )
                 # Уведомляем пользователя
-                context.bot.send_message(
-                    chat_id=request.user_id,
-                    text=f"Ваш запрос о пробеге для {request.car_model} ({request.license_plate}) был отклонен администратором."
+                notifier.send_message(
+                    context.bot,
+                    request.user_id,
+                    f"Ваш запрос о пробеге для {request.car_model} ({request.license_plate}) был отклонен администратором."
                 )
             else:
                 query.message.edit_text("Не удалось обновить статус заявки.")
@@ -1546,6 +1635,8 @@ def admin_update_request(update: Update, context: CallbackContext) -> int:
 
 def save_admin_comment(update: Update, context: CallbackContext) -> int:
     """Save admin comment and update request status"""
+    if deny_non_admin(update):
+        return None
     
     # Получаем данные из контекста
     request_id = context.user_data.get('current_request_id')
@@ -1607,7 +1698,7 @@ def save_admin_comment(update: Update, context: CallbackContext) -> int:
     # Обновляем статус запроса в зависимости от действия
     if action == "approve":
         request.approve(notes)
-        user_message = f"✅ Ваша заявка #{request.id[:8]} принята в работу."
+        user_message = f"✅ Ваша заявка #{request.code} принята в работу."
         admin_message = f"✅ Заявка принята в работу."
 
     elif action == "reject":
@@ -1615,15 +1706,15 @@ def save_admin_comment(update: Update, context: CallbackContext) -> int:
         request.reject(notes)
         data_store.update_request(request)
         
-        user_message = f"❌ Ваша заявка #{request.id[:8]} отклонена. Причина: {notes}"
+        user_message = f"❌ Ваша заявка #{request.code} отклонена. Причина: {notes}"
         admin_message = f"❌ Заявка отклонена."
     elif action == "complete":
         request.complete(notes)
-        user_message = f"🏁 Ваша заявка #{request.id[:8]} выполнена."
+        user_message = f"🏁 Ваша заявка #{request.code} выполнена."
         admin_message = f"🏁 Заявка помечена как выполненная."
     elif action == "delete":
         # Сохраняем ID и пользователя перед удалением для отправки уведомления
-        request_id_short = request.id[:8]
+        request_code = request.code
         user_id = request.user_id
         car_model = request.car_model
         requested_work = request.requested_work
@@ -1634,13 +1725,13 @@ def save_admin_comment(update: Update, context: CallbackContext) -> int:
         data_store.delete_request(request.id)
         
         # После удаления request уже нет в системе, поэтому используем сохраненные данные
-        user_message = f"🗑️ Ваша заявка #{request_id_short} удалена из системы."
+        user_message = f"🗑️ Ваша заявка #{request_code} удалена из системы."
         admin_message = f"🗑️ Заявка полностью удалена из системы."
         
         # Обновляем user_id для отправки сообщения пользователю
         context.user_data['deleted_request_info'] = {
             'user_id': user_id,
-            'request_id_short': request_id_short,
+            'request_code': request_code,
             'car_model': car_model,
             'requested_work': requested_work,
             'preferred_date': preferred_date,
@@ -1649,7 +1740,7 @@ def save_admin_comment(update: Update, context: CallbackContext) -> int:
     elif action == "comment":
         request.admin_notes = notes
         data_store.update_request(request)
-        user_message = f"📝 К вашей заявке #{request.id[:8]} добавлен комментарий."
+        user_message = f"📝 К вашей заявке #{request.code} добавлен комментарий."
         admin_message = f"📝 Комментарий добавлен."
     
     # Проверяем, была ли удалена заявка
@@ -1665,9 +1756,10 @@ def save_admin_comment(update: Update, context: CallbackContext) -> int:
             time_str = f" в {request.preferred_time}" if request.preferred_time and request.preferred_time != "Любое время" else ""
             
             if request.requested_work == "Узнать пробег предыдущего техобслуживания":
-                context.bot.send_message(
-                    chat_id=request.user_id,
-                    text=(
+                notifier.send_message(
+                    context.bot,
+                    request.user_id,
+                    (
                         f"{user_message}\n\n"
                         f"🚗 {request.car_model}\n"
                         f"🔢 {request.license_plate}\n"
@@ -1678,9 +1770,10 @@ def save_admin_comment(update: Update, context: CallbackContext) -> int:
                     ])
                 )
             else:
-                context.bot.send_message(
-                    chat_id=request.user_id,
-                    text=(
+                notifier.send_message(
+                    context.bot,
+                    request.user_id,
+                    (
                         f"{user_message}\n\n"
                         f"🚗 {request.car_model}\n"
                         f"🔧 {request.requested_work}\n"
@@ -1727,6 +1820,8 @@ def menu_command(update: Update, context: CallbackContext) -> int:
 
 def handle_mileage_response(update: Update, context: CallbackContext) -> int:
     """Обработчик ответа специалиста по ТО на запрос о пробеге"""
+    if deny_non_admin(update, allow_mileage_admin=True):
+        return None
     query = update.callback_query
     query.answer()
     
@@ -1801,26 +1896,33 @@ def handle_mileage_response_text(update: Update, context: CallbackContext) -> in
     request.status = RequestStatus.COMPLETED.value 
     data_store.update_request(request)
     
-    # Уведомляем клиента
-    try:
-        context.bot.send_message(
-            chat_id=request.user_id,
-            text=(
-                "📊 Получена информация о пробеге предыдущего ТО:\n\n"
-                f"🚗 {request.car_model}\n"
-                f"🔢 {request.license_plate}\n\n"
-                f"{mileage_info}"
-            ),
-            reply_markup=InlineKeyboardMarkup([
-                [InlineKeyboardButton("👁 Просмотреть детали", callback_data=f"user_request_{request.id}")]
-            ])
-        )
-    except Exception as e:
-        logging.error(f"Ошибка при отправке уведомления пользователю: {e}")
-        update.message.reply_text(
-            f"⚠️ Информация сохранена, но не удалось отправить уведомление пользователю: {e}"
+    # Уведомляем клиента через очередь; об ошибке доставки специалист узнает отдельным сообщением
+    admin_chat_id = update.effective_chat.id
+    bot = context.bot
+    
+    def report_failure(error):
+        logging.error(f"Ошибка при отправке уведомления пользователю: {error}")
+        notifier.send_message(
+            bot,
+            admin_chat_id,
+            f"⚠️ Информация сохранена, но не удалось отправить уведомление пользователю: {error}"
         )
     
+    notifier.send_message(
+        bot,
+        request.user_id,
+        (
+            "📊 Получена информация о пробеге предыдущего ТО:\n\n"
+            f"🚗 {request.car_model}\n"
+            f"🔢 {request.license_plate}\n\n"
+            f"{mileage_info}"
+        ),
+        on_failure=report_failure,
+        reply_markup=InlineKeyboardMarkup([
+            [InlineKeyboardButton("👁 Просмотреть детали", callback_data=f"user_request_{request.id}")]
+        ])
+    )
+    
     # Подтверждаем специалисту, что информация отправлена и заявка выполнена
     update.message.reply_text(
         "✅ Информация о пробеге предыдущего ТО успешно отправлена клиенту, и заявка помечена как выполненная.",
@@ -1861,7 +1963,8 @@ def handle_notification_view(update: Update, context: CallbackContext) -> int:
         # Получаем заявку
         request = data_store.get_request(request_id)
         
-        if not request:
+        # Чужая заявка показывается так же, как несуществующая
+        if not request or not can_view_request(update.effective_user.id, request):
             logging.error(f"Request not found: {request_id}")
             query.message.reply_text(
                 "Заявка не найдена.",
@@ -1893,7 +1996,7 @@ def handle_notification_view(update: Update, context: CallbackContext) -> int:
         
         if request.requested_work == "Узнать пробег предыдущего техобслуживания":
             details_text = (
-                f"📊 Запрос информации о пробеге #{request.id[:8]}...\n\n"
+                f"📊 Запрос информации о пробеге #{request.code}...\n\n"
                 f"Статус: {status_text}\n"
                 f"Создан: {request.created_at.strftime('%d.%m.%Y %H:%M')}\n"
                 f"Клиент: {user_name}\n\n"
@@ -1905,7 +2008,7 @@ def handle_notification_view(update: Update, context: CallbackContext) -> int:
             )
         else:
             details_text = (
-                f"📋 Заявка #{request.id[:8]}...\n\n"
+                f"📋 Заявка #{request.code}...\n\n"
                 f"Статус: {status_text}\n"
                 f"Создана: {request.created_at.strftime('%d.%m.%Y %H:%M')}\n"
                 f"Клиент: {user_name}\n\n"
@@ -1972,6 +2075,230 @@ def handle_notification_view(update: Update, context: CallbackContext) -> int:
             pass
         return MAIN_MENU
 
+# Идентификаторы (UUID, числа, даты) в callback_data заменяются на "*",
+# чтобы статистика группировалась по обработчикам, а не по отдельным заявкам
+_CALLBACK_ID_RE = re.compile(r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}|\d[\d.]*')
+
+def describe_update(update: Update) -> str:
+    """Return a short label of the update used to group SQL statistics"""
+    if update.callback_query and update.callback_query.data:
+        return f"callback:{_CALLBACK_ID_RE.sub('*', update.callback_query.data)}"
+    if update.message and update.message.text and update.message.text.startswith('/'):
+        return f"command:{update.message.text.split()[0]}"
+    if update.message:
+        return "message"
+    return "other"
+
+def track_update_handler(update: Update, context: CallbackContext) -> None:
+    """Middleware: open the unit of work of this update, attribute its SQL statements and record user activity"""
+    begin_unit_of_work()
+    if sql_metrics.enabled:
+        sql_metrics.begin_update(describe_update(update))
+    if update.effective_user:
+        housekeeper.touch(update.effective_user.id)
+
+def finish_update_handler(update: Update, context: CallbackContext) -> None:
+    """Middleware: commit what is left in the unit of work and release its session and connection"""
+    end_unit_of_work()
+
+def still_processing(update: Update, context: CallbackContext) -> None:
+    """Ответ на нажатие кнопки, пока предыдущее действие пользователя еще выполняется"""
+    update.callback_query.answer("⏳ Предыдущее действие еще выполняется, подождите...")
+
+def _heavy(callback):
+    """
+    Маршрут для медленного callback, выполняемого в пуле потоков диспетчера
+    
+    Пока такой обработчик выполняется, ConversationHandler держит состояние
+    пользователя в ожидании (ConversationHandler.WAITING), поэтому повторное
+    нажатие кнопки не запустит действие второй раз.
+    
+    Args:
+        callback: функция-обработчик
+        
+    Returns:
+        Route: обработчик и признак run_async для CallbackRouter
+    """
+    if not RUN_ASYNC_HANDLERS:
+        return Route(callback, False)
+    
+    @functools.wraps(callback)
+    def run_in_worker(update, context):
+        # Middleware выполняется в потоке диспетчера, поэтому метку SQL-статистики
+        # и отдельную единицу работы для потока из пула открываем здесь
+        if sql_metrics.enabled:
+            sql_metrics.set_handler(describe_update(update))
+        with unit_of_work():
+            return callback(update, context)
+    
+    return Route(run_in_worker, True)
+
+def _heavy_handler(handler_class, callback, *args, **kwargs):
+    """
+    Создание обработчика для медленного callback (см. _heavy)
+    
+    Args:
+        handler_class: класс обработчика (MessageHandler, CommandHandler, ...)
+        callback: функция-обработчик
+        *args, **kwargs: остальные параметры конструктора обработчика
+    """
+    route = _heavy(callback)
+    return handler_class(*args, callback=route.callback, run_async=route.run_async, **kwargs)
+
+def sql_stats_command(update: Update, context: CallbackContext) -> None:
+    """Команда /sqlstats [on|off|reset|dump] - статистика SQL-запросов для администраторов"""
+    if update.effective_user.id not in ADMIN_IDS:
+        return
+    
+    action = context.args[0].lower() if context.args else ""
+    
+    if action == "on":
+        sql_metrics.enable(engine)
+        text = "✅ Сбор статистики SQL включен."
+    elif action == "off":
+        sql_metrics.disable()
+        text = "⏹ Сбор статистики SQL выключен."
+    elif action == "reset":
+        sql_metrics.reset()
+        text = "🔄 Статистика SQL сброшена."
+    elif action == "dump":
+        try:
+            path = sql_metrics.dump_to_file(SQL_METRICS_DUMP_PATH)
+            text = f"💾 Статистика SQL сохранена в файл {path}."
+        except OSError as e:
+            logging.error(f"Ошибка при сохранении статистики SQL: {e}")
+            text = f"❌ Не удалось сохранить статистику SQL: {e}"
+    else:
+        cache_stats = data_store.user_cache.stats()
+        text = (
+            f"{sql_metrics.format_report()}\n\n"
+            f"👤 Кэш пользователей: {cache_stats['size']}/{cache_stats['maxsize']} записей, "
+            f"попаданий {cache_stats['hits']}, промахов {cache_stats['misses']}, "
+            f"вытеснений {cache_stats['evictions']}"
+        )
+    
+    update.message.reply_text(text)
+
+def notify_stats_command(update: Update, context: CallbackContext) -> None:
+    """Команда /notifystats - состояние очереди уведомлений для администраторов"""
+    if update.effective_user.id not in ADMIN_IDS:
+        return
+    
+    stats = notifier.stats()
+    update.message.reply_text(
+        "📨 Очередь уведомлений\n\n"
+        f"В очереди: {stats['queued']}\n"
+        f"Поставлено: {stats['enqueued']}\n"
+        f"Отправлено: {stats['sent']}\n"
+        f"Повторов: {stats['retried']}\n"
+        f"Не отправлено: {stats['failed']}\n"
+        f"Среднее время доставки: {stats['avg_delivery_seconds']} с"
+    )
+
+def rate_stats_command(update: Update, context: CallbackContext) -> None:
+    """Команда /ratestats [reset] - статистика защиты от флуда для администраторов"""
+    if update.effective_user.id not in ADMIN_IDS:
+        return
+    
+    if context.args and context.args[0].lower() == "reset":
+        flood_protection.reset()
+        update.message.reply_text("🔄 Статистика защиты от флуда сброшена.")
+        return
+    
+    stats = flood_protection.stats()
+    lines = [
+        "🚦 Защита от флуда\n",
+        f"Режим: {flood_protection.mode}",
+        f"Проверено обновлений: {stats['checked']}",
+        f"Отброшено: {stats['limited']}",
+        f"Предупреждений: {stats['notified']}",
+        f"Корзин пользователей: {stats['user_buckets']}, чатов: {stats['chat_buckets']}",
+    ]
+    if stats['top_users']:
+        lines.append("\nЧаще всего ограничивались:")
+        for user_id, limited in stats['top_users']:
+            lines.append(f"{user_id}: {limited}")
+    
+    update.message.reply_text("\n".join(lines))
+
+def mem_stats_command(update: Update, context: CallbackContext) -> None:
+    """Команда /memstats [cleanup] - память, занятая диалогами пользователей, для администраторов"""
+    if update.effective_user.id not in ADMIN_IDS:
+        return
+    
+    lines = []
+    if context.args and context.args[0].lower() == "cleanup":
+        expired, evicted = housekeeper.cleanup()
+        lines.append(f"🧹 Завершено диалогов: {expired}, удалено user_data: {evicted}\n")
+    
+    report = housekeeper.memory_report(STATE_NAMES)
+    total = report['total']
+    lines += [
+        "🧠 Память диалогов\n",
+        f"Активных диалогов: {total['conversations']}",
+        f"user_data: {total['user_data_entries']} (непустых {total['user_data_nonempty']}), "
+        f"{total['user_data_bytes'] / 1024:.1f} КБ",
+        f"Отслеживаемых пользователей: {total['tracked_users']}",
+        f"Завершено по таймауту: {total['expired_conversations']}, "
+        f"удалено user_data: {total['evicted_user_data']}",
+    ]
+    if report['states']:
+        lines.append("\nПо состояниям (диалогов, user_data):")
+        for name, count, size in report['states'][:20]:
+            lines.append(f"{name}: {count}, {size / 1024:.1f} КБ")
+    
+    update.message.reply_text("\n".join(lines))
+
+def capacity_command(update: Update, context: CallbackContext) -> None:
+    """
+    Команда /capacity - занятость дат записи для администраторов
+    
+    /capacity - занятость дат, открытых для записи
+    /capacity ДД.ММ.ГГГГ N - установить N мест на дату (0 - без ограничения)
+    /capacity ДД.ММ.ГГГГ default - вернуть количество мест по умолчанию
+    """
+    if update.effective_user.id not in ADMIN_IDS:
+        return
+    
+    if context.args:
+        if len(context.args) != 2:
+            update.message.reply_text(
+                "Использование:\n"
+                "/capacity - занятость дат\n"
+                "/capacity ДД.ММ.ГГГГ N - установить количество мест (0 - без ограничения)\n"
+                "/capacity ДД.ММ.ГГГГ default - количество мест по умолчанию"
+            )
+            return
+        
+        date_str, value = context.args
+        visit_date = parse_visit_date(date_str)
+        try:
+            if visit_date is None:
+                raise ValueError(date_str)
+            capacity = None if value.lower() == "default" else int(value)
+            if capacity is not None and capacity < 0:
+                raise ValueError(value)
+        except ValueError:
+            update.message.reply_text("❌ Неверный формат. Пример: /capacity 21.10.2025 5")
+            return
+        
+        if data_store.set_day_capacity(visit_date, capacity):
+            update.message.reply_text(f"✅ Количество мест на {date_str} изменено.")
+        else:
+            update.message.reply_text("❌ Не удалось изменить количество мест.")
+        return
+    
+    availability = data_store.get_date_availability(booking_calendar.available_dates())
+    lines = ["📅 Занятость дат записи\n"]
+    for visit_date, (booked, capacity) in availability.items():
+        date_str = visit_date.strftime(VISIT_DATE_FORMAT)
+        if capacity:
+            mark = " ❌" if booked >= capacity else ""
+            lines.append(f"{date_str}: {booked}/{capacity}{mark}")
+        else:
+            lines.append(f"{date_str}: {booked} (без ограничения)")
+    update.message.reply_text("\n".join(lines))
+
 def cancel(update: Update, context: CallbackContext) -> int:
     """Cancel the conversation"""
     try:
@@ -1985,40 +2312,89 @@ def cancel(update: Update, context: CallbackContext) -> int:
     
     return ConversationHandler.END
 
+def register_keyboards():
+    """Регистрация статичных клавиатур; они перестраиваются при изменении каталога"""
+    keyboards.register("car_brands", create_brand_buttons, source=lambda: sorted(CAR_BRANDS))
+    keyboards.register("car_years", create_year_buttons, source=lambda: CAR_YEARS)
+    keyboards.register(
+        "car_models", create_model_buttons,
+        source=lambda car_brand: CAR_BRANDS[car_brand],
+        variants=lambda: [(brand,) for brand in CAR_BRANDS]
+    )
+    keyboards.register("admin_menu", create_admin_menu_buttons)
+    # Клавиатура дат перестраивается, когда после полуночи меняется окно записи
+    # или когда дата заполняется (занятость проверяется одним агрегирующим запросом)
+    keyboards.register(
+        "booking_dates", booking_calendar.create_buttons,
+        source=lambda: (booking_calendar.available_dates(), booking_calendar.full_dates())
+    )
+
 def register_handlers(dispatcher):
+    # Готовим клавиатуры заранее, чтобы первые нажатия не тратили время на их построение
+    register_keyboards()
+    keyboards.warm_up()
+    
+    # Защита от флуда: выполняется первой и останавливает обработку лишних обновлений
+    if flood_protection.enabled:
+        dispatcher.add_handler(TypeHandler(Update, flood_protection), group=-2)
+    
+    # Middleware: выполняется до основных обработчиков для каждого обновления
+    dispatcher.add_handler(TypeHandler(Update, track_update_handler), group=-1)
+    # Завершение единицы работы после всех основных обработчиков
+    dispatcher.add_handler(TypeHandler(Update, finish_update_handler), group=100)
+    
+    # Служебные команды администраторов
+    dispatcher.add_handler(CommandHandler("sqlstats", sql_stats_command))
+    dispatcher.add_handler(CommandHandler("notifystats", notify_stats_command))
+    dispatcher.add_handler(CommandHandler("capacity", capacity_command))
+    dispatcher.add_handler(CommandHandler("memstats", mem_stats_command))
+    dispatcher.add_handler(CommandHandler("ratestats", rate_stats_command))
+    
     # Main conversation handler
     dispatcher.add_handler(CallbackQueryHandler(handle_mileage_admin_response, pattern=r'^mileage_respond_\d+$'))
+    # Маршруты inline-кнопок, общие для нескольких состояний
+    menu_routes = {
+        "new_request": start_new_request,
+        "my_requests": show_my_requests,
+        "admin_menu": show_admin_menu,
+        "main_menu": show_main_menu,
+    }
+    notification_routes = {
+        "notification_view_*": _heavy(handle_notification_view),
+    }
+    admin_request_routes = {
+        "admin_view_*": admin_view_request,
+        "approve_*": admin_update_request,
+        "reject_*": admin_update_request,
+        "complete_*": admin_update_request,
+        "delete_*": admin_update_request,
+        "comment_*": admin_update_request,
+        "mileage_response_*": handle_mileage_response,
+    }
+    
     conv_handler = ConversationHandler(
         entry_points=[
             CommandHandler("start", start),
             CommandHandler("menu", menu_command),
             MessageHandler(Filters.regex("^🏠 Главное меню$"), handle_main_menu_button),
-            CallbackQueryHandler(start_new_request, pattern="^new_request$"),
-            CallbackQueryHandler(show_my_requests, pattern="^my_requests$"),
-            CallbackQueryHandler(show_admin_menu, pattern="^admin_menu$"),
-            CallbackQueryHandler(show_main_menu, pattern="^main_menu$"),
+            CallbackRouter(menu_routes),
         ],
         states={
             None: [
-                CallbackQueryHandler(start_new_request, pattern="^new_request$"),
-                CallbackQueryHandler(show_my_requests, pattern="^my_requests$"),
-                CallbackQueryHandler(show_admin_menu, pattern="^admin_menu$"),
-                CallbackQueryHandler(show_main_menu, pattern="^main_menu$"),
-                CallbackQueryHandler(handle_notification_view, pattern="^notification_view_"),
-                CallbackQueryHandler(admin_view_request, pattern="^admin_view_"),
-                CallbackQueryHandler(admin_update_request, pattern="^approve_"),
-                CallbackQueryHandler(admin_update_request, pattern="^reject_"),
-                CallbackQueryHandler(admin_update_request, pattern="^complete_"),
-                CallbackQueryHandler(admin_update_request, pattern="^delete_"),
-                CallbackQueryHandler(admin_update_request, pattern="^comment_"),
-                CallbackQueryHandler(handle_mileage_response, pattern="^mileage_response_"),
-                CallbackQueryHandler(show_request_details, pattern="^user_request_"),
-                CallbackQueryHandler(save_admin_comment, pattern="^no_comment_"),
-                CallbackQueryHandler(register_callback, pattern="^register$"),
+                CallbackRouter({
+                    **menu_routes,
+                    **notification_routes,
+                    **admin_request_routes,
+                    "user_request_*": show_request_details,
+                    "no_comment_*": _heavy(save_admin_comment),
+                    "register": register_callback,
+                }),
             ],
             START: [
-                CallbackQueryHandler(register_callback, pattern='^register$'),
-                CallbackQueryHandler(show_main_menu, pattern="^main_menu$"),
+                CallbackRouter({
+                    "register": register_callback,
+                    "main_menu": show_main_menu,
+                }),
             ],
             REGISTER_NAME: [
                 MessageHandler(Filters.text & ~Filters.command, register_name)
@@ -2030,30 +2406,32 @@ def register_handlers(dispatcher):
                 MessageHandler(Filters.contact | Filters.text & ~Filters.command, register_phone),
             ],
             MAIN_MENU: [
-                CallbackQueryHandler(start_new_request, pattern="^new_request$"),
-                CallbackQueryHandler(show_my_requests, pattern="^my_requests$"),
-                CallbackQueryHandler(show_admin_menu, pattern="^admin_menu$"),
-                CallbackQueryHandler(show_main_menu, pattern="^main_menu$"),
-                CallbackQueryHandler(handle_notification_view, pattern="^notification_view_"),
+                CallbackRouter({**menu_routes, **notification_routes}),
                 MessageHandler(Filters.regex("^🏠 Главное меню$"), handle_main_menu_button),
             ],
             FORM_CAR_BRAND: [
-                CallbackQueryHandler(process_car_brand, pattern="^brand_"),
-                CallbackQueryHandler(show_main_menu, pattern="^main_menu$"),
-                CallbackQueryHandler(handle_notification_view, pattern="^notification_view_"),
+                CallbackRouter({
+                    "brand_*": process_car_brand,
+                    "main_menu": show_main_menu,
+                    **notification_routes,
+                }),
             ],
             FORM_CAR_MODEL: [
-                CallbackQueryHandler(process_car_model_selection, pattern="^model_"),
-                CallbackQueryHandler(start_new_request, pattern="^new_request$"),
-                CallbackQueryHandler(handle_notification_view, pattern="^notification_view_"),
+                CallbackRouter({
+                    "model_*": process_car_model_selection,
+                    "new_request": start_new_request,
+                    **notification_routes,
+                }),
             ],
             FORM_MODEL_MANUAL: [
                 MessageHandler(Filters.text & ~Filters.command, process_model_manual),
             ],
             FORM_CAR_YEAR: [
-                CallbackQueryHandler(process_car_year, pattern="^year_"),
-                CallbackQueryHandler(start_new_request, pattern="^new_request$"),
-                CallbackQueryHandler(handle_notification_view, pattern="^notification_view_"),
+                CallbackRouter({
+                    "year_*": process_car_year,
+                    "new_request": start_new_request,
+                    **notification_routes,
+                }),
             ],
             FORM_LICENSE_PLATE: [
                 MessageHandler(Filters.text & ~Filters.command, process_license_plate),
@@ -2062,59 +2440,72 @@ def register_handlers(dispatcher):
                 MessageHandler(Filters.text & ~Filters.command, process_mileage),
             ],
             FORM_WORK_TYPE: [
-                CallbackQueryHandler(process_work_type, pattern="^work_type_"),
-                CallbackQueryHandler(show_main_menu, pattern="^main_menu$"),
-                CallbackQueryHandler(handle_notification_view, pattern="^notification_view_"),
+                CallbackRouter({
+                    "work_type_*": process_work_type,
+                    "main_menu": show_main_menu,
+                    **notification_routes,
+                }),
             ],
             FORM_WORK_MANUAL: [
                 MessageHandler(Filters.text & ~Filters.command, process_work_manual),
             ],
             FORM_SELECT_DATE: [
-                CallbackQueryHandler(process_date_selection, pattern=r'^date_')
+                CallbackRouter({"date_*": process_date_selection}),
             ],
             FORM_PHONE_CHOICE: [
-                CallbackQueryHandler(process_phone_choice, pattern=r'^use_saved_phone$'),
-                CallbackQueryHandler(process_phone_choice, pattern=r'^enter_new_phone$'),
-                CallbackQueryHandler(handle_notification_view, pattern=r'^notification_view_'),
+                CallbackRouter({
+                    "use_saved_phone": process_phone_choice,
+                    "enter_new_phone": process_phone_choice,
+                    **notification_routes,
+                }),
             ],
             FORM_PHONE: [
                 MessageHandler(Filters.text & ~Filters.command, process_phone),
             ],
             FORM_CONFIRM: [
-                CallbackQueryHandler(confirm_request, pattern="^confirm$"),
-                CallbackQueryHandler(cancel_request, pattern="^cancel$"),
-                CallbackQueryHandler(handle_notification_view, pattern="^notification_view_"),
+                CallbackRouter({
+                    "confirm": _heavy(confirm_request),
+                    "cancel": cancel_request,
+                    **notification_routes,
+                }),
             ],
             MY_REQUESTS: [
-                CallbackQueryHandler(show_request_details, pattern="^user_request_"),
-                CallbackQueryHandler(show_main_menu, pattern="^main_menu$"),
-                CallbackQueryHandler(show_my_requests, pattern="^my_requests$"),
-                CallbackQueryHandler(handle_notification_view, pattern="^notification_view_"),
+                CallbackRouter({
+                    "user_request_*": show_request_details,
+                    "main_menu": show_main_menu,
+                    "my_requests": show_my_requests,
+                    **notification_routes,
+                }),
             ],
             ADMIN_MENU: [
-                CallbackQueryHandler(show_admin_menu, pattern="^admin_menu$"),
-                CallbackQueryHandler(show_admin_requests, pattern="^admin_requests_"),
-                CallbackQueryHandler(show_admin_requests, pattern="^admin_mileage_requests$"),
-                CallbackQueryHandler(admin_view_request, pattern="^admin_view_"),
-                CallbackQueryHandler(admin_update_request, pattern="^approve_"),
-                CallbackQueryHandler(admin_update_request, pattern="^reject_"),
-                CallbackQueryHandler(admin_update_request, pattern="^complete_"),
-                CallbackQueryHandler(admin_update_request, pattern="^delete_"),
-                CallbackQueryHandler(admin_update_request, pattern="^comment_"),
-                CallbackQueryHandler(handle_mileage_response, pattern="^mileage_response_"),
-                CallbackQueryHandler(handle_notification_view, pattern="^notification_view_"),
-                CallbackQueryHandler(show_main_menu, pattern="^main_menu$"),
+                CallbackRouter({
+                    "admin_menu": show_admin_menu,
+                    "admin_requests_*": _heavy(show_admin_requests),
+                    "admin_mileage_requests": _heavy(show_admin_requests),
+                    "admin_page_prev": change_admin_requests_page,
+                    "admin_page_next": change_admin_requests_page,
+                    "admin_schedule": show_admin_schedule,
+                    "admin_schedule_*": show_admin_schedule,
+                    **admin_request_routes,
+                    **notification_routes,
+                    "main_menu": show_main_menu,
+                }),
             ],
             ADMIN_NOTE: [
-                MessageHandler(Filters.text & ~Filters.command, save_admin_comment),
-                CommandHandler("skip", save_admin_comment),
-                CallbackQueryHandler(save_admin_comment, pattern="^no_comment_"),
-                CallbackQueryHandler(show_admin_menu, pattern="^admin_menu$"),
-                CallbackQueryHandler(handle_notification_view, pattern="^notification_view_"),
+                _heavy_handler(MessageHandler, save_admin_comment, Filters.text & ~Filters.command),
+                _heavy_handler(CommandHandler, save_admin_comment, "skip"),
+                CallbackRouter({
+                    "no_comment_*": _heavy(save_admin_comment),
+                    "admin_menu": show_admin_menu,
+                    **notification_routes,
+                }),
+            ],
+            ConversationHandler.WAITING: [
+                CallbackQueryHandler(still_processing),
             ],
             MILEAGE_RESPONSE_TEXT: [
                 MessageHandler(Filters.text & ~Filters.command, process_mileage_response_text),
-                CallbackQueryHandler(show_admin_menu, pattern=r'^admin_menu$')
+                CallbackRouter({"admin_menu": show_admin_menu}),
             ],
         },
         fallbacks=[
@@ -2123,7 +2514,11 @@ def register_handlers(dispatcher):
         ],
         per_chat=False,
         name="autoservice_bot",
-        persistent=False,
+        # Состояния диалогов сохраняются, если у диспетчера настроено хранилище (см. persistence.py)
+        persistent=dispatcher.persistence is not None,
     )
     
-    dispatcher.add_handler(conv_handler)
\ No newline at end of file
+    dispatcher.add_handler(conv_handler)
+    
+    # Периодическое завершение брошенных диалогов и удаление устаревших user_data
+    housekeeper.attach(dispatcher, conv_handler, interval=HOUSEKEEPING_INTERVAL)
\ No newline at end of file
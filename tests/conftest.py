@@ -0,0 +1,54 @@
+"""
+Общие фикстуры тестов
+
+База данных - временный файл SQLite: движок создается при импорте модуля
+database по переменной окружения DATABASE_URL, поэтому она задается до
+импорта модулей бота.
+"""
+import os
+import sys
+import tempfile
+import threading
+
+_db_dir = tempfile.mkdtemp(prefix="autoservice-tests-")
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_db_dir, 'test.db')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from database import init_db, engine, Session
+from models import Base
+from data_store import DataStore
+
+@pytest.fixture
+def store():
+    """Хранилище данных на пустой базе данных"""
+    init_db()
+    yield DataStore()
+    Session.remove()
+    Base.metadata.drop_all(engine)
+
+def run_concurrently(target, count):
+    """
+    Одновременный вызов target(i) в count потоках
+    
+    Потоки ждут друг друга на барьере, чтобы вызовы начались одновременно.
+    
+    Returns:
+        list: результаты или исключения вызовов, по порядку потоков
+    """
+    barrier = threading.Barrier(count)
+    results = [None] * count
+    
+    def worker(index):
+        barrier.wait()
+        try:
+            results[index] = target(index)
+        except Exception as e:
+            results[index] = e
+    
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
@@ -0,0 +1,195 @@
+"""
+Тесты операций записи DataStore
+"""
+import datetime
+import threading
+import pytest
+from sqlalchemy import func, select
+from database import get_session, close_session
+from models import User, ServiceRequest, RequestStatus
+from data_store import DayFullError
+from read_models import UserSummary
+from conftest import run_concurrently
+
+VISIT_DATE = datetime.date(2030, 1, 15)
+
+def make_request(user_id, preferred_date="15.01.2030"):
+    return ServiceRequest(
+        user_id=user_id,
+        car_model="Lada Vesta",
+        license_plate="А123ВС",
+        mileage=10000,
+        requested_work="ТО",
+        preferred_date=preferred_date,
+        preferred_time=None,
+        phone="+79990000000"
+    )
+
+def load_user(telegram_id):
+    """Пользователь, загруженный из базы данных (как в обработчиках до кэша)"""
+    session = get_session()
+    try:
+        return session.get(User, telegram_id)
+    finally:
+        close_session(session)
+
+def count_requests(visit_date):
+    session = get_session()
+    try:
+        return session.scalar(
+            select(func.count()).select_from(ServiceRequest).where(ServiceRequest.visit_date == visit_date)
+        )
+    finally:
+        close_session(session)
+
+def test_add_request_rejects_full_day(store):
+    store.add_user(User(telegram_id=1, first_name="Иван"))
+    store.set_day_capacity(VISIT_DATE, 1)
+    
+    assert store.add_request(make_request(1), check_capacity=True).id is not None
+    with pytest.raises(DayFullError):
+        store.add_request(make_request(1), check_capacity=True)
+    assert count_requests(VISIT_DATE) == 1
+
+def test_rejected_request_frees_place(store):
+    store.add_user(User(telegram_id=1, first_name="Иван"))
+    store.set_day_capacity(VISIT_DATE, 1)
+    request = store.add_request(make_request(1), check_capacity=True)
+    
+    request = store.get_request(request.id)
+    request.status = RequestStatus.REJECTED.value
+    assert store.update_request(request)
+    
+    assert store.add_request(make_request(1), check_capacity=True).id is not None
+
+def test_add_request_without_capacity_check_ignores_limit(store):
+    store.add_user(User(telegram_id=1, first_name="Иван"))
+    store.set_day_capacity(VISIT_DATE, 1)
+    
+    store.add_request(make_request(1), check_capacity=True)
+    assert store.add_request(make_request(1)).id is not None
+    assert count_requests(VISIT_DATE) == 2
+
+def test_add_request_for_unknown_user(store):
+    assert store.add_request(make_request(42), check_capacity=True) is None
+
+def test_add_user_keeps_existing_user(store):
+    added = store.add_user(User(telegram_id=1, first_name="Иван", phone="+79990000001"))
+    existing = store.add_user(User(telegram_id=1, first_name="Петр", phone="+79990000002"))
+    
+    # Оба пути возвращают снимок одного типа
+    assert type(added) is type(existing) is UserSummary
+    
+    assert existing.first_name == "Иван"
+    assert existing.phone == "+79990000001"
+    assert load_user(1).first_name == "Иван"
+    assert len(store.get_all_users()) == 1
+
+def test_update_user_writes_only_changed_fields(store):
+    store.add_user(User(telegram_id=1, first_name="Иван", phone="+79990000001"))
+    first = load_user(1)
+    second = load_user(1)
+    
+    first.phone = "+79990000002"
+    second.first_name = "Петр"
+    assert store.update_user(first)
+    assert store.update_user(second)
+    
+    user = load_user(1)
+    assert user.phone == "+79990000002"
+    assert user.first_name == "Петр"
+    assert store.get_user(1).phone == "+79990000002"
+
+def test_update_request_writes_only_changed_fields(store):
+    store.add_user(User(telegram_id=1, first_name="Иван"))
+    request_id = store.add_request(make_request(1)).id
+    first = store.get_request(request_id)
+    second = store.get_request(request_id)
+    
+    first.status = RequestStatus.APPROVED.value
+    second.admin_notes = "Позвонить клиенту"
+    assert store.update_request(first)
+    assert store.update_request(second)
+    
+    request = store.get_request(request_id)
+    assert request.status == RequestStatus.APPROVED.value
+    assert request.admin_notes == "Позвонить клиенту"
+    assert request.car_model == "Lada Vesta"
+
+def test_update_missing_request(store):
+    store.add_user(User(telegram_id=1, first_name="Иван"))
+    request = store.add_request(make_request(1))
+    assert store.delete_request(request.id)
+    
+    request.status = RequestStatus.APPROVED.value
+    assert not store.update_request(request)
+
+def test_concurrent_add_user_inserts_one_row(store):
+    results = run_concurrently(lambda index: store.add_user(User(telegram_id=1, first_name=f"Иван {index}")), 8)
+    
+    assert all(result is not None and not isinstance(result, Exception) for result in results)
+    assert {result.telegram_id for result in results} == {1}
+    assert len(store.get_all_users()) == 1
+    # Все вызовы вернули одного и того же (первого вставленного) пользователя
+    assert {result.first_name for result in results} == {load_user(1).first_name}
+
+def test_concurrent_add_request_takes_last_place_once(store):
+    store.add_user(User(telegram_id=1, first_name="Иван"))
+    store.set_day_capacity(VISIT_DATE, 1)
+    
+    results = run_concurrently(lambda index: store.add_request(make_request(1), check_capacity=True), 8)
+    
+    added = [result for result in results if isinstance(result, ServiceRequest)]
+    assert len(added) == 1
+    assert all(isinstance(result, DayFullError) for result in results if result not in added)
+    assert count_requests(VISIT_DATE) == 1
+
+def test_concurrent_update_request_keeps_all_changes(store):
+    store.add_user(User(telegram_id=1, first_name="Иван"))
+    request_id = store.add_request(make_request(1)).id
+    fields = ('status', 'admin_notes', 'phone', 'license_plate')
+    values = (RequestStatus.APPROVED.value, "Позвонить клиенту", "+79990000009", "В456ОР")
+    
+    def update_field(index):
+        request = store.get_request(request_id)
+        setattr(request, fields[index], values[index])
+        return store.update_request(request)
+    
+    assert run_concurrently(update_field, len(fields)) == [True] * len(fields)
+    request = store.get_request(request_id)
+    assert tuple(getattr(request, field) for field in fields) == values
+
+def test_get_user_is_never_stale_after_write(store):
+    store.add_user(User(telegram_id=1, first_name="Иван", phone="0"))
+    store.get_user(1)
+    # Последняя версия, запись которой завершилась (номер телефона и ID добавленного пользователя)
+    committed = {'version': 0}
+    done = threading.Event()
+    stale = []
+    
+    def writer():
+        try:
+            for version in range(1, 101):
+                assert store.update_user(User(telegram_id=1, first_name="Иван", phone=str(version)))
+                assert store.add_user(User(telegram_id=1000 + version, first_name="Петр")) is not None
+                committed['version'] = version
+        finally:
+            done.set()
+    
+    def reader():
+        while not done.is_set():
+            version = committed['version']
+            user = store.get_user(1)
+            if int(user.phone) < version:
+                stale.append(('phone', version, user.phone))
+            if version and store.get_user(1000 + version) is None:
+                stale.append(('added', version, None))
+    
+    threads = [threading.Thread(target=writer)] + [threading.Thread(target=reader) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    assert stale == []
+    assert store.get_user(1).phone == "100"
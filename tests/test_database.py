@@ -0,0 +1,73 @@
+"""
+Тесты настроек базы данных и работы пула соединений под нагрузкой
+"""
+import os
+import subprocess
+import sys
+from sqlalchemy import func, select
+from config import DB_POOL_SIZE, DB_MAX_OVERFLOW, SQLITE_BUSY_TIMEOUT_MS
+from database import engine, get_session, close_session
+from models import User, ServiceRequest, RequestStatus
+from conftest import run_concurrently
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def test_invalid_settings_fall_back_to_defaults(tmp_path):
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{tmp_path / 'settings.db'}",
+        DB_POOL_SIZE="abc",
+        SQLITE_BUSY_TIMEOUT_MS="10s",
+        SQLITE_JOURNAL_MODE="fast",
+        SQL_SLOW_QUERY_MS="slow",
+    )
+    result = subprocess.run(
+        [sys.executable, "-c",
+         "import database, config; "
+         "print(database.engine.pool.size(), config.SQLITE_BUSY_TIMEOUT_MS, "
+         "config.SQLITE_JOURNAL_MODE, database.sql_metrics.slow_query_ms)"],
+        cwd=ROOT, env=env, capture_output=True, text=True
+    )
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.split() == ["8", "10000", "WAL", "200.0"]
+    assert "Invalid DB_POOL_SIZE" in result.stderr
+    assert "Invalid SQLITE_JOURNAL_MODE" in result.stderr
+
+def test_connections_use_wal_and_busy_timeout(store):
+    with engine.connect() as connection:
+        assert connection.exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
+        assert connection.exec_driver_sql("PRAGMA busy_timeout").scalar() == SQLITE_BUSY_TIMEOUT_MS
+
+def test_concurrent_writers_more_than_pool(store):
+    # Потоков больше, чем соединений в пуле: лишние ждут свободного соединения,
+    # а писатели в SQLite - освобождения блокировки (busy_timeout)
+    writers = DB_POOL_SIZE + DB_MAX_OVERFLOW + 8
+    writes_per_thread = 10
+    for telegram_id in range(writers):
+        store.add_user(User(telegram_id=telegram_id, first_name=f"Пользователь {telegram_id}"))
+    
+    def write(telegram_id):
+        for _ in range(writes_per_thread):
+            request = ServiceRequest(
+                telegram_id, "Lada Vesta", "А123ВС", 10000, "ТО", "01.01.2030", None, "+79990000000"
+            )
+            if store.add_request(request) is None:
+                return False
+            request = store.get_request(request.id)
+            request.status = RequestStatus.APPROVED.value
+            if not store.update_request(request):
+                return False
+        return True
+    
+    assert run_concurrently(write, writers) == [True] * writers
+    
+    session = get_session()
+    try:
+        approved = session.scalar(
+            select(func.count()).select_from(ServiceRequest)
+            .where(ServiceRequest.status == RequestStatus.APPROVED.value)
+        )
+    finally:
+        close_session(session)
+    assert approved == writers * writes_per_thread
+    assert engine.pool.checkedout() == 0
@@ -0,0 +1,82 @@
+"""
+Тесты завершения брошенных диалогов
+"""
+import os
+import subprocess
+import sys
+from queue import Queue
+from types import SimpleNamespace
+from unittest import mock
+from telegram import Bot, Update
+from telegram.ext import CommandHandler, ConversationHandler, Dispatcher, Filters, MessageHandler
+from housekeeping import ConversationHousekeeper, end_conversation
+from persistence import create_persistence
+from webhook_replay import OfflineRequest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CAR_MODEL, LICENSE_PLATE = range(2)
+USER = {"id": 1, "is_bot": False, "first_name": "Иван"}
+
+def start_bot(filename):
+    persistence = create_persistence(filename)
+    dispatcher = Dispatcher(Bot("123456:test", request=OfflineRequest()), Queue(), persistence=persistence)
+    conversation = ConversationHandler(
+        entry_points=[CommandHandler("start", lambda update, context: CAR_MODEL)],
+        states={CAR_MODEL: [MessageHandler(Filters.text, lambda update, context: LICENSE_PLATE)]},
+        fallbacks=[],
+        per_chat=False,
+        name="form",
+        persistent=True,
+    )
+    dispatcher.add_handler(conversation)
+    return dispatcher, conversation, persistence
+
+def send_start(dispatcher):
+    message = {
+        "message_id": 1, "date": 0, "chat": {"id": USER["id"], "type": "private"},
+        "from": USER, "text": "/start",
+        "entities": [{"type": "bot_command", "offset": 0, "length": 6}],
+    }
+    dispatcher.process_update(Update.de_json({"update_id": 1, "message": message}, dispatcher.bot))
+
+def test_idle_conversation_is_ended_and_not_restored(tmp_path):
+    state_file = str(tmp_path / "bot_state.pickle")
+    dispatcher, conversation, persistence = start_bot(state_file)
+    send_start(dispatcher)
+    dispatcher.user_data[USER["id"]]['car_brand'] = "Toyota"
+
+    housekeeper = ConversationHousekeeper(conversation_timeout=10, user_data_ttl=0)
+    housekeeper.dispatcher = dispatcher
+    housekeeper.conversation_handler = conversation
+    housekeeper.touch(USER["id"])
+    with mock.patch("housekeeping.time.monotonic", return_value=housekeeper._last_seen[USER["id"]] + 11):
+        assert housekeeper.cleanup() == (1, 0)
+
+    assert conversation.conversations == {}
+    assert dispatcher.user_data[USER["id"]] == {}
+    persistence.flush()
+
+    dispatcher, conversation, persistence = start_bot(state_file)
+    assert conversation.conversations == {}
+
+def test_end_conversation_without_update_state():
+    persistence = mock.Mock()
+    handler = SimpleNamespace(
+        conversations={(1,): CAR_MODEL}, persistence=persistence, persistent=True, name="form"
+    )
+    end_conversation(handler, (1,))
+    end_conversation(handler, (2,))
+
+    assert handler.conversations == {}
+    persistence.update_conversation.assert_called_once_with("form", (1,), None)
+
+def test_state_names_ignore_other_int_settings():
+    env = dict(os.environ, MILEAGE_ADMIN_ID="123456789")
+    result = subprocess.run(
+        [sys.executable, "-c",
+         "import telegram_handlers as th; "
+         "print(len(th.STATE_NAMES), th.STATE_NAMES.get(123456789))"],
+        cwd=ROOT, env=env, capture_output=True, text=True
+    )
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.split() == ["27", "None"]
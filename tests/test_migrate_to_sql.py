@@ -0,0 +1,124 @@
+"""
+Тесты продолжения массовой миграции из JSON после прерывания
+"""
+import json
+import os
+import uuid
+import pytest
+from sqlalchemy import func, select
+from database import get_session, close_session
+from models import User, ServiceRequest
+import migrate_to_sql
+
+USERS = 25
+REQUESTS = 47
+BATCH_SIZE = 10
+
+class Killed(BaseException):
+    """Имитация остановки процесса (не перехватывается except Exception)"""
+
+@pytest.fixture
+def json_files(tmp_path):
+    users = [
+        {"telegram_id": telegram_id, "first_name": f"Пользователь {telegram_id}", "phone": "1",
+         "created_at": "2024-01-01T00:00:00"}
+        for telegram_id in range(USERS)
+    ]
+    requests = [
+        {"id": str(uuid.uuid4()), "user_id": index % USERS, "car_model": "Lada", "license_plate": "А123ВС",
+         "mileage": 1000, "requested_work": "ТО", "preferred_date": "01.01.2030", "preferred_time": "10:00",
+         "phone": "1", "status": "pending", "created_at": "2024-01-01T00:00:00"}
+        for index in range(REQUESTS)
+    ]
+    users_path, requests_path = str(tmp_path / "users.json"), str(tmp_path / "requests.json")
+    for path, records in ((users_path, users), (requests_path, requests)):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(records, f, ensure_ascii=False)
+    return users_path, requests_path, requests
+
+def kill_after_batches(monkeypatch, name, batches):
+    """Остановка миграции при вставке пакета номер batches + 1"""
+    insert_batch = getattr(migrate_to_sql, name)
+    calls = []
+    
+    def failing_insert(session, rows):
+        if len(calls) == batches:
+            raise Killed()
+        calls.append(len(rows))
+        insert_batch(session, rows)
+    
+    monkeypatch.setattr(migrate_to_sql, name, failing_insert)
+
+def count_read_records(monkeypatch):
+    """Счетчик записей, прочитанных из JSON-файлов"""
+    read = []
+    iter_json_array = migrate_to_sql.iter_json_array
+    
+    def counting_iter(path, offset=0):
+        for item in iter_json_array(path, offset=offset):
+            read.append(item)
+            yield item
+    
+    monkeypatch.setattr(migrate_to_sql, "iter_json_array", counting_iter)
+    return read
+
+def count_rows(column):
+    session = get_session()
+    try:
+        return session.scalar(select(func.count(column))), session.scalar(select(func.count(column.distinct())))
+    finally:
+        close_session(session)
+
+def test_bulk_migration_resumes_after_kill(store, json_files, monkeypatch):
+    users_path, requests_path, requests = json_files
+    
+    with monkeypatch.context() as patch:
+        kill_after_batches(patch, "_insert_users_batch", 2)
+        with pytest.raises(Killed):
+            migrate_to_sql.migrate_users_bulk(users_path, batch_size=BATCH_SIZE)
+    assert os.path.exists(f"{users_path}.checkpoint")
+    assert count_rows(User.telegram_id) == (2 * BATCH_SIZE, 2 * BATCH_SIZE)
+    
+    read = count_read_records(monkeypatch)
+    assert migrate_to_sql.migrate_users_bulk(users_path, batch_size=BATCH_SIZE) == USERS - 2 * BATCH_SIZE
+    # Продолжение читает файл с контрольной точки, а не с начала
+    assert len(read) == USERS - 2 * BATCH_SIZE
+    assert count_rows(User.telegram_id) == (USERS, USERS)
+    assert not os.path.exists(f"{users_path}.checkpoint")
+    
+    with monkeypatch.context() as patch:
+        kill_after_batches(patch, "_insert_requests_batch", 3)
+        with pytest.raises(Killed):
+            migrate_to_sql.migrate_requests_bulk(requests_path, batch_size=BATCH_SIZE)
+    assert os.path.exists(f"{requests_path}.checkpoint")
+    
+    del read[:]
+    assert migrate_to_sql.migrate_requests_bulk(requests_path, batch_size=BATCH_SIZE) == REQUESTS - 3 * BATCH_SIZE
+    assert len(read) == REQUESTS - 3 * BATCH_SIZE
+    assert count_rows(ServiceRequest.legacy_id) == (REQUESTS, REQUESTS)
+    assert not os.path.exists(f"{requests_path}.checkpoint")
+    
+    session = get_session()
+    try:
+        migrated = set(session.scalars(select(ServiceRequest.legacy_id)))
+    finally:
+        close_session(session)
+    assert migrated == {request['id'] for request in requests}
+
+def test_checkpoint_of_changed_file_is_ignored(store, json_files, monkeypatch):
+    users_path, requests_path, requests = json_files
+    
+    with monkeypatch.context() as patch:
+        kill_after_batches(patch, "_insert_users_batch", 1)
+        with pytest.raises(Killed):
+            migrate_to_sql.migrate_users_bulk(users_path, batch_size=BATCH_SIZE)
+    
+    # Файл заменен другим: смещение из контрольной точки к нему не относится
+    with open(users_path, 'w', encoding='utf-8') as f:
+        json.dump([{"telegram_id": 100 + index, "first_name": "Новый"} for index in range(USERS)], f)
+    
+    read = count_read_records(monkeypatch)
+    assert migrate_to_sql.migrate_users_bulk(users_path, batch_size=BATCH_SIZE) == USERS
+    assert len(read) == USERS
+    assert count_rows(User.telegram_id) == (USERS + BATCH_SIZE, USERS + BATCH_SIZE)
+    assert not os.path.exists(f"{users_path}.checkpoint")
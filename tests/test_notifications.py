@@ -0,0 +1,43 @@
+"""
+Тесты очереди исходящих уведомлений
+"""
+import time
+from unittest import mock
+from telegram.error import NetworkError
+from notifications import NotificationDispatcher, RETRY_AFTER_STOP_ERROR
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+def test_pending_retry_fails_on_stop():
+    bot = mock.Mock()
+    bot.send_message.side_effect = NetworkError("connection reset")
+    failures = []
+    notifier = NotificationDispatcher(workers=1, base_backoff=0.3)
+    notifier.send_message(bot, 1, "Заявка одобрена", on_failure=failures.append)
+    wait_for(lambda: notifier.stats()['retried'] == 1)
+
+    notifier.stop()
+    assert [str(error) for error in failures] == [RETRY_AFTER_STOP_ERROR]
+
+    # Отмененный таймер не возвращает сообщение в очередь
+    time.sleep(0.5)
+    assert bot.send_message.call_count == 1
+    assert len(failures) == 1
+    stats = notifier.stats()
+    assert (stats['failed'], stats['queued']) == (1, 0)
+
+def test_retry_is_sent_while_running():
+    bot = mock.Mock()
+    bot.send_message.side_effect = [NetworkError("connection reset"), None]
+    failures = []
+    notifier = NotificationDispatcher(workers=1, base_backoff=0.05)
+    notifier.send_message(bot, 1, "Заявка одобрена", on_failure=failures.append)
+    wait_for(lambda: notifier.stats()['sent'] == 1)
+    notifier.stop()
+
+    assert bot.send_message.call_count == 2
+    assert failures == []
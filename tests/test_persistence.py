@@ -0,0 +1,103 @@
+"""
+Тесты сохранения состояния диалогов между перезапусками
+"""
+from queue import Queue
+import pytest
+from telegram import Bot, Update
+from telegram.ext import CommandHandler, ConversationHandler, Dispatcher, Filters, MessageHandler
+from telegram.ext.utils.promise import Promise
+from persistence import create_persistence
+from webhook_replay import OfflineRequest
+
+CAR_MODEL, LICENSE_PLATE, MILEAGE = range(3)
+USER = {"id": 1, "is_bot": False, "first_name": "Иван"}
+
+def remember_model(update, context):
+    context.user_data['car_model'] = update.message.text
+    return LICENSE_PLATE
+
+def remember_plate(update, context):
+    context.user_data['license_plate'] = update.message.text
+    return MILEAGE
+
+def start_bot(filename):
+    """Диспетчер с диалогом анкеты, как после запуска бота"""
+    persistence = create_persistence(filename)
+    dispatcher = Dispatcher(Bot("123456:test", request=OfflineRequest()), Queue(), persistence=persistence)
+    conversation = ConversationHandler(
+        entry_points=[CommandHandler("start", lambda update, context: CAR_MODEL)],
+        states={
+            CAR_MODEL: [MessageHandler(Filters.text, remember_model)],
+            LICENSE_PLATE: [MessageHandler(Filters.text, remember_plate)],
+            MILEAGE: [MessageHandler(Filters.text, lambda update, context: ConversationHandler.END)],
+        },
+        fallbacks=[],
+        per_chat=False,
+        name="form",
+        persistent=True,
+    )
+    dispatcher.add_handler(conversation)
+    return dispatcher, conversation, persistence
+
+def send(dispatcher, update_id, text):
+    message = {
+        "message_id": update_id, "date": 0, "chat": {"id": USER["id"], "type": "private"},
+        "from": USER, "text": text,
+    }
+    if text.startswith("/"):
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text)}]
+    dispatcher.process_update(Update.de_json({"update_id": update_id, "message": message}, dispatcher.bot))
+
+@pytest.fixture
+def state_file(tmp_path):
+    return str(tmp_path / "bot_state.pickle")
+
+def test_conversation_resumes_after_restart(state_file):
+    dispatcher, conversation, persistence = start_bot(state_file)
+    send(dispatcher, 1, "/start")
+    send(dispatcher, 2, "Lada Vesta")
+    persistence.flush()
+    assert persistence.write_count == 1
+    
+    dispatcher, conversation, persistence = start_bot(state_file)
+    assert conversation.conversations == {(USER["id"],): LICENSE_PLATE}
+    assert dispatcher.user_data[USER["id"]] == {'car_model': "Lada Vesta"}
+    
+    send(dispatcher, 3, "А123ВС")
+    assert conversation.conversations == {(USER["id"],): MILEAGE}
+    assert dispatcher.user_data[USER["id"]]['license_plate'] == "А123ВС"
+
+def test_unchanged_state_is_not_rewritten(state_file):
+    dispatcher, conversation, persistence = start_bot(state_file)
+    send(dispatcher, 1, "/start")
+    persistence.flush()
+    persistence.flush()
+    assert persistence.flush_count == 2
+    assert persistence.write_count == 1
+
+def test_pending_async_step_is_saved(state_file):
+    dispatcher, conversation, persistence = start_bot(state_file)
+    send(dispatcher, 1, "/start")
+    send(dispatcher, 2, "Lada Vesta")
+    key = (USER["id"],)
+    
+    # Асинхронный обработчик (run_async) еще выполняется: сохраняется предыдущее состояние
+    promise = Promise(lambda: MILEAGE, [], {})
+    conversation._update_state(promise, key)
+    persistence.flush()
+    assert persistence.write_count == 1
+    assert start_bot(state_file)[1].conversations == {key: LICENSE_PLATE}
+    
+    # Обработчик завершился: сохраняется его результат
+    promise.run()
+    persistence.flush()
+    assert persistence.write_count == 2
+    assert start_bot(state_file)[1].conversations == {key: MILEAGE}
+
+def test_finished_conversation_is_not_saved(state_file):
+    dispatcher, conversation, persistence = start_bot(state_file)
+    for update_id, text in enumerate(("/start", "Lada Vesta", "А123ВС", "10000"), 1):
+        send(dispatcher, update_id, text)
+    persistence.flush()
+    
+    assert start_bot(state_file)[1].conversations == {}
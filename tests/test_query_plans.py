@@ -0,0 +1,64 @@
+"""
+Проверка планов запросов DataStore к service_requests (EXPLAIN QUERY PLAN)
+
+Запросы перехватываются в том виде, в котором их выполняет DataStore, и
+для каждого проверяется, что SQLite ищет заявки по нужному индексу, а не
+просматривает всю таблицу.
+"""
+import datetime
+import pytest
+from sqlalchemy import event
+from database import engine
+from models import User, ServiceRequest, RequestStatus
+
+@pytest.fixture
+def captured_queries(store):
+    """SELECT-запросы к service_requests, выполненные внутри теста, с параметрами"""
+    queries = []
+    
+    def capture(connection, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT") and "service_requests" in statement:
+            queries.append((statement, parameters))
+    
+    store.add_user(User(telegram_id=1, first_name="Иван"))
+    for day in range(1, 4):
+        request = ServiceRequest(1, "Lada Vesta", "А123ВС", 10000, "ТО", f"{day:02d}.02.2030", None, "+79990000000")
+        store.add_request(request)
+    
+    event.listen(engine, "before_cursor_execute", capture)
+    yield queries
+    event.remove(engine, "before_cursor_execute", capture)
+
+def query_plan(statement, parameters):
+    """Строки плана (столбец detail) для запроса"""
+    with engine.connect() as connection:
+        rows = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).fetchall()
+    return [row[-1] for row in rows]
+
+def assert_uses_index(queries, index_name):
+    assert queries, "запрос к service_requests не выполнен"
+    for statement, parameters in queries:
+        plan = query_plan(statement, parameters)
+        requests_steps = [step for step in plan if "service_requests" in step]
+        assert any(index_name in step for step in requests_steps), plan
+        assert not any(step.startswith("SCAN service_requests") for step in requests_steps), plan
+
+def test_status_list_uses_status_index(store, captured_queries):
+    store.get_requests_page(status=RequestStatus.PENDING.value, exclude_work="Узнать пробег предыдущего техобслуживания")
+    assert_uses_index(captured_queries, "ix_service_requests_status_created_at")
+
+def test_work_list_uses_work_index(store, captured_queries):
+    store.get_requests_page(status=RequestStatus.PENDING.value, requested_work="Узнать пробег предыдущего техобслуживания")
+    assert_uses_index(captured_queries, "ix_service_requests_work_status_created_at")
+
+def test_user_requests_use_user_index(store, captured_queries):
+    store.get_user_requests(1)
+    assert_uses_index(captured_queries, "ix_service_requests_user_id_created_at")
+
+def test_code_lookup_uses_code_index(store, captured_queries):
+    store.get_request("abcdef12")
+    assert_uses_index(captured_queries, "ix_service_requests_code")
+
+def test_visit_date_range_uses_visit_date_index(store, captured_queries):
+    store.get_requests_between(datetime.date(2030, 2, 1), datetime.date(2030, 2, 7))
+    assert_uses_index(captured_queries, "ix_service_requests_status_visit_date")
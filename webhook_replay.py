@@ -0,0 +1,384 @@
+"""
+Стенд для замера задержки обработки обновлений в режиме webhook
+
+Отправляет записанные обновления Telegram (JSON) POST-запросами на адрес
+webhook и измеряет задержку. Работает в двух режимах:
+
+* локальный (по умолчанию) - в этом же процессе запускается бот со
+  встроенным webhook-сервером на 127.0.0.1, а обращения к Bot API
+  обрабатываются на месте без сети. Измеряется полное время от отправки
+  POST-запроса до завершения всех обработчиков обновления.
+  Бот работает с базой из DATABASE_URL, поэтому укажите отдельную тестовую базу.
+* удаленный (--url) - обновления отправляются на уже запущенный бот.
+  Встроенный сервер отвечает сразу после постановки обновления в очередь,
+  поэтому измеряется только время приема обновления.
+
+Обновления группируются по пользователям: обновления одного пользователя
+отправляются строго по очереди (следующее - после обработки предыдущего), а
+--concurrency пользователей работают одновременно. Это позволяет проверить,
+как пропускная способность растет с количеством потоков диспетчера (--workers).
+
+Пример:
+    DATABASE_URL=sqlite:///replay.db python webhook_replay.py --generate 500
+    DATABASE_URL=sqlite:///replay.db python webhook_replay.py --generate 50 --scenario admin \\
+        --concurrency 20 --workers 8 --api-latency 50
+    python webhook_replay.py --updates updates.json --url https://bot.example.com/<путь>
+"""
+import argparse
+import json
+import queue
+import logging
+import threading
+import time
+import urllib.request
+from telegram import Bot, Update
+from telegram.ext import TypeHandler
+from telegram.utils.request import Request
+from json_stream import iter_json_array
+
+# Настройка логгирования
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+REPLAY_TOKEN = "123456:replay"
+
+class OfflineRequest(Request):
+    """
+    Обработка обращений к Bot API без сети
+
+    Вместо отправки запроса возвращает правдоподобный ответ Telegram и
+    считает количество вызовов каждого метода.
+    """
+    __slots__ = ('_lock', '_message_id', 'calls', 'latency')
+
+    def __init__(self, *args, latency=0.0, **kwargs):
+        """
+        Args:
+            latency: имитация времени ответа Telegram на каждый запрос, в секундах
+        """
+        super().__init__(*args, **kwargs)
+        self.latency = latency
+        self._lock = threading.Lock()
+        self._message_id = 0
+        self.calls = {}
+
+    def post(self, url, data, timeout=None):
+        method = url.rsplit("/", 1)[-1]
+        with self._lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+            self._message_id += 1
+            message_id = self._message_id
+        if self.latency:
+            time.sleep(self.latency)
+
+        if method == "getMe":
+            return {"id": 123456, "is_bot": True, "first_name": "Replay", "username": "replay_bot"}
+        if method.startswith("send") or method.startswith("edit"):
+            data = data or {}
+            return {
+                "message_id": data.get("message_id", message_id),
+                "date": int(time.time()),
+                "chat": {"id": data.get("chat_id", 0), "type": "private"},
+                "text": data.get("text", ""),
+            }
+        return True
+
+    def stop(self):
+        pass
+
+def load_updates(path):
+    """
+    Чтение записанных обновлений из файла с JSON-массивом
+
+    Args:
+        path: путь к файлу
+
+    Yields:
+        dict: обновление в формате Bot API
+    """
+    for update, _ in iter_json_array(path):
+        yield update
+
+def _callback_update(update_id, user, data, message_id):
+    """Нажатие inline-кнопки с callback_data data"""
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": f"{user['id']}-{message_id}",
+            "from": user,
+            "chat_instance": str(user["id"]),
+            "data": data,
+            "message": {
+                "message_id": message_id,
+                "date": int(time.time()),
+                "chat": {"id": user["id"], "type": "private", "first_name": user["first_name"]},
+                "text": "replay",
+            },
+        },
+    }
+
+def generate_updates(count, scenario="start", repeat=5):
+    """
+    Генерация обновлений от count разных пользователей
+
+    Args:
+        count: количество пользователей
+        scenario: "start" - каждый пользователь отправляет /start;
+                  "admin" - администратор открывает меню и repeat раз
+                  запрашивает список новых заявок
+        repeat: количество запросов списка в сценарии "admin"
+
+    Yields:
+        dict: обновление в формате Bot API
+    """
+    now = int(time.time())
+    update_id = 0
+    for i in range(count):
+        user = {"id": 1000000 + i, "is_bot": False, "first_name": f"Replay{i}"}
+        update_id += 1
+        if scenario == "admin":
+            yield _callback_update(update_id, user, "admin_menu", 1)
+            for j in range(repeat):
+                update_id += 1
+                yield _callback_update(update_id, user, "admin_requests_pending", j + 2)
+            continue
+        yield {
+            "update_id": update_id,
+            "message": {
+                "message_id": i + 1,
+                "date": now,
+                "chat": {"id": user["id"], "type": "private", "first_name": user["first_name"]},
+                "from": user,
+                "text": "/start",
+                "entities": [{"type": "bot_command", "offset": 0, "length": 6}],
+            },
+        }
+
+def group_by_user(updates):
+    """
+    Группировка обновлений по отправителю с сохранением порядка
+
+    Returns:
+        list: списки обновлений, по одному на пользователя
+    """
+    by_user = {}
+    for update in updates:
+        payload = next((v for k, v in update.items() if k != "update_id"), {})
+        sender = payload.get("from", {}).get("id") if isinstance(payload, dict) else None
+        by_user.setdefault(sender, []).append(update)
+    return list(by_user.values())
+
+def post_update(url, update, timeout=10.0):
+    """
+    Отправка одного обновления на адрес webhook
+
+    Returns:
+        float: время ответа сервера в секундах
+    """
+    body = json.dumps(update).encode("utf-8")
+    request = urllib.request.Request(
+        url, data=body, headers={"Content-Type": "application/json"}, method="POST"
+    )
+    started = time.perf_counter()
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        response.read()
+    return time.perf_counter() - started
+
+def percentile(values, fraction):
+    """Значение перцентиля по отсортированному списку"""
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, int(round(fraction * (len(values) - 1))))
+    return values[index]
+
+def format_latencies(title, values):
+    """Строка отчета о задержках в миллисекундах"""
+    values = sorted(v * 1000 for v in values)
+    if not values:
+        return f"{title}: нет данных"
+    return (
+        f"{title}: n={len(values)}, среднее {sum(values) / len(values):.2f} мс, "
+        f"p50 {percentile(values, 0.5):.2f} мс, p95 {percentile(values, 0.95):.2f} мс, "
+        f"p99 {percentile(values, 0.99):.2f} мс, макс. {values[-1]:.2f} мс"
+    )
+
+def run_users(user_updates, concurrency, send):
+    """
+    Воспроизведение обновлений пользователей в concurrency потоков
+
+    Args:
+        user_updates: списки обновлений, по одному на пользователя
+        concurrency: количество одновременно работающих пользователей
+        send: функция отправки одного обновления, возвращает (прием, полная обработка)
+              в секундах; полная обработка может быть None
+
+    Returns:
+        tuple: (задержки приема, задержки полной обработки, общее время в секундах)
+    """
+    pending = queue.Queue()
+    for updates in user_updates:
+        pending.put(updates)
+
+    ack = []
+    end_to_end = []
+    results_lock = threading.Lock()
+
+    def simulated_user():
+        while True:
+            try:
+                updates = pending.get_nowait()
+            except queue.Empty:
+                return
+            for update in updates:
+                ack_time, total_time = send(update)
+                with results_lock:
+                    ack.append(ack_time)
+                    if total_time is not None:
+                        end_to_end.append(total_time)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=simulated_user) for _ in range(max(1, concurrency))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return ack, end_to_end, time.perf_counter() - started
+
+def print_report(ack, end_to_end, elapsed):
+    """Вывод итогов воспроизведения"""
+    print(format_latencies("Прием обновления", ack))
+    if end_to_end:
+        print(format_latencies("Полная обработка", end_to_end))
+    print(f"Обновлений: {len(ack)} за {elapsed:.2f} с ({len(ack) / elapsed if elapsed else 0:.1f} в секунду)")
+
+def replay_remote(url, updates, concurrency):
+    """
+    Отправка обновлений на запущенный бот с замером времени приема
+    """
+    ack, _, elapsed = run_users(
+        group_by_user(updates), concurrency, lambda update: (post_update(url, update), None)
+    )
+    print_report(ack, [], elapsed)
+
+def replay_local(updates, port, timeout, concurrency=1, workers=None, api_latency=0.0):
+    """
+    Отправка обновлений на локальный бот с замером полного времени обработки
+    """
+    from bott import setup_bot, get_webhook_path
+    from config import ADMIN_IDS
+    from database import init_db
+    from rate_limit import flood_protection
+    from telegram.ext import ConversationHandler
+    from telegram.ext.utils.promise import Promise
+
+    init_db()
+    user_updates = group_by_user(updates)
+    update_id = 0
+    for updates_of_user in user_updates:
+        for update in updates_of_user:
+            # Идентификаторы переписываются, чтобы сопоставлять обновления с завершением обработки
+            update_id += 1
+            update["update_id"] = update_id
+            # Пользователи стенда получают права администратора для сценариев с админ-меню
+            sender = update.get("callback_query", update.get("message", {})).get("from", {}).get("id")
+            if sender and sender not in ADMIN_IDS:
+                ADMIN_IDS.append(sender)
+    # Администраторы не ограничиваются защитой от флуда, как и в рабочем боте
+    flood_protection.exempt_ids = frozenset(ADMIN_IDS)
+
+    request = OfflineRequest(con_pool_size=(workers or 4) + 8, latency=api_latency)
+    bot = Bot(REPLAY_TOKEN, request=request)
+    updater = setup_bot(bot=bot, workers=workers, persistence_file="")
+    conversation = next(
+        handler for handler in updater.dispatcher.handlers[0] if isinstance(handler, ConversationHandler)
+    )
+
+    finished = {}
+    finished_lock = threading.Condition()
+
+    def track_finished(update, context):
+        with finished_lock:
+            finished[update.update_id] = time.perf_counter()
+            finished_lock.notify_all()
+
+    # Группа с большим номером выполняется после всех обработчиков бота
+    updater.dispatcher.add_handler(TypeHandler(Update, track_finished), group=1000)
+
+    url_path = get_webhook_path()
+    url = f"http://127.0.0.1:{port}/{url_path}"
+    updater.start_webhook(listen="127.0.0.1", port=port, url_path=url_path, webhook_url=url)
+
+    lost = []
+
+    def send(update):
+        started = time.perf_counter()
+        ack_time = post_update(url, update)
+        update_id = update["update_id"]
+        with finished_lock:
+            if not finished_lock.wait_for(lambda: update_id in finished, timeout):
+                lost.append(update_id)
+                return ack_time, None
+            finished.pop(update_id)
+        # Обработчик с run_async оставляет состояние разговора в ожидании до своего завершения
+        state = conversation.conversations.get(conversation._get_key(Update.de_json(update, bot)))
+        if isinstance(state, tuple) and len(state) == 2 and isinstance(state[1], Promise):
+            if not state[1].done.wait(timeout):
+                lost.append(update_id)
+                return ack_time, None
+        return ack_time, time.perf_counter() - started
+
+    try:
+        ack, end_to_end, elapsed = run_users(user_updates, concurrency, send)
+    finally:
+        updater.stop()
+
+    print(f"Потоков диспетчера: {updater.dispatcher.workers}, одновременных пользователей: {concurrency}")
+    print_report(ack, end_to_end, elapsed)
+    if lost:
+        print(f"Не дождались обработки: {len(lost)}")
+    print("Вызовы Bot API: " + ", ".join(f"{m}={c}" for m, c in sorted(request.calls.items())))
+
+def parse_args(argv=None):
+    """
+    Разбор аргументов командной строки
+    """
+    parser = argparse.ArgumentParser(description="Замер задержки обработки обновлений в режиме webhook")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--updates", help="файл с JSON-массивом записанных обновлений")
+    source.add_argument("--generate", type=int, help="сгенерировать указанное количество команд /start")
+    parser.add_argument("--url", help="адрес webhook запущенного бота (без него бот запускается локально)")
+    parser.add_argument(
+        "--scenario", choices=("start", "admin"), default="start",
+        help="сценарий для --generate: команда /start или просмотр списков заявок администратором"
+    )
+    parser.add_argument("--concurrency", type=int, default=1, help="количество одновременных пользователей (по умолчанию 1)")
+    parser.add_argument("--workers", type=int, help="количество потоков диспетчера локального бота (по умолчанию BOT_WORKERS)")
+    parser.add_argument(
+        "--api-latency", type=float, default=0.0,
+        help="имитация времени ответа Bot API локальному боту, в миллисекундах (по умолчанию 0)"
+    )
+    parser.add_argument("--port", type=int, default=8765, help="порт локального webhook-сервера (по умолчанию 8765)")
+    parser.add_argument(
+        "--timeout", type=float, default=10.0,
+        help="сколько секунд ждать обработки одного обновления (по умолчанию 10)"
+    )
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.updates:
+        updates = load_updates(args.updates)
+    else:
+        updates = generate_updates(args.generate, scenario=args.scenario)
+    if args.url:
+        replay_remote(args.url, updates, args.concurrency)
+    else:
+        replay_local(
+            updates, args.port, args.timeout,
+            concurrency=args.concurrency,
+            workers=args.workers,
+            api_latency=args.api_latency / 1000
+        )